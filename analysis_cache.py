@@ -0,0 +1,190 @@
+"""Persistent cache of Gemini email analyses.
+
+Entries are keyed by (model name, prompt version, hash of the normalized
+email body). The prompt version is derived from the prompt template text, so
+editing the prompt invalidates old results automatically. Lookups go through
+an in-process LRU first and then the ``analysis_cache`` SQLite table. Entries
+expire after ANALYSIS_CACHE_TTL_SEC, and the table is trimmed to
+ANALYSIS_CACHE_MAX_ENTRIES least-recently-used rows.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from config import (
+    ANALYSIS_CACHE_MAX_ENTRIES,
+    ANALYSIS_CACHE_MEMORY_ENTRIES,
+    ANALYSIS_CACHE_TTL_SEC,
+)
+from models import AnalysisCacheEntry, Session
+
+logger = logging.getLogger(__name__)
+
+# Trim the SQLite table once every this many stores
+_EVICT_EVERY = 100
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def normalize_body(body: str) -> str:
+    """Collapse whitespace so trivially different copies share a cache entry."""
+    return " ".join(body.split())
+
+
+def prompt_version(prompt: str) -> str:
+    """Short hash identifying a prompt template."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(model_name: str, prompt: str, body: str) -> Tuple[str, str]:
+    """Return (key, prompt_version) for an analysis request."""
+    version = prompt_version(prompt)
+    body_hash = hashlib.sha256(normalize_body(body).encode("utf-8")).hexdigest()
+    key = hashlib.sha256(f"{model_name}|{version}|{body_hash}".encode("utf-8")).hexdigest()
+    return key, version
+
+
+class AnalysisCache:
+    """Two-level (memory LRU + SQLite) cache with TTL, size limits and counters."""
+
+    def __init__(
+        self,
+        memory_entries: int = ANALYSIS_CACHE_MEMORY_ENTRIES,
+        ttl_sec: int = ANALYSIS_CACHE_TTL_SEC,
+        max_entries: int = ANALYSIS_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.memory_entries = memory_entries
+        self.ttl = timedelta(seconds=ttl_sec)
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[datetime, Dict[str, Any]]]" = OrderedDict()
+        self._stores_since_evict = 0
+        self.counters = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0, "evicted": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    def _remember(self, key: str, created_at: datetime, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memory[key] = (created_at, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, model_name: str, prompt: str, body: str) -> Optional[Dict[str, Any]]:
+        """Return the cached analysis for this request, or None."""
+        key, _ = cache_key(model_name, prompt, body)
+        now = _utcnow()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+
+        db = Session()
+        try:
+            row = db.get(AnalysisCacheEntry, key)
+            if row is not None and now - row.created_at < self.ttl:
+                row.last_access = now
+                db.commit()
+                result = row.result_json
+                self._remember(key, row.created_at, result)
+                self._count("db_hits")
+                return result
+        except Exception as exc:
+            logger.warning("Analysis cache lookup failed: %s", exc)
+        finally:
+            db.close()
+
+        self._count("misses")
+        return None
+
+    def put(self, model_name: str, prompt: str, body: str, result: Dict[str, Any]) -> None:
+        """Store a successful analysis."""
+        key, version = cache_key(model_name, prompt, body)
+        now = _utcnow()
+        self._remember(key, now, result)
+
+        db = Session()
+        try:
+            stmt = insert(AnalysisCacheEntry).values(
+                key=key, model=model_name, prompt_version=version,
+                result_json=result, created_at=now, last_access=now,
+            )
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["key"],
+                set_={"result_json": result, "created_at": now, "last_access": now},
+            ))
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.warning("Analysis cache store failed: %s", exc)
+            return
+        finally:
+            db.close()
+
+        self._count("stores")
+        with self._lock:
+            self._stores_since_evict += 1
+            due = self._stores_since_evict >= _EVICT_EVERY
+            if due:
+                self._stores_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Delete expired rows and trim the table to ``max_entries``."""
+        deleted = 0
+        db = Session()
+        try:
+            cutoff = _utcnow() - self.ttl
+            result = db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.created_at < cutoff))
+            deleted += result.rowcount or 0
+
+            if self.max_entries > 0:
+                keep = (
+                    select(AnalysisCacheEntry.key)
+                    .order_by(AnalysisCacheEntry.last_access.desc())
+                    .limit(self.max_entries)
+                )
+                result = db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.key.not_in(keep)))
+                deleted += result.rowcount or 0
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.warning("Analysis cache eviction failed: %s", exc)
+        finally:
+            db.close()
+
+        if deleted:
+            self._count("evicted", deleted)
+            logger.debug("Evicted %d analysis cache entr(ies)", deleted)
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters plus the current in-memory size and hit rate."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["memory_size"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+# Process-wide cache used by email_parser
+cache = AnalysisCache()
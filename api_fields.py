@@ -0,0 +1,36 @@
+"""Partial-response field masks for every Google API call site.
+
+Each mask lists only the fields the calling code reads, so responses (and
+their JSON parsing) shrink. Pass them as ``**fields(MASK)``; with
+GOOGLE_API_FIELD_MASKS off, fields() returns nothing and full resources are
+requested.
+
+Gmail ``format="full"`` messages cannot be narrowed by header name (only
+``format="metadata"`` honours metadataHeaders), so GMAIL_MESSAGE_FULL keeps
+the whole payload and drops the top-level extras (snippet, labels, raw...).
+"""
+
+from typing import Dict
+
+from config import GOOGLE_API_FIELD_MASKS
+
+# --- Gmail ---
+GMAIL_MESSAGE_LIST = "messages/id,nextPageToken"
+GMAIL_HISTORY_LIST = "history/messagesAdded/message/id,historyId,nextPageToken"
+GMAIL_PROFILE = "historyId"
+GMAIL_MESSAGE_METADATA = "id,sizeEstimate,payload/headers"
+GMAIL_MESSAGE_FULL = "id,payload"
+GMAIL_ATTACHMENT = "data"
+
+# --- Calendar ---
+# Mirrored events: what calendar_mirror stores and daily_plan/agenda render
+CALENDAR_EVENT_LIST = "items(id,status,summary,start,end,location,htmlLink),nextPageToken,nextSyncToken"
+CALENDAR_EVENT_INSERT = "id,summary,start,end,htmlLink"
+
+# --- OAuth2 ---
+OAUTH2_USERINFO = "id,email"
+
+
+def fields(mask: str) -> Dict[str, str]:
+    """Keyword arguments applying ``mask`` to a request, if masks are enabled."""
+    return {"fields": mask} if GOOGLE_API_FIELD_MASKS else {}
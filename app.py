@@ -5,7 +5,7 @@ from pydantic import BaseModel
 import logging
 
 from auth import authenticate
-from calendar_manager import create_event
+from calendar_manager import EventBatch, create_event
 from daily_plan import get_today_schedule
 from gmail_reader import fetch_emails
 from notifier import send_whatsapp
@@ -69,17 +69,17 @@ def run_assistant(request: RunAssistantRequest):
         gmail, calendar = authenticate()
         
         logger.info(f"Fetching emails with query: {request.gmail_query}")
-        new_emails = fetch_emails(gmail, query=request.gmail_query, max_results=request.max_results)
+        new_emails = fetch_emails(
+            gmail, query=request.gmail_query, max_results=request.max_results, attachments="none",
+        )
         
-        created_events = []
-        for email in new_emails:
-            subject = email.get("subject", "")
-            body = email.get("body", "")
-            try:
-                event = create_event(calendar, subject, body)
-                created_events.append(event)
-            except Exception as exc:
-                logger.error(f"Failed to create event: {exc}")
+        batch = EventBatch(calendar)
+        for idx, email in enumerate(new_emails):
+            batch.add_from_email(
+                idx, email.get("subject", ""), email.get("body", ""),
+                message_id=email.get("id"), date_header=email.get("date"),
+            )
+        created_events = [r["event"] for r in batch.submit().values() if r["event"] is not None]
         
         logger.info("Fetching today's schedule")
         schedule = get_today_schedule(calendar)
@@ -109,6 +109,8 @@ def fetch_emails_endpoint(request: FetchEmailsRequest):
         gmail, _ = authenticate()
         
         emails = fetch_emails(gmail, query=request.query, max_results=request.max_results)
+        for email in emails:
+            email["attachments"] = [att.to_dict() for att in email["attachments"]]
         
         return {
             "status": "success",
@@ -146,11 +148,12 @@ def create_event_endpoint(request: CreateEventRequest):
             raise HTTPException(status_code=400, detail="Subject is required")
         
         _, calendar = authenticate()
-        event = create_event(calendar, request.subject, request.description)
+        result = create_event(calendar, request.subject, request.description)
+        ok = result is not None and not result["error"]
         
         return {
-            "status": "success",
-            "event": event,
+            "status": "success" if ok else "failed",
+            "event": (result["event"] or {"id": result["id"]}) if ok else None,
         }
         
     except Exception as exc:
@@ -0,0 +1,215 @@
+"""Content-addressed attachment store shared across users and messages.
+
+Decoded attachment bytes are written once to ATTACHMENT_STORE_DIR under a key
+made of their size and SHA-256. Metadata, including any extracted text, lives
+in the ``attachment_blobs`` table. ``attachment_refs`` maps a user's
+(message_id, partId) to its blob, so a message that is read again is served
+from disk instead of Gmail. The same invite or agenda PDF sent to many users
+is stored and extracted only once.
+
+Blobs are evicted least-recently-used once their total size exceeds
+ATTACHMENT_STORE_MAX_MB.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from config import ATTACHMENT_STORE_DIR, ATTACHMENT_STORE_MAX_MB
+from models import AttachmentBlob, AttachmentRef, Session
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def blob_key(content: bytes) -> str:
+    """Return the content address ``"<size>-<sha256>"`` for ``content``."""
+    return f"{len(content)}-{hashlib.sha256(content).hexdigest()}"
+
+
+def _blob_path(key: str) -> str:
+    digest = key.rpartition("-")[2]
+    return os.path.join(ATTACHMENT_STORE_DIR, digest[:2], key)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def lookup_ref(user_id: str, message_id: str, part_id: str) -> Optional[str]:
+    """Return the blob key stored for a user's message part, if any."""
+    db = Session()
+    try:
+        return db.execute(
+            select(AttachmentRef.blob_key).where(
+                AttachmentRef.user_id == user_id,
+                AttachmentRef.message_id == message_id,
+                AttachmentRef.part_id == part_id,
+            )
+        ).scalar_one_or_none()
+    finally:
+        db.close()
+
+
+def add_ref(user_id: str, message_id: str, part_id: str, key: str) -> None:
+    """Record that a user's message part holds the blob ``key``."""
+    db = Session()
+    try:
+        stmt = insert(AttachmentRef).values(
+            user_id=user_id, message_id=message_id, part_id=part_id, blob_key=key,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "message_id", "part_id"],
+            set_={"blob_key": key},
+        ))
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not record attachment ref for message %s: %s", message_id, exc)
+    finally:
+        db.close()
+
+
+def get_blob(key: str) -> Optional[bytes]:
+    """Read a blob's bytes and mark it recently used. None if it is gone."""
+    db = Session()
+    try:
+        blob = db.get(AttachmentBlob, key)
+        if blob is None:
+            return None
+        try:
+            with open(blob.path, "rb") as fh:
+                content = fh.read()
+        except OSError:
+            # File vanished from disk; forget the row so it is re-downloaded
+            db.delete(blob)
+            db.commit()
+            return None
+        blob.last_access = _utcnow()
+        db.commit()
+        return content
+    finally:
+        db.close()
+
+
+def put_blob(content: bytes, mime_type: str | None = None) -> str:
+    """Store ``content`` unless an identical blob exists. Returns its key."""
+    key = blob_key(content)
+    path = _blob_path(key)
+    now = _utcnow()
+
+    db = Session()
+    try:
+        existing = db.get(AttachmentBlob, key)
+        if existing is not None and os.path.exists(existing.path):
+            existing.last_access = now
+            db.commit()
+            return key
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        stmt = insert(AttachmentBlob).values(
+            key=key, size=len(content), mime_type=mime_type, path=path,
+            extracted=False, created_at=now, last_access=now,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["key"], set_={"path": path, "last_access": now},
+        ))
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not store attachment blob %s: %s", key, exc)
+        return key
+    finally:
+        db.close()
+
+    evict()
+    return key
+
+
+def get_extracted_text(key: str) -> Tuple[bool, Optional[str]]:
+    """Return (found, text) for a blob's cached extraction result."""
+    db = Session()
+    try:
+        blob = db.get(AttachmentBlob, key)
+        if blob is None or not blob.extracted:
+            return False, None
+        return True, blob.extracted_text
+    finally:
+        db.close()
+
+
+def set_extracted_text(key: str, text: Optional[str]) -> None:
+    """Cache the extraction result for a blob."""
+    db = Session()
+    try:
+        blob = db.get(AttachmentBlob, key)
+        if blob is None:
+            return
+        blob.extracted = True
+        blob.extracted_text = text
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not cache extracted text for blob %s: %s", key, exc)
+    finally:
+        db.close()
+
+
+def evict(max_bytes: int | None = None) -> int:
+    """Delete least-recently-used blobs until the store fits in ``max_bytes``.
+
+    Defaults to ATTACHMENT_STORE_MAX_MB. Returns the number of blobs removed.
+    """
+    if max_bytes is None:
+        max_bytes = ATTACHMENT_STORE_MAX_MB * 1024 * 1024
+
+    removed = 0
+    db = Session()
+    try:
+        total = db.execute(select(func.coalesce(func.sum(AttachmentBlob.size), 0))).scalar_one()
+        if total <= max_bytes:
+            return 0
+
+        rows = db.execute(
+            select(AttachmentBlob.key, AttachmentBlob.size, AttachmentBlob.path)
+            .order_by(AttachmentBlob.last_access)
+        )
+        for key, size, path in rows.all():
+            if total <= max_bytes:
+                break
+            db.execute(delete(AttachmentRef).where(AttachmentRef.blob_key == key))
+            db.execute(delete(AttachmentBlob).where(AttachmentBlob.key == key))
+            _remove_file(path)
+            total -= size
+            removed += 1
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not evict attachment blobs: %s", exc)
+    finally:
+        db.close()
+
+    if removed:
+        logger.info("Evicted %d attachment blob(s) from the store", removed)
+    return removed
@@ -0,0 +1,233 @@
+"""Lazy Gmail attachment handles with a per-job memory ceiling.
+
+fetch_emails returns attachments as AttachmentHandle objects that carry only
+metadata. The bytes are loaded on first access to ``content`` (or
+``extracted_text``), from the shared attachment_store when the part was seen
+before, otherwise from Gmail. They are kept in memory only while the job's
+AttachmentBudget allows it. Past the ceiling they are re-read from the store,
+or, with the store disabled, spilled to a temporary file when
+ATTACHMENT_SPILL_TO_DISK is enabled and re-downloaded on each access if not.
+"""
+
+import base64
+import logging
+import os
+import tempfile
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import attachment_store
+from api_fields import GMAIL_ATTACHMENT, fields
+from config import (
+    ATTACHMENT_MEMORY_LIMIT_MB, ATTACHMENT_SPILL_DIR, ATTACHMENT_SPILL_TO_DISK,
+    ATTACHMENT_STORE_ENABLED,
+)
+from pdf_extract import extract_pdf_text
+
+logger = logging.getLogger(__name__)
+
+# Attachment modes accepted by gmail_reader.fetch_emails
+MODE_LAZY = "lazy"
+MODE_NONE = "none"
+ATTACHMENT_MODES = (MODE_LAZY, MODE_NONE)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class AttachmentBudget:
+    """Ceiling on attachment bytes held in memory by one fetch job.
+
+    Shared by every AttachmentHandle created during a single fetch_emails
+    call. A limit of 0 disables in-memory caching entirely.
+    """
+
+    def __init__(self, max_bytes: int | None = None) -> None:
+        if max_bytes is None:
+            max_bytes = ATTACHMENT_MEMORY_LIMIT_MB * 1024 * 1024
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, nbytes: int) -> bool:
+        """Claim ``nbytes`` of the budget. Returns False if it would overflow."""
+        with self._lock:
+            if self.used_bytes + nbytes > self.max_bytes:
+                return False
+            self.used_bytes += nbytes
+            return True
+
+    def release(self, nbytes: int) -> None:
+        """Return ``nbytes`` previously claimed with reserve()."""
+        with self._lock:
+            self.used_bytes = max(0, self.used_bytes - nbytes)
+
+
+class AttachmentHandle:
+    """Metadata for one Gmail attachment; downloads its bytes on first use.
+
+    Supports read-only dict-style access (``handle["filename"]``,
+    ``handle.get("extracted_text")``) so code written against the old
+    attachment dicts keeps working.
+    """
+
+    _KEYS = ("filename", "mime_type", "size", "content", "extracted_text")
+
+    def __init__(
+        self,
+        service: Any,
+        message_id: str,
+        attachment_id: str,
+        filename: str,
+        mime_type: str,
+        size: int,
+        budget: AttachmentBudget | None = None,
+        user_id: str | None = None,
+        part_id: str | None = None,
+    ) -> None:
+        self.message_id = message_id
+        self.attachment_id = attachment_id
+        self.filename = filename
+        self.mime_type = mime_type
+        self.size = size
+        self.user_id = user_id
+        self.part_id = part_id
+
+        self._service = service
+        self._budget = budget
+        self._lock = threading.Lock()
+        self._content: Optional[bytes] = None
+        self._spill_path: Optional[str] = None
+        self._blob_key: Optional[str] = None
+        self._extracted = False
+        self._extracted_text: Optional[str] = None
+
+    def __repr__(self) -> str:
+        return (
+            f"<AttachmentHandle filename={self.filename!r} mime_type={self.mime_type!r} "
+            f"size={self.size!r}>"
+        )
+
+    def _download(self) -> bytes:
+        att = (
+            self._service.users()
+            .messages()
+            .attachments()
+            .get(userId="me", messageId=self.message_id, id=self.attachment_id, **fields(GMAIL_ATTACHMENT))
+            .execute()
+        )
+        data = att.get("data")
+        return base64.urlsafe_b64decode(data) if data else b""
+
+    def _resolve_blob_key(self) -> Optional[str]:
+        """Find this part's blob in the attachment store without downloading."""
+        if self._blob_key is None and ATTACHMENT_STORE_ENABLED and self.user_id and self.part_id:
+            self._blob_key = attachment_store.lookup_ref(self.user_id, self.message_id, self.part_id)
+        return self._blob_key
+
+    def _load(self) -> bytes:
+        """Read the bytes from the attachment store, downloading on a miss."""
+        if self._resolve_blob_key() is not None:
+            content = attachment_store.get_blob(self._blob_key)
+            if content is not None:
+                return content
+            self._blob_key = None
+
+        content = self._download()
+        if ATTACHMENT_STORE_ENABLED:
+            self._blob_key = attachment_store.put_blob(content, self.mime_type)
+            if self.user_id and self.part_id:
+                attachment_store.add_ref(self.user_id, self.message_id, self.part_id, self._blob_key)
+        return content
+
+    def _spill(self, content: bytes) -> None:
+        fd, path = tempfile.mkstemp(prefix="pa-att-", dir=ATTACHMENT_SPILL_DIR or None)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(content)
+        self._spill_path = path
+        weakref.finalize(self, _remove_file, path)
+
+    @property
+    def content(self) -> bytes:
+        """Raw attachment bytes, loaded on first access."""
+        with self._lock:
+            if self._content is not None:
+                return self._content
+            if self._spill_path is not None:
+                with open(self._spill_path, "rb") as fh:
+                    return fh.read()
+
+            content = self._load()
+            if self._budget is None or self._budget.reserve(len(content)):
+                self._content = content
+            elif self._blob_key is not None:
+                pass  # over budget: the next access re-reads the store
+            elif ATTACHMENT_SPILL_TO_DISK:
+                try:
+                    self._spill(content)
+                except OSError as exc:
+                    logger.warning("Could not spill attachment '%s' to disk: %s", self.filename, exc)
+            return content
+
+    @property
+    def extracted_text(self) -> Optional[str]:
+        """Text extracted from PDF attachments (None for other types)."""
+        if not self._extracted:
+            text = None
+            if self.mime_type == "application/pdf":
+                try:
+                    text = self._extract_pdf()
+                except Exception as exc:
+                    logger.error(
+                        "Failed to download attachment '%s' for message %s: %s",
+                        self.filename, self.message_id, exc,
+                    )
+            self._extracted_text = text
+            self._extracted = True
+        return self._extracted_text
+
+    def _extract_pdf(self) -> Optional[str]:
+        """Extract PDF text, reusing the result cached with the stored blob."""
+        if self._resolve_blob_key() is not None:
+            found, text = attachment_store.get_extracted_text(self._blob_key)
+            if found:
+                return text
+
+        content = self.content
+        if self._blob_key is None:
+            return extract_pdf_text(content, self.filename)
+
+        text = extract_pdf_text(content, self.filename, use_cache=False)
+        if text is not None:
+            attachment_store.set_extracted_text(self._blob_key, text)
+        return text
+
+    def release(self) -> None:
+        """Drop cached bytes and any spill file; the next access re-downloads."""
+        with self._lock:
+            if self._content is not None and self._budget is not None:
+                self._budget.release(len(self._content))
+            self._content = None
+            if self._spill_path is not None:
+                _remove_file(self._spill_path)
+                self._spill_path = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Metadata-only dict, safe to serialise as JSON."""
+        return {"filename": self.filename, "mime_type": self.mime_type, "size": self.size}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
@@ -4,10 +4,10 @@ import pickle
 from typing import Tuple
 
 from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 
 from config import GOOGLE_CREDENTIALS_FILE, GOOGLE_TOKEN_FILE
+from google_clients import clients
+from http_transport import auth_request
 
 
 logger = logging.getLogger(__name__)
@@ -18,12 +18,8 @@ SCOPES = [
 ]
 
 
-def authenticate() -> Tuple[object, object]:
-    """Authenticate with Google and return Gmail and Calendar service clients.
-
-    Uses a cached token file when available, otherwise runs the OAuth flow
-    using the configured credentials file.
-    """
+def _load_credentials():
+    """Load, refresh or obtain installed-app credentials, persisting them to GOOGLE_TOKEN_FILE."""
 
     creds = None
 
@@ -41,7 +37,7 @@ def authenticate() -> Tuple[object, object]:
     if not creds or not getattr(creds, "valid", False):
         if creds and getattr(creds, "expired", False) and getattr(creds, "refresh_token", None):
             logger.info("Refreshing expired Google credentials")
-            creds.refresh(Request())
+            creds.refresh(auth_request())
         else:
             if not os.path.exists(GOOGLE_CREDENTIALS_FILE):
                 raise FileNotFoundError(
@@ -61,7 +57,16 @@ def authenticate() -> Tuple[object, object]:
         except Exception as exc:
             logger.warning("Failed to save credentials to %s: %s", GOOGLE_TOKEN_FILE, exc)
 
-    gmail_service = build("gmail", "v1", credentials=creds)
-    calendar_service = build("calendar", "v3", credentials=creds)
+    return creds
+
+
+def authenticate() -> Tuple[object, object]:
+    """Authenticate with Google and return Gmail and Calendar service clients.
+
+    Uses a cached token file when available, otherwise runs the OAuth flow
+    using the configured credentials file. The clients are cached in
+    google_clients.clients, so later calls in the same process skip both.
+    """
 
-    return gmail_service, calendar_service
\ No newline at end of file
+    _, gmail_service, calendar_service = clients.get(f"installed:{GOOGLE_TOKEN_FILE}", _load_credentials)
+    return gmail_service, calendar_service
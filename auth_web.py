@@ -5,9 +5,10 @@ from typing import Tuple
 
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 
+import token_manager
 from config import GOOGLE_CREDENTIALS_FILE
+from google_clients import cache_key, clients
 
 logger = logging.getLogger(__name__)
 
@@ -29,26 +30,41 @@ def create_auth_flow(redirect_uri: str) -> Flow:
     )
 
 
-def get_user_services(token_json: dict) -> Tuple[object, object]:
-    """Rebuild Gmail and Calendar service clients from a stored token dict.
+def _user_clients(token_json: dict, user_id: str | None) -> Tuple[Credentials, object, object]:
+    def make_credentials() -> Credentials:
+        # Refreshes, including those API clients do mid-call, are saved
+        # back for user_id
+        creds = token_manager.ManagedCredentials.for_user(token_json, SCOPES, user_id)
+
+        # Refresh token silently if expired
+        if creds.expired and creds.refresh_token:
+            token_manager.refresh(creds, user_id)
+        return creds
+
+    return clients.get(cache_key(token_json), make_credentials)
+
+
+def get_user_credentials(token_json: dict, user_id: str | None = None) -> Credentials:
+    """Return the (cached, shared) Credentials for a stored token dict."""
+    return _user_clients(token_json, user_id)[0]
+
+
+def get_user_services(token_json: dict, user_id: str | None = None) -> Tuple[object, object]:
+    """Return Gmail and Calendar service clients for a stored token dict.
+
+    Clients are cached per token in google_clients.clients, so repeated calls
+    for the same user reuse the credentials and services.
 
     Parameters
     ----------
     token_json:
         The dict previously saved as User.token_json in the database.
+    user_id:
+        The owning User.id; a refreshed token is written back to that row.
 
     Returns
     -------
     (gmail_service, calendar_service)
     """
-    creds = Credentials.from_authorized_user_info(token_json, SCOPES)
-
-    # Refresh token silently if expired
-    if creds.expired and creds.refresh_token:
-        from google.auth.transport.requests import Request
-        creds.refresh(Request())
-        logger.info("Refreshed OAuth token for stored credentials.")
-
-    gmail    = build("gmail",    "v1", credentials=creds)
-    calendar = build("calendar", "v3", credentials=creds)
+    _, gmail, calendar = _user_clients(token_json, user_id)
     return gmail, calendar
@@ -0,0 +1,96 @@
+"""Microbenchmark: date_extract.extract_event_time vs. full-body dateparser.parse.
+
+Usage: python bench_date_extract.py [--emails N] [--filler N]
+
+Builds synthetic meeting emails of varying length and reports per-email
+latency, how many emails each approach could date, and how many of those
+dates were the intended event start. Some emails mention numbers such as
+"3/4" or "12.5%" that must not be taken for dates.
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+import dateparser
+
+from date_extract import extract_event_time
+
+DATE_HEADER = "Tue, 14 May 2024 09:12:00 +0000"
+
+# (phrase, intended event start relative to DATE_HEADER)
+_PHRASES = [
+    ("Let's meet on May 21 at 3pm to go over the roadmap.", datetime(2024, 5, 21, 15, 0)),
+    ("The webinar starts tomorrow at 10:30 am.", datetime(2024, 5, 15, 10, 30)),
+    ("Can we do a call next Friday at 2pm?", datetime(2024, 5, 17, 14, 0)),
+    ("Interview scheduled for 2024-06-03 14:00.", datetime(2024, 6, 3, 14, 0)),
+    ("Reminder: dentist appointment on 28/05/2024 at 9:15.", datetime(2024, 5, 28, 9, 15)),
+    ("Quarterly review, Thursday, May 30th at noon.", datetime(2024, 5, 30, 12, 0)),
+    ("Room 3/4 is booked. Call at 3pm on Friday.", datetime(2024, 5, 17, 15, 0)),
+    ("Revenue grew 12.5% this quarter; let's meet Wednesday at 10am.", datetime(2024, 5, 15, 10, 0)),
+    ("Build 1.2 shipped. Retro next Monday 2pm.", datetime(2024, 5, 20, 14, 0)),
+]
+_FILLER = (
+    "Thanks for the update on the project. We reviewed the numbers with the team "
+    "and everyone agreed the plan looks reasonable. "
+)
+
+
+def _emails(count: int, filler: int) -> List[Tuple[str, datetime]]:
+    rng = random.Random(42)
+    emails = []
+    for i in range(count):
+        before = _FILLER * rng.randint(0, filler)
+        after = _FILLER * rng.randint(0, filler)
+        phrase, expected = _PHRASES[i % len(_PHRASES)]
+        emails.append((f"Hi all,\n\n{before}{phrase}\n\n{after}\nBest,\nSam", expected))
+    return emails
+
+
+def _baseline(body: str) -> Optional[datetime]:
+    return dateparser.parse(body, settings={"PREFER_DATES_FROM": "future"})
+
+
+def _engine(body: str) -> Optional[datetime]:
+    return extract_event_time(body, date_header=DATE_HEADER, tz_name="UTC")
+
+
+def _run(
+    fn: Callable[[str], Optional[datetime]], emails: List[Tuple[str, datetime]],
+) -> Tuple[List[float], int, int]:
+    timings = []
+    found = 0
+    correct = 0
+    for body, expected in emails:
+        start = time.perf_counter()
+        result = fn(body)
+        timings.append((time.perf_counter() - start) * 1000)
+        found += result is not None
+        correct += result is not None and result.replace(tzinfo=None) == expected
+    return timings, found, correct
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=60, help="number of synthetic emails")
+    parser.add_argument("--filler", type=int, default=8, help="max filler paragraphs around the date")
+    args = parser.parse_args()
+
+    emails = _emails(args.emails, args.filler)
+    avg_len = sum(len(body) for body, _ in emails) // len(emails)
+    print(f"{len(emails)} emails, average {avg_len} chars\n")
+    print(f"{'approach':<28}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'dated':>8}{'correct':>10}")
+    for name, fn in (("dateparser.parse(body)", _baseline), ("date_extract", _engine)):
+        timings, found, correct = _run(fn, emails)
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+        print(
+            f"{name:<28}{statistics.mean(timings):>10.2f}{statistics.median(timings):>10.2f}"
+            f"{p95:>10.2f}{found:>5}/{len(emails)}{correct:>7}/{len(emails)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,294 @@
 import logging
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, Dict, List, Optional
 
-import dateparser
+from googleapiclient.errors import HttpError
 
-from config import CALENDAR_ID, DEFAULT_EVENT_DURATION_MIN, TIMEZONE
+import calendar_mirror
+import event_index
+from api_fields import CALENDAR_EVENT_INSERT, fields
+from config import CALENDAR_BATCH_SIZE, CALENDAR_ID, DEFAULT_EVENT_DURATION_MIN, TIMEZONE
+from date_extract import extract_event_time
+from message_store import DEFAULT_USER_ID
 
 
 logger = logging.getLogger(__name__)
 
 
-def _normalize_event_time(parsed: datetime | None) -> datetime | None:
-    """Ensure parsed time is a timezone-naive datetime that can be passed to Google.
-
-    If parsing fails, returns None.
-    """
-
-    if parsed is None:
+def _parse_iso(value: str | datetime | None) -> datetime | None:
+    """Parse an ISO 8601 date-time (e.g. from compact Gemini output), or None."""
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        logger.warning("Ignoring invalid ISO date-time %r", value)
         return None
-    # dateparser already returns a datetime; additional normalization could be added here
-    return parsed
 
 
-def create_event(service: Any, subject: str, body: str) -> None:
-    """Create a calendar event inferred from an email's subject and body.
+def build_event(
+    subject: str,
+    body: str,
+    start: str | datetime | None = None,
+    end: str | datetime | None = None,
+    title: str | None = None,
+    date_header: str | None = None,
+    tz_name: str | None = None,
+) -> Optional[Dict[str, Any]]:
+    """Build a Calendar event resource from an email, or None if it has no date.
 
-    Uses natural-language parsing on the email body to determine the start time
-    and applies a default duration from configuration.
+    ``start``/``end`` (ISO 8601 strings or datetimes, e.g. from the compact
+    Gemini output) are used as given. Without a valid ``start`` the start is
+    extracted from the subject and body with date_extract, resolving relative
+    dates against ``date_header`` (the email's Date header) in ``tz_name``
+    (the user's timezone, default TIMEZONE). A missing end gets the default
+    duration from configuration. ``title`` overrides the subject as summary.
     """
 
-    settings = {"PREFER_DATES_FROM": "future"}
-    parsed_dt = dateparser.parse(body, settings=settings)
-    dt = _normalize_event_time(parsed_dt)
+    tz_name = tz_name or TIMEZONE
+    dt = _parse_iso(start)
+    if dt is None:
+        dt = extract_event_time(f"{subject}\n{body}", date_header=date_header, tz_name=tz_name)
 
     if not dt:
         logger.info("Could not find a date in email subject='%s'", subject)
-        return
+        return None
 
-    # Apply default duration
-    end_dt = dt + timedelta(minutes=DEFAULT_EVENT_DURATION_MIN)
+    end_dt = _parse_iso(end)
+    if end_dt is not None and (end_dt.tzinfo is None) != (dt.tzinfo is None):
+        end_dt = None
+    if end_dt is None or end_dt <= dt:
+        # Apply default duration
+        end_dt = dt + timedelta(minutes=DEFAULT_EVENT_DURATION_MIN)
 
-    event = {
-        "summary": subject or "(No subject)",
+    return {
+        "summary": title or subject or "(No subject)",
         "description": body[:500],  # Keep only first 500 chars
         "start": {
             "dateTime": dt.isoformat(),
-            "timeZone": TIMEZONE,
+            "timeZone": tz_name,
         },
         "end": {
             "dateTime": end_dt.isoformat(),
-            "timeZone": TIMEZONE,
+            "timeZone": tz_name,
         },
     }
 
-    try:
-        created = service.events().insert(calendarId=CALENDAR_ID, body=event).execute()
-        logger.info(
-            "Event created: id=%s summary=%s start=%s",
-            created.get("id"),
-            created.get("summary"),
-            created.get("start", {}).get("dateTime"),
+
+def _log_created(created: Dict[str, Any]) -> None:
+    logger.info(
+        "Event created: id=%s summary=%s start=%s",
+        created.get("id"),
+        created.get("summary"),
+        created.get("start", {}).get("dateTime"),
+    )
+
+
+def create_event(
+    service: Any,
+    subject: str,
+    body: str,
+    user_id: str = DEFAULT_USER_ID,
+    message_id: str | None = None,
+    **kwargs: Any,
+) -> Optional[Dict[str, Any]]:
+    """Create a calendar event inferred from an email's subject and body.
+
+    Keyword arguments are passed to build_event. The insert is idempotent
+    (see EventBatch): creating the same event again returns the existing one.
+    Returns the insert result (``{"id", "event", "error", "duplicate"}``, see
+    insert_events), or None if no date was found.
+    """
+
+    batch = EventBatch(service, user_id=user_id)
+    if not batch.add_from_email(0, subject, body, message_id=message_id, **kwargs):
+        return None
+    return batch.submit()[0]
+
+
+def _status(exc: Exception) -> int | None:
+    return exc.resp.status if isinstance(exc, HttpError) else None
+
+
+def _is_retryable(exc: Exception) -> bool:
+    return _status(exc) in (403, 429, 500, 502, 503, 504)
+
+
+def insert_events(
+    service: Any,
+    events: List[Dict[str, Any]],
+    calendar_id: str = CALENDAR_ID,
+    batch_size: int | None = None,
+) -> List[Dict[str, Any]]:
+    """Insert several event resources using Calendar batch HTTP requests.
+
+    Events are grouped into batches of at most ``batch_size`` inserts
+    (CALENDAR_BATCH_SIZE). Inserts rejected with a rate-limit or 5xx error
+    are retried once individually. When a whole batch request fails, only
+    events with a client-chosen ``id`` are retried, since for the others a
+    retry could duplicate inserts that were applied. An insert rejected with
+    409 (an event with that ``id`` already exists) counts as a duplicate, not
+    an error.
+
+    Returns one result per event, in input order: ``{"id", "event", "error",
+    "duplicate"}``, where ``event`` is the created resource (or None) and
+    ``error`` a message (or None).
+    """
+    if batch_size is None:
+        batch_size = CALENDAR_BATCH_SIZE
+    results: List[Dict[str, Any]] = [
+        {"id": None, "event": None, "error": None, "duplicate": False} for _ in events
+    ]
+    retry: List[int] = []
+
+    def _insert_request(event: Dict[str, Any]) -> Any:
+        return service.events().insert(calendarId=calendar_id, body=event, **fields(CALENDAR_EVENT_INSERT))
+
+    def _fail(idx: int, exc: Exception) -> None:
+        if _status(exc) == 409 and events[idx].get("id"):
+            results[idx].update(id=events[idx]["id"], duplicate=True)
+        else:
+            results[idx]["error"] = str(exc)
+
+    def _on_response(request_id: str, response: Dict[str, Any], exception: Exception | None) -> None:
+        idx = int(request_id)
+        if exception is None:
+            results[idx].update(id=response.get("id"), event=response)
+        elif _is_retryable(exception):
+            retry.append(idx)
+        else:
+            _fail(idx, exception)
+
+    if batch_size > 1 and len(events) > 1:
+        for start in range(0, len(events), batch_size):
+            batch = service.new_batch_http_request(callback=_on_response)
+            chunk = range(start, min(start + batch_size, len(events)))
+            for idx in chunk:
+                batch.add(_insert_request(events[idx]), request_id=str(idx))
+            try:
+                batch.execute()
+            except Exception as exc:
+                logger.error("Calendar batch insert of %d event(s) failed: %s", len(chunk), exc)
+                for idx in chunk:
+                    if results[idx]["id"] is not None or results[idx]["error"] or idx in retry:
+                        continue
+                    if events[idx].get("id"):
+                        retry.append(idx)
+                    else:
+                        results[idx]["error"] = str(exc)
+    else:
+        retry = list(range(len(events)))
+
+    for idx in retry:
+        try:
+            created = _insert_request(events[idx]).execute()
+            results[idx].update(id=created.get("id"), event=created)
+        except Exception as exc:
+            _fail(idx, exc)
+
+    for event, result in zip(events, results):
+        if result["event"] is not None:
+            _log_created(result["event"])
+        elif result["duplicate"]:
+            logger.info("Event already exists: id=%s summary=%s", result["id"], event.get("summary"))
+        else:
+            logger.error("Failed to create calendar event '%s': %s", event.get("summary"), result["error"])
+    return results
+
+
+class EventBatch:
+    """Collects a user's pending events and inserts them idempotently.
+
+    Each event is added under a caller-chosen ``key`` (e.g. the email index)
+    so results can be matched back to their source. Before inserting, the
+    event's source keys (Gmail message ID and content fingerprint) are looked
+    up in event_index: already-created events are reported as duplicates
+    without an API call. New events get a deterministic ``id``, so a retry
+    or a concurrent run inserting the same event gets a 409 instead of a
+    second copy. Successful inserts are recorded in the index and mark the
+    user's calendar mirror stale.
+    """
+
+    def __init__(
+        self,
+        service: Any,
+        user_id: str = DEFAULT_USER_ID,
+        calendar_id: str = CALENDAR_ID,
+        batch_size: int | None = None,
+    ) -> None:
+        self.service = service
+        self.user_id = user_id or DEFAULT_USER_ID
+        self.calendar_id = calendar_id
+        self.batch_size = batch_size
+        self._keys: List[Any] = []
+        self._events: List[Dict[str, Any]] = []
+        self._sources: List[List[str]] = []
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add(self, key: Any, event: Dict[str, Any], message_id: str | None = None) -> None:
+        """Queue an event resource, optionally tied to the Gmail message it came from."""
+        self._keys.append(key)
+        self._events.append(event)
+        self._sources.append(event_index.source_keys(event, message_id))
+
+    def add_from_email(
+        self,
+        key: Any,
+        subject: str,
+        body: str,
+        message_id: str | None = None,
+        **kwargs: Any,
+    ) -> bool:
+        """Build an event with build_event and queue it; False if it has no date."""
+        event = build_event(subject, body, **kwargs)
+        if event is None:
+            return False
+        self.add(key, event, message_id)
+        return True
+
+    def submit(self) -> Dict[Any, Dict[str, Any]]:
+        """Insert all queued events and return ``{key: result}`` (see insert_events)."""
+        if not self._events:
+            return {}
+        keys, events, sources = self._keys, self._events, self._sources
+        self._keys, self._events, self._sources = [], [], []
+
+        indexed = event_index.lookup(self.user_id, (k for ks in sources for k in ks))
+        submitted: Dict[Any, Dict[str, Any]] = {}
+        pending: List[int] = []
+        seen: Dict[str, int] = {}
+        twins: Dict[Any, Any] = {}
+        for i, (key, event, source) in enumerate(zip(keys, events, sources)):
+            existing = next((indexed[k] for k in source if k in indexed), None)
+            if existing is not None:
+                logger.info("Skipping already-created event '%s' (id=%s)", event.get("summary"), existing)
+                submitted[key] = {"id": existing, "event": None, "error": None, "duplicate": True}
+                continue
+            twin = next((seen[k] for k in source if k in seen), None)
+            if twin is not None:
+                # Same event twice in this batch: share the first one's result
+                twins[key] = keys[twin]
+                continue
+            for k in source:
+                seen[k] = i
+            event["id"] = event_index.event_id_for(self.user_id, self.calendar_id, source[0])
+            pending.append(i)
+
+        results = insert_events(
+            self.service, [events[i] for i in pending], self.calendar_id, self.batch_size,
         )
-    except Exception as exc:
-        logger.error("Failed to create calendar event for '%s': %s", subject, exc)
\ No newline at end of file
+        created = []
+        for i, result in zip(pending, results):
+            submitted[keys[i]] = result
+            if result["error"] is None:
+                created.extend((k, result["id"]) for k in sources[i])
+        event_index.record(self.user_id, self.calendar_id, created)
+        if created:
+            calendar_mirror.invalidate(self.user_id, self.calendar_id)
+
+        for key, first_key in twins.items():
+            first = submitted[first_key]
+            submitted[key] = {**first, "event": None, "duplicate": first["error"] is None}
+        return submitted
@@ -0,0 +1,296 @@
+"""Per-user local mirror of Google Calendar events in SQLite.
+
+Schedule reads (dashboard, /api/schedule, daily notifications) are served
+from the ``calendar_events`` table instead of calling events().list every
+time. The mirror is refreshed with Calendar incremental sync:
+
+  * the first sync lists events from CALENDAR_MIRROR_PAST_DAYS ago to
+    CALENDAR_MIRROR_FUTURE_DAYS ahead, following nextPageToken, and stores
+    the returned nextSyncToken;
+  * later syncs send only the syncToken and apply the changed and cancelled
+    events;
+  * an expired token (410 Gone), or a window more than half used up,
+    replaces the user's mirror with a new full sync.
+
+Pages are fetched before anything is written; the changes are then applied
+in one short transaction, so the shared SQLite write lock is never held
+across API calls.
+
+ensure_fresh() syncs only when the mirror is older than
+CALENDAR_MIRROR_MAX_AGE_SEC, so reads within that bound cost no API calls.
+invalidate() forces a sync on the next read, e.g. after creating events.
+Both invalidate() and syncs that change events bump a per-calendar version,
+which keys the rendered schedule cache (schedule_cache).
+"""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dateutil import parser as dt_parser
+from googleapiclient.errors import HttpError
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+
+from api_fields import CALENDAR_EVENT_LIST, fields
+from config import (
+    CALENDAR_ID,
+    CALENDAR_MIRROR_FUTURE_DAYS,
+    CALENDAR_MIRROR_MAX_AGE_SEC,
+    CALENDAR_MIRROR_PAST_DAYS,
+)
+from message_store import DEFAULT_USER_ID
+from models import CalendarEventMirror, CalendarSyncState, Session
+
+logger = logging.getLogger(__name__)
+
+# Largest page events().list allows
+_PAGE_SIZE = 2500
+# Rows fetched per round trip when iterating mirrored events
+_READ_CHUNK = 200
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _event_times(event: Dict[str, Any]) -> Optional[Tuple[datetime, datetime, bool]]:
+    """Return (start, end, all_day); timed events in naive UTC, all-day ones as local dates."""
+    start = event.get("start", {})
+    end = event.get("end", {})
+    try:
+        if start.get("dateTime"):
+            start_at = _to_utc_naive(dt_parser.isoparse(start["dateTime"]))
+            end_at = _to_utc_naive(dt_parser.isoparse(end["dateTime"])) if end.get("dateTime") else start_at
+            return start_at, end_at, False
+        if start.get("date"):
+            start_at = datetime.fromisoformat(start["date"])
+            end_at = datetime.fromisoformat(end["date"]) if end.get("date") else start_at + timedelta(days=1)
+            return start_at, end_at, True
+    except (ValueError, KeyError) as exc:
+        logger.warning("Skipping event %s with unparseable times: %s", event.get("id"), exc)
+    return None
+
+
+def _list_pages(service: Any, calendar_id: str, **params: Any) -> Iterator[Dict[str, Any]]:
+    """Yield every page of an events().list call."""
+    page_token = None
+    while True:
+        response = (
+            service.events()
+            .list(
+                calendarId=calendar_id, singleEvents=True, maxResults=_PAGE_SIZE, pageToken=page_token,
+                **fields(CALENDAR_EVENT_LIST), **params,
+            )
+            .execute()
+        )
+        yield response
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def _apply(db: Any, user_id: str, calendar_id: str, events: List[Dict[str, Any]], now: datetime) -> None:
+    for event in events:
+        event_id = event.get("id")
+        if not event_id:
+            continue
+        times = None if event.get("status") == "cancelled" else _event_times(event)
+        if times is None:
+            db.execute(delete(CalendarEventMirror).where(
+                CalendarEventMirror.user_id == user_id,
+                CalendarEventMirror.calendar_id == calendar_id,
+                CalendarEventMirror.event_id == event_id,
+            ))
+            continue
+        start_at, end_at, all_day = times
+        values = {
+            "summary": event.get("summary"), "start_at": start_at, "end_at": end_at,
+            "all_day": all_day, "raw": event, "updated_at": now,
+        }
+        stmt = insert(CalendarEventMirror).values(
+            user_id=user_id, calendar_id=calendar_id, event_id=event_id, **values,
+        )
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "calendar_id", "event_id"], set_=values,
+        ))
+
+
+def sync(service: Any, user_id: str = DEFAULT_USER_ID, calendar_id: str = CALENDAR_ID, full: bool = False) -> int:
+    """Bring the user's mirror up to date; returns the number of changed events.
+
+    Uses the stored syncToken unless ``full`` is set, there is none yet, or
+    the last full sync's window is more than half used up.
+    """
+    now = _utcnow()
+    db = Session()
+    try:
+        state = db.get(CalendarSyncState, (user_id, calendar_id))
+        token = None if full or state is None else state.sync_token
+        window_end = state.window_end if state is not None else None
+    finally:
+        db.close()
+
+    if token and (window_end is None or window_end - now < timedelta(days=CALENDAR_MIRROR_FUTURE_DAYS / 2)):
+        logger.info("Calendar mirror window for %s is running out; running a full sync", user_id)
+        token = None
+    if token:
+        params: Dict[str, Any] = {"syncToken": token}
+    else:
+        window_end = now + timedelta(days=CALENDAR_MIRROR_FUTURE_DAYS)
+        params = {
+            "timeMin": (now - timedelta(days=CALENDAR_MIRROR_PAST_DAYS)).isoformat() + "Z",
+            "timeMax": window_end.isoformat() + "Z",
+        }
+
+    items: List[Dict[str, Any]] = []
+    next_token = None
+    try:
+        for page in _list_pages(service, calendar_id, **params):
+            items.extend(page.get("items", []))
+            next_token = page.get("nextSyncToken") or next_token
+    except HttpError as exc:
+        if token and exc.resp.status == 410:
+            logger.info("Calendar sync token for %s expired; running a full sync", user_id)
+            return sync(service, user_id, calendar_id, full=True)
+        raise
+
+    db = Session()
+    try:
+        if not token:
+            db.execute(delete(CalendarEventMirror).where(
+                CalendarEventMirror.user_id == user_id,
+                CalendarEventMirror.calendar_id == calendar_id,
+            ))
+        _apply(db, user_id, calendar_id, items, now)
+        state = db.get(CalendarSyncState, (user_id, calendar_id))
+        if state is None:
+            state = CalendarSyncState(user_id=user_id, calendar_id=calendar_id, version=0)
+            db.add(state)
+        if items or not token:
+            state.version += 1
+        state.sync_token = next_token
+        state.synced_at = now
+        state.window_end = window_end
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    logger.debug("%s calendar sync for %s: %d changed event(s)", "Incremental" if token else "Full", user_id, len(items))
+    return len(items)
+
+
+def ensure_fresh(
+    service: Any,
+    user_id: str = DEFAULT_USER_ID,
+    calendar_id: str = CALENDAR_ID,
+    max_age_sec: int | None = None,
+) -> bool:
+    """Sync the mirror if it is older than ``max_age_sec`` (CALENDAR_MIRROR_MAX_AGE_SEC).
+
+    Returns False only when there is no usable mirror: the sync failed and
+    nothing was mirrored before. A failed sync over existing data serves the
+    stale rows.
+    """
+    if max_age_sec is None:
+        max_age_sec = CALENDAR_MIRROR_MAX_AGE_SEC
+    db = Session()
+    try:
+        state = db.get(CalendarSyncState, (user_id, calendar_id))
+        synced_at = state.synced_at if state is not None else None
+        has_data = state is not None
+    finally:
+        db.close()
+
+    if synced_at is not None and _utcnow() - synced_at < timedelta(seconds=max_age_sec):
+        return True
+    try:
+        sync(service, user_id, calendar_id)
+        return True
+    except Exception as exc:
+        logger.error("Calendar sync failed for %s: %s", user_id, exc)
+        return has_data
+
+
+def invalidate(user_id: str = DEFAULT_USER_ID, calendar_id: str = CALENDAR_ID) -> None:
+    """Make the next ensure_fresh() call sync and bump the mirror version, e.g. after inserting events."""
+    db = Session()
+    try:
+        db.execute(
+            update(CalendarSyncState)
+            .where(CalendarSyncState.user_id == user_id, CalendarSyncState.calendar_id == calendar_id)
+            .values(synced_at=None, version=CalendarSyncState.version + 1)
+        )
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not invalidate calendar mirror for %s: %s", user_id, exc)
+    finally:
+        db.close()
+
+
+def version(user_id: str = DEFAULT_USER_ID, calendar_id: str = CALENDAR_ID) -> Optional[int]:
+    """Counter that changes whenever the mirrored events may have changed; None before the first sync."""
+    db = Session()
+    try:
+        state = db.get(CalendarSyncState, (user_id, calendar_id))
+        return state.version if state is not None else None
+    finally:
+        db.close()
+
+
+def iter_events_between(
+    start: datetime,
+    end: datetime,
+    user_id: str = DEFAULT_USER_ID,
+    calendar_id: str = CALENDAR_ID,
+    query: str | None = None,
+    include_all_day: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """Lazily yield mirrored events overlapping [start, end), all-day events first, then by start.
+
+    ``start`` and ``end`` must be timezone-aware in the user's timezone; it
+    decides which local days all-day events cover. ``query`` keeps events
+    whose title contains it (case-insensitive). Rows are fetched from SQLite
+    in chunks of _READ_CHUNK as the caller iterates.
+    """
+    start_utc, end_utc = _to_utc_naive(start), _to_utc_naive(end)
+    start_local, end_local = start.replace(tzinfo=None), end.replace(tzinfo=None)
+    M = CalendarEventMirror
+    overlap = and_(M.all_day.is_(False), M.start_at < end_utc, M.end_at > start_utc)
+    if include_all_day:
+        overlap = or_(overlap, and_(M.all_day.is_(True), M.start_at < end_local, M.end_at > start_local))
+    stmt = (
+        select(M.raw)
+        .where(M.user_id == user_id, M.calendar_id == calendar_id, overlap)
+        .order_by(M.all_day.desc(), M.start_at)
+        .execution_options(yield_per=_READ_CHUNK)
+    )
+    if query:
+        pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        stmt = stmt.where(M.summary.ilike(f"%{pattern}%", escape="\\"))
+    db = Session()
+    try:
+        for row in db.execute(stmt):
+            yield row[0]
+    finally:
+        db.close()
+
+
+def events_between(
+    start: datetime,
+    end: datetime,
+    user_id: str = DEFAULT_USER_ID,
+    calendar_id: str = CALENDAR_ID,
+) -> List[Dict[str, Any]]:
+    """All mirrored events overlapping [start, end) (see iter_events_between)."""
+    return list(iter_events_between(start, end, user_id, calendar_id))
@@ -11,6 +11,174 @@ GOOGLE_TOKEN_FILE: str = os.getenv("GOOGLE_TOKEN_FILE", "token.pickle")
 GEMINI_API_KEY : str = os.getenv("GEMINI_API_KEY", os.getenv("GOOGLE_API_KEY", ""))
 GEMINI_MODEL : str = os.getenv("GEMINI_MODEL","gemini_pro")
 
+# Gemini client: concurrent requests per batch call, process-wide quotas
+# (requests/tokens per minute, 0 = unlimited) and retries on 429s
+try:
+    GEMINI_CONCURRENCY: int = int(os.getenv("GEMINI_CONCURRENCY", "8"))
+except ValueError:
+    GEMINI_CONCURRENCY = 8
+
+try:
+    GEMINI_RPM: int = int(os.getenv("GEMINI_RPM", "60"))
+except ValueError:
+    GEMINI_RPM = 60
+
+try:
+    GEMINI_TPM: int = int(os.getenv("GEMINI_TPM", "1000000"))
+except ValueError:
+    GEMINI_TPM = 1000000
+
+try:
+    GEMINI_MAX_RETRIES: int = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+except ValueError:
+    GEMINI_MAX_RETRIES = 5
+
+# Batched Gemini analysis: several emails per request, bounded by an
+# estimated input-token budget and a maximum number of emails
+try:
+    GEMINI_BATCH_TOKEN_BUDGET: int = int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "8000"))
+except ValueError:
+    GEMINI_BATCH_TOKEN_BUDGET = 8000
+
+try:
+    GEMINI_BATCH_MAX_EMAILS: int = int(os.getenv("GEMINI_BATCH_MAX_EMAILS", "10"))
+except ValueError:
+    GEMINI_BATCH_MAX_EMAILS = 10
+
+# Daily Gemini token budgets (input + output, UTC day; 0 = unlimited)
+try:
+    GEMINI_DAILY_TOKEN_BUDGET: int = int(os.getenv("GEMINI_DAILY_TOKEN_BUDGET", "0"))
+except ValueError:
+    GEMINI_DAILY_TOKEN_BUDGET = 0
+
+try:
+    GEMINI_USER_DAILY_TOKEN_BUDGET: int = int(os.getenv("GEMINI_USER_DAILY_TOKEN_BUDGET", "0"))
+except ValueError:
+    GEMINI_USER_DAILY_TOKEN_BUDGET = 0
+
+# Email bodies above this many estimated tokens are compacted before prompting,
+# keeping header lines, sentences with dates/times and the first/last
+# PROMPT_COMPACT_EDGE_CHARS characters
+try:
+    GEMINI_BODY_MAX_TOKENS: int = int(os.getenv("GEMINI_BODY_MAX_TOKENS", "1500"))
+except ValueError:
+    GEMINI_BODY_MAX_TOKENS = 1500
+
+try:
+    PROMPT_COMPACT_EDGE_CHARS: int = int(os.getenv("PROMPT_COMPACT_EDGE_CHARS", "1000"))
+except ValueError:
+    PROMPT_COMPACT_EDGE_CHARS = 1000
+
+# Local pre-classifier that skips Gemini for confidently classified emails
+PRECLASSIFIER_ENABLED: bool = os.getenv("PRECLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+try:
+    PRECLASSIFIER_THRESHOLD: float = float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.9"))
+except ValueError:
+    PRECLASSIFIER_THRESHOLD = 0.9
+
+# The trainable stage only votes after this many Gemini-labelled emails
+try:
+    PRECLASSIFIER_MIN_SAMPLES: int = int(os.getenv("PRECLASSIFIER_MIN_SAMPLES", "200"))
+except ValueError:
+    PRECLASSIFIER_MIN_SAMPLES = 200
+
+# The trainable stage decides only when this share of the email's tokens was
+# seen in training and the best intent beats the runner-up by this average
+# per-token log-odds margin
+try:
+    PRECLASSIFIER_NB_MIN_KNOWN: float = float(os.getenv("PRECLASSIFIER_NB_MIN_KNOWN", "0.7"))
+except ValueError:
+    PRECLASSIFIER_NB_MIN_KNOWN = 0.7
+
+try:
+    PRECLASSIFIER_NB_MIN_MARGIN: float = float(os.getenv("PRECLASSIFIER_NB_MIN_MARGIN", "0.5"))
+except ValueError:
+    PRECLASSIFIER_NB_MIN_MARGIN = 0.5
+
+# Share of emails the trainable stage could decide that still go to Gemini,
+# so it keeps receiving fresh labels
+try:
+    PRECLASSIFIER_NB_EXPLORE_RATE: float = float(os.getenv("PRECLASSIFIER_NB_EXPLORE_RATE", "0.05"))
+except ValueError:
+    PRECLASSIFIER_NB_EXPLORE_RATE = 0.05
+
+PRECLASSIFIER_MODEL_PATH: str = os.getenv(
+    "PRECLASSIFIER_MODEL_PATH",
+    os.path.join(os.path.dirname(__file__), ".cache", "preclassifier.json"),
+)
+
+# Gemini analysis cache: in-process LRU in front of a SQLite table
+ANALYSIS_CACHE_ENABLED: bool = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+try:
+    ANALYSIS_CACHE_TTL_SEC: int = int(os.getenv("ANALYSIS_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+except ValueError:
+    ANALYSIS_CACHE_TTL_SEC = 7 * 24 * 3600
+
+try:
+    ANALYSIS_CACHE_MEMORY_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MEMORY_ENTRIES", "1024"))
+except ValueError:
+    ANALYSIS_CACHE_MEMORY_ENTRIES = 1024
+
+try:
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "20000"))
+except ValueError:
+    ANALYSIS_CACHE_MAX_ENTRIES = 20000
+
+# --- Google API clients and transport ---
+
+# Per-user Gmail/Calendar clients kept in memory: at most this many users,
+# each rebuilt after GOOGLE_CLIENT_CACHE_TTL_SEC
+try:
+    GOOGLE_CLIENT_CACHE_ENTRIES: int = int(os.getenv("GOOGLE_CLIENT_CACHE_ENTRIES", "256"))
+except ValueError:
+    GOOGLE_CLIENT_CACHE_ENTRIES = 256
+
+try:
+    GOOGLE_CLIENT_CACHE_TTL_SEC: int = int(os.getenv("GOOGLE_CLIENT_CACHE_TTL_SEC", "3600"))
+except ValueError:
+    GOOGLE_CLIENT_CACHE_TTL_SEC = 3600
+
+# Shared keep-alive HTTP pool for all Google API and OAuth calls: connections
+# kept per host, and connect/read timeouts in seconds
+try:
+    GOOGLE_HTTP_POOL_SIZE: int = int(os.getenv("GOOGLE_HTTP_POOL_SIZE", "32"))
+except ValueError:
+    GOOGLE_HTTP_POOL_SIZE = 32
+
+try:
+    GOOGLE_HTTP_CONNECT_TIMEOUT_SEC: int = int(os.getenv("GOOGLE_HTTP_CONNECT_TIMEOUT_SEC", "10"))
+except ValueError:
+    GOOGLE_HTTP_CONNECT_TIMEOUT_SEC = 10
+
+try:
+    GOOGLE_HTTP_READ_TIMEOUT_SEC: int = int(os.getenv("GOOGLE_HTTP_READ_TIMEOUT_SEC", "60"))
+except ValueError:
+    GOOGLE_HTTP_READ_TIMEOUT_SEC = 60
+
+# Request only the response fields each call site uses (partial responses via
+# the "fields" parameter). Turn off to debug with full resources.
+GOOGLE_API_FIELD_MASKS: bool = os.getenv("GOOGLE_API_FIELD_MASKS", "true").lower() in ("1", "true", "yes")
+
+# Background OAuth refresh: every TOKEN_REFRESH_INTERVAL_MIN minutes, refresh
+# (TOKEN_REFRESH_CONCURRENCY at a time) access tokens expiring within
+# TOKEN_REFRESH_MARGIN_SEC. Keep the margin longer than the interval.
+try:
+    TOKEN_REFRESH_INTERVAL_MIN: int = int(os.getenv("TOKEN_REFRESH_INTERVAL_MIN", "10"))
+except ValueError:
+    TOKEN_REFRESH_INTERVAL_MIN = 10
+
+try:
+    TOKEN_REFRESH_MARGIN_SEC: int = int(os.getenv("TOKEN_REFRESH_MARGIN_SEC", "1200"))
+except ValueError:
+    TOKEN_REFRESH_MARGIN_SEC = 1200
+
+try:
+    TOKEN_REFRESH_CONCURRENCY: int = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "8"))
+except ValueError:
+    TOKEN_REFRESH_CONCURRENCY = 8
+
 # Gmail search query for meeting-related emails
 GMAIL_QUERY: str = os.getenv(
     "GMAIL_QUERY",
@@ -23,6 +191,109 @@ try:
 except ValueError:
     GMAIL_MAX_RESULTS = 20
 
+# Number of message GETs grouped into one Gmail batch HTTP request.
+# Gmail accepts up to 100 per batch; 0 or 1 fetches messages one at a time.
+try:
+    GMAIL_BATCH_SIZE: int = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+except ValueError:
+    GMAIL_BATCH_SIZE = 50
+
+# Use the Gmail history API to fetch only messages added since the last run
+GMAIL_INCREMENTAL_SYNC: bool = os.getenv("GMAIL_INCREMENTAL_SYNC", "true").lower() in ("1", "true", "yes")
+
+# Character budget for extracted email bodies passed to Gemini and date parsing
+# (0 disables truncation)
+try:
+    EMAIL_BODY_MAX_CHARS: int = int(os.getenv("EMAIL_BODY_MAX_CHARS", "8000"))
+except ValueError:
+    EMAIL_BODY_MAX_CHARS = 8000
+
+# --- Metadata triage before full message download ---
+# Comma-separated sender addresses or domains. A non-empty allow list only
+# lets matching senders through; the deny list always rejects.
+TRIAGE_SENDER_ALLOW: str = os.getenv("TRIAGE_SENDER_ALLOW", "")
+TRIAGE_SENDER_DENY: str = os.getenv("TRIAGE_SENDER_DENY", "")
+
+# Case-insensitive regex; messages whose subject matches are skipped
+TRIAGE_SUBJECT_DENY: str = os.getenv("TRIAGE_SUBJECT_DENY", "")
+
+# Skip messages whose Gmail size estimate exceeds this many bytes (0 = off)
+try:
+    TRIAGE_MAX_MESSAGE_BYTES: int = int(os.getenv("TRIAGE_MAX_MESSAGE_BYTES", "0"))
+except ValueError:
+    TRIAGE_MAX_MESSAGE_BYTES = 0
+
+# Eviction limits for the per-user processed-message store
+try:
+    SEEN_IDS_MAX_AGE_DAYS: int = int(os.getenv("SEEN_IDS_MAX_AGE_DAYS", "180"))
+except ValueError:
+    SEEN_IDS_MAX_AGE_DAYS = 180
+
+try:
+    SEEN_IDS_MAX_PER_USER: int = int(os.getenv("SEEN_IDS_MAX_PER_USER", "5000"))
+except ValueError:
+    SEEN_IDS_MAX_PER_USER = 5000
+
+# Attachment handling: "lazy" returns metadata handles that download on first
+# access, "none" skips attachments entirely.
+GMAIL_ATTACHMENT_MODE: str = os.getenv("GMAIL_ATTACHMENT_MODE", "lazy")
+
+# Attachment bytes one fetch job may keep in memory before spilling/dropping
+try:
+    ATTACHMENT_MEMORY_LIMIT_MB: int = int(os.getenv("ATTACHMENT_MEMORY_LIMIT_MB", "50"))
+except ValueError:
+    ATTACHMENT_MEMORY_LIMIT_MB = 50
+
+# Spill attachments past the memory limit to temporary files instead of
+# re-downloading them on every access. ATTACHMENT_SPILL_DIR defaults to the
+# system temp directory.
+ATTACHMENT_SPILL_TO_DISK: bool = os.getenv("ATTACHMENT_SPILL_TO_DISK", "true").lower() in ("1", "true", "yes")
+ATTACHMENT_SPILL_DIR: str | None = os.getenv("ATTACHMENT_SPILL_DIR")
+
+# Content-addressed attachment store shared by all users: blobs on disk,
+# metadata in the users database, evicted least-recently-used past the budget
+ATTACHMENT_STORE_ENABLED: bool = os.getenv("ATTACHMENT_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+ATTACHMENT_STORE_DIR: str = os.getenv(
+    "ATTACHMENT_STORE_DIR",
+    os.path.join(os.path.dirname(__file__), ".cache", "attachments"),
+)
+
+try:
+    ATTACHMENT_STORE_MAX_MB: int = int(os.getenv("ATTACHMENT_STORE_MAX_MB", "500"))
+except ValueError:
+    ATTACHMENT_STORE_MAX_MB = 500
+
+# --- PDF text extraction ---
+
+# Worker processes used for PDF parsing
+try:
+    PDF_WORKERS: int = int(os.getenv("PDF_WORKERS", "2"))
+except ValueError:
+    PDF_WORKERS = 2
+
+# Seconds to wait for one PDF before killing the worker
+try:
+    PDF_TIMEOUT_SEC: float = float(os.getenv("PDF_TIMEOUT_SEC", "30"))
+except ValueError:
+    PDF_TIMEOUT_SEC = 30.0
+
+# Caps on how much of a PDF is read
+try:
+    PDF_MAX_PAGES: int = int(os.getenv("PDF_MAX_PAGES", "50"))
+except ValueError:
+    PDF_MAX_PAGES = 50
+
+try:
+    PDF_MAX_CHARS: int = int(os.getenv("PDF_MAX_CHARS", "20000"))
+except ValueError:
+    PDF_MAX_CHARS = 20000
+
+# Directory for extracted text, keyed by SHA-256 of the PDF bytes
+PDF_CACHE_DIR: str = os.getenv(
+    "PDF_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), ".cache", "pdf_text"),
+)
+
 # Google Calendar configuration
 CALENDAR_ID: str = os.getenv("GOOGLE_CALENDAR_ID", "primary")
 
@@ -35,6 +306,40 @@ try:
 except ValueError:
     DEFAULT_EVENT_DURATION_MIN = 60
 
+# Event inserts grouped into one Calendar batch HTTP request (Google allows up to 1000;
+# 0 or 1 inserts events one at a time)
+try:
+    CALENDAR_BATCH_SIZE: int = int(os.getenv("CALENDAR_BATCH_SIZE", "50"))
+except ValueError:
+    CALENDAR_BATCH_SIZE = 50
+
+# Local calendar mirror used for schedule reads: reads trigger an incremental
+# (syncToken) sync only when the mirror is older than CALENDAR_MIRROR_MAX_AGE_SEC.
+# A full sync mirrors events from CALENDAR_MIRROR_PAST_DAYS ago to
+# CALENDAR_MIRROR_FUTURE_DAYS ahead, and is repeated once half of the future
+# window has passed.
+try:
+    CALENDAR_MIRROR_MAX_AGE_SEC: int = int(os.getenv("CALENDAR_MIRROR_MAX_AGE_SEC", "300"))
+except ValueError:
+    CALENDAR_MIRROR_MAX_AGE_SEC = 300
+
+try:
+    CALENDAR_MIRROR_PAST_DAYS: int = int(os.getenv("CALENDAR_MIRROR_PAST_DAYS", "30"))
+except ValueError:
+    CALENDAR_MIRROR_PAST_DAYS = 30
+
+try:
+    CALENDAR_MIRROR_FUTURE_DAYS: int = int(os.getenv("CALENDAR_MIRROR_FUTURE_DAYS", "365"))
+except ValueError:
+    CALENDAR_MIRROR_FUTURE_DAYS = 365
+
+# In-process cache of rendered daily schedules, keyed by user, local date and
+# calendar mirror version
+try:
+    SCHEDULE_CACHE_ENTRIES: int = int(os.getenv("SCHEDULE_CACHE_ENTRIES", "1024"))
+except ValueError:
+    SCHEDULE_CACHE_ENTRIES = 1024
+
 # --- Email notification configuration (Gmail SMTP) ---
 
 # The Gmail address you want to send notifications FROM
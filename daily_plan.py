@@ -1,10 +1,14 @@
 import logging
-from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from dateutil import parser as dt_parser
 
-from config import CALENDAR_ID, TIMEZONE
+import calendar_mirror
+from config import CALENDAR_ID
+from date_extract import user_zone
+from message_store import DEFAULT_USER_ID
+from schedule_cache import cache as schedule_cache
 
 
 logger = logging.getLogger(__name__)
@@ -27,48 +31,163 @@ def _parse_event_start(start: Dict[str, Any]) -> datetime | None:
         return None
 
 
-def get_today_schedule(service: Any) -> str:
-    """Return a human-friendly summary of today's calendar events."""
-
-    # Define the start and end of "Today" in UTC
-    now_utc = datetime.now(timezone.utc)
-    end_of_day_utc = (now_utc + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-
-    now = now_utc.isoformat()
-    end_of_day = end_of_day_utc.isoformat()
-
-    try:
-        events_result = (
-            service.events()
-            .list(
-                calendarId=CALENDAR_ID,
-                timeMin=now,
-                timeMax=end_of_day,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-    except Exception as exc:
-        logger.error("Failed to fetch today's schedule from calendar: %s", exc)
-        return "⚠️ Could not fetch today's schedule due to an error."
-
-    events: List[Dict[str, Any]] = events_result.get("items", [])
-
+def _render(events: List[Dict[str, Any]], zone: Any, valid_until: datetime) -> Tuple[str, datetime]:
+    """Format events; also return when the text goes stale (the first listed event ends)."""
     if not events:
-        return "☕ No meetings scheduled for today. Enjoy your day!"
+        return "☕ No meetings scheduled for today. Enjoy your day!", valid_until
 
     message = "🚀 *Your Daily Schedule:*\n\n"
     for event in events:
-        start_dt = _parse_event_start(event.get("start", {}))
+        start = event.get("start", {})
+        start_dt = _parse_event_start(start)
         summary = event.get("summary") or "(No title)"
 
         if not start_dt:
             message += f"⏰ (time unknown) - {summary}\n"
             continue
+        if not start.get("dateTime"):
+            message += f"⏰ All day - {summary}\n"
+            continue
 
-        # Show only local time HH:MM – for simplicity we display whatever datetime gives us
-        time_str = start_dt.strftime("%H:%M")
+        time_str = start_dt.astimezone(zone).strftime("%H:%M")
         message += f"⏰ {time_str} - {summary}\n"
 
-    return message
\ No newline at end of file
+        end_dt = _parse_event_start(event.get("end", {}))
+        if end_dt is not None and end_dt.tzinfo is not None:
+            valid_until = min(valid_until, end_dt)
+
+    return message, valid_until
+
+
+def render_today_schedule(
+    service: Any,
+    user_id: str = DEFAULT_USER_ID,
+    tz_name: str | None = None,
+    max_age_sec: int | None = None,
+) -> Tuple[str, Optional[str]]:
+    """Return (message, etag) for the rest of today's calendar events.
+
+    Events come from the local calendar mirror, which is synced incrementally
+    when older than ``max_age_sec``; "today" and the displayed times use the
+    user's timezone (``tz_name``, defaulting to TIMEZONE). Rendered messages
+    are cached per mirror version in schedule_cache. The etag is None for
+    error messages, which are not cached.
+    """
+
+    zone = user_zone(tz_name)
+    now = datetime.now(zone)
+    end_of_day = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if not calendar_mirror.ensure_fresh(service, user_id, CALENDAR_ID, max_age_sec):
+        return "⚠️ Could not fetch today's schedule due to an error.", None
+    try:
+        key = (user_id, CALENDAR_ID, str(zone), now.date().isoformat(), calendar_mirror.version(user_id, CALENDAR_ID))
+        cached = schedule_cache.get(key, now)
+        if cached is not None:
+            return cached
+        events: List[Dict[str, Any]] = calendar_mirror.events_between(now, end_of_day, user_id, CALENDAR_ID)
+    except Exception as exc:
+        logger.error("Failed to read today's schedule from the calendar mirror: %s", exc)
+        return "⚠️ Could not fetch today's schedule due to an error.", None
+
+    message, valid_until = _render(events, zone, end_of_day)
+    return schedule_cache.put(key, message, valid_until)
+
+
+def get_today_schedule(
+    service: Any,
+    user_id: str = DEFAULT_USER_ID,
+    tz_name: str | None = None,
+    max_age_sec: int | None = None,
+) -> str:
+    """Return a human-friendly summary of the rest of today's calendar events."""
+    return render_today_schedule(service, user_id, tz_name, max_age_sec)[0]
+
+
+def _agenda_record(event: Dict[str, Any], day: date, zone: Any) -> Dict[str, Any]:
+    start = event.get("start", {})
+    end = event.get("end", {})
+    all_day = not start.get("dateTime")
+    if all_day:
+        start_str, end_str, time_str = start.get("date"), end.get("date"), None
+    else:
+        start_dt = _parse_event_start(start).astimezone(zone)
+        end_dt = _parse_event_start(end)
+        start_str, time_str = start_dt.isoformat(), start_dt.strftime("%H:%M")
+        end_str = end_dt.astimezone(zone).isoformat() if end_dt else None
+    return {
+        "id":       event.get("id"),
+        "date":     day.isoformat(),
+        "summary":  event.get("summary") or "(No title)",
+        "all_day":  all_day,
+        "time":     time_str,
+        "start":    start_str,
+        "end":      end_str,
+        "location": event.get("location"),
+        "link":     event.get("htmlLink"),
+    }
+
+
+def iter_agenda(
+    service: Any,
+    start_date: date | None = None,
+    days: int = 1,
+    user_id: str = DEFAULT_USER_ID,
+    tz_name: str | None = None,
+    query: str | None = None,
+    include_all_day: bool = True,
+    max_age_sec: int | None = None,
+) -> Iterator[Dict[str, Any]]:
+    """Lazily yield agenda records for ``days`` local days starting at ``start_date``.
+
+    Days are midnight-to-midnight in the user's timezone (``tz_name``,
+    defaulting to TIMEZONE; ``start_date`` defaults to the local today).
+    All-day events are listed under every day they cover; timed events
+    under the day they start (or the first day, if they started earlier). The
+    calendar mirror is synced at most once, before the first record, so any
+    range costs at most one incremental sync; the rows themselves are read
+    from SQLite day by day. Days before CALENDAR_MIRROR_PAST_DAYS ago or
+    more than CALENDAR_MIRROR_FUTURE_DAYS ahead are not mirrored and come
+    back empty.
+
+    Records are dicts with id, date, summary, all_day, time ("HH:MM", None
+    for all-day events), start, end (local ISO 8601), location and link.
+    Raises RuntimeError if the mirror cannot be synced and holds no data.
+    """
+    zone = user_zone(tz_name)
+    if start_date is None:
+        start_date = datetime.now(zone).date()
+    if not calendar_mirror.ensure_fresh(service, user_id, CALENDAR_ID, max_age_sec):
+        raise RuntimeError("Calendar could not be synced")
+
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        day_start = datetime.combine(day, time(), tzinfo=zone)
+        day_end = datetime.combine(day + timedelta(days=1), time(), tzinfo=zone)
+        for event in calendar_mirror.iter_events_between(
+            day_start, day_end, user_id, CALENDAR_ID, query=query, include_all_day=include_all_day,
+        ):
+            if offset and event.get("start", {}).get("dateTime"):
+                started = _parse_event_start(event["start"])
+                if started is not None and started < day_start:
+                    continue
+            yield _agenda_record(event, day, zone)
+
+
+def render_agenda(records: Iterable[Dict[str, Any]]) -> str:
+    """Human-friendly agenda text, grouped by day, from iter_agenda records."""
+    message = ""
+    current = None
+    for record in records:
+        if record["date"] != current:
+            current = record["date"]
+            heading = date.fromisoformat(current).strftime("%a %d %b")
+            if message:
+                message += "\n"
+            message += f"📅 *{heading}*\n"
+        when = record["time"] or "All day"
+        message += f"⏰ {when} - {record['summary']}\n"
+
+    if not message:
+        return "☕ No meetings scheduled for this period."
+    return "🚀 *Your Agenda:*\n\n" + message
@@ -0,0 +1,225 @@
+"""Fast event date/time extraction from email text.
+
+Running dateparser over a whole email body is slow (language detection on
+every call, cost growing with body size) and often fails on long text.
+Instead, extract_event_time:
+
+  * finds candidate temporal spans with precompiled regexes (dates such as
+    "May 14", "14/05/2024", "next Friday", "tomorrow", and times such as
+    "3pm", "15:30", "noon"), pairing each date with a nearby time; numbers
+    like "3/4", "1.2" or "12.5%" only count as dates with a year or in a
+    date-like context;
+  * parses only those short spans with English-only dateparser parsers that
+    are cached per reference time, plus an LRU cache of parsed spans;
+  * resolves relative expressions against the email's Date header, in the
+    user's timezone, and returns a timezone-aware datetime.
+"""
+
+import logging
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dateparser.date import DateDataParser
+
+from config import TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+LANGUAGES = ["en"]
+
+_MONTH = (
+    r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+)
+# Abbreviated weekdays must be followed by "." or "," so "sat"/"sun" in prose do not match
+_WEEKDAY = (
+    r"(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+    r"|(?:mon|tues?|wed|thu(?:rs?)?|fri|sat|sun)(?=[.,]))\.?"
+)
+_ORDINAL = r"\d{1,2}(?:st|nd|rd|th)?"
+_YEAR = r"(?:,?\s+\d{4})?"
+
+_DATE_RE = re.compile(
+    r"\b(?:"
+    rf"(?:{_WEEKDAY},?\s+)?{_MONTH}\s+{_ORDINAL}{_YEAR}"             # (Tue,) May 14(th)(, 2024)
+    rf"|(?:{_WEEKDAY},?\s+)?(?:the\s+)?{_ORDINAL}\s+(?:of\s+)?{_MONTH}{_YEAR}"  # 14(th) (of) May
+    r"|\d{4}-\d{1,2}-\d{1,2}"                                        # 2024-05-14
+    r"|(?P<numeric>\d{1,2}[/.]\d{1,2}(?P<year>[/.]\d{2,4})?)"          # 14/05(/2024)
+    r"|(?:the\s+)?day\s+after\s+tomorrow|today|tonight|tomorrow"
+    rf"|(?:(?:next|this|coming)\s+)?{_WEEKDAY}"
+    r"|in\s+\d{1,2}\s+(?:days?|weeks?)"
+    r")(?!\w)",
+    re.IGNORECASE,
+)
+_TIME_RE = re.compile(
+    r"(?<![\w:/.])(?:"
+    r"\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m\.|p\.m\.)"
+    r"|\d{1,2}:\d{2}(?:\s*(?:hrs|h))?"
+    r"|noon|midday|midnight"
+    r")"
+    r"(?:\s*(?-i:UTC|GMT|[ECMP][SD]T|IST|BST|CES?T)(?:[+-]\d{1,2}(?::?\d{2})?)?)?"
+    r"(?![\w:])",
+    re.IGNORECASE,
+)
+# Context that makes a yearless numeric date ("on 14/05") plausible
+_NUMERIC_DATE_CONTEXT_RE = re.compile(
+    rf"(?:\b(?:on|by|due|until|till|from|before|after|dated?|deadline)|{_WEEKDAY},?)\s*:?\s*$",
+    re.IGNORECASE,
+)
+# Words after which "1.2" or "3/4" is a version, room or section, not a date
+_NUMERIC_NOT_DATE_RE = re.compile(
+    r"(?:\b(?:v|version|build|release|rev|room|no|step|section|chapter|page|p|ch)\.?|#)\s*$",
+    re.IGNORECASE,
+)
+# Rewrites for phrasings dateparser does not understand ("next Friday" -> "Friday")
+_DATE_REWRITES = [
+    (re.compile(r"^(?:next|this|coming)\s+", re.IGNORECASE), ""),
+    (re.compile(r"^tonight$", re.IGNORECASE), "today"),
+    (re.compile(r"^(?:the\s+)?day\s+after\s+tomorrow$", re.IGNORECASE), "in 2 days"),
+]
+
+# Maximum distance in characters between a date and the time that goes with it
+_PAIR_WINDOW = 60
+
+# Span = (start offset, text, has_date, has_time)
+Span = Tuple[int, str, bool, bool]
+
+
+def user_zone(tz_name: str | None):
+    """ZoneInfo for ``tz_name`` (default TIMEZONE), falling back to UTC."""
+    try:
+        return ZoneInfo(tz_name or TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning("Unknown timezone %r, using UTC", tz_name)
+        return timezone.utc
+
+
+def reference_time(date_header: str | None, tz_name: str | None = None) -> datetime:
+    """Return the email's Date header (or now) as a naive datetime in the user's timezone."""
+    zone = user_zone(tz_name)
+    ref = None
+    if date_header:
+        try:
+            ref = parsedate_to_datetime(date_header)
+        except (TypeError, ValueError, IndexError):
+            ref = None
+    if ref is None:
+        ref = datetime.now(timezone.utc)
+    elif ref.tzinfo is None:
+        ref = ref.replace(tzinfo=timezone.utc)
+    return ref.astimezone(zone).replace(tzinfo=None, second=0, microsecond=0)
+
+
+def _date_text(text: str) -> str:
+    for pattern, replacement in _DATE_REWRITES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _is_numeric_date(text: str, match: "re.Match[str]") -> bool:
+    """Whether a numeric match such as "14/05" reads as a date rather than a ratio, version or amount."""
+    before = text[max(0, match.start() - 20):match.start()]
+    after = text[match.end():match.end() + 2]
+    if before[-1:] in ("-", "+", "$") or before[-1:].isdigit() or _NUMERIC_NOT_DATE_RE.search(before):
+        return False
+    if re.match(r"%|[.,/]?\d", after):
+        return False
+    return match.group("year") is not None or bool(_NUMERIC_DATE_CONTEXT_RE.search(before))
+
+
+def find_candidates(text: str) -> List[Span]:
+    """Temporal spans in ``text``: dates joined with a nearby time, then lone times and dates.
+
+    Paired dates and times are also returned on their own, as fallbacks for
+    combinations dateparser cannot read. Numeric dates need a year or a
+    date-like context ("on 14/05"), and rank below dates written with words.
+    """
+    times = [(m.start(), m.end(), m.group(0)) for m in _TIME_RE.finditer(text)]
+    spans: List[Span] = [(t_start, t_text, False, True) for t_start, _, t_text in times]
+    numeric_starts = set()
+    for match in _DATE_RE.finditer(text):
+        if match.group("numeric"):
+            if not _is_numeric_date(text, match):
+                continue
+            numeric_starts.add(match.start())
+            # dateparser reads "20.10" as a time; "20/10" is unambiguous
+            date_text = match.group(0).replace(".", "/")
+        else:
+            date_text = _date_text(match.group(0))
+        spans.append((match.start(), date_text, True, False))
+        paired = None
+        for idx, (t_start, t_end, t_text) in enumerate(times):
+            # time shortly after ("May 14 at 3pm") or before ("3pm on Friday")
+            after = 0 <= t_start - match.end() <= _PAIR_WINDOW
+            before = 0 <= match.start() - t_end <= _PAIR_WINDOW // 2
+            between = text[match.end():t_start] if after else text[t_end:match.start()]
+            if (after or before) and "\n" not in between:
+                paired = idx
+                break
+        if paired is not None:
+            spans.append((match.start(), f"{date_text} {times[paired][2]}", True, True))
+
+    # Date+time first, then time only, then date only; word dates before
+    # numeric ones, then document order within each
+    spans.sort(key=lambda s: (not (s[2] and s[3]), s[2], s[2] and s[0] in numeric_starts, s[0]))
+    return spans
+
+
+@lru_cache(maxsize=64)
+def _parser(relative_base: datetime) -> DateDataParser:
+    return DateDataParser(
+        languages=LANGUAGES,
+        settings={"RELATIVE_BASE": relative_base, "PREFER_DATES_FROM": "future"},
+    )
+
+
+@lru_cache(maxsize=4096)
+def _parse_span(span: str, relative_base: datetime) -> Optional[datetime]:
+    try:
+        return _parser(relative_base).get_date_data(span).date_obj
+    except Exception as exc:
+        logger.debug("Could not parse date span %r: %s", span, exc)
+        return None
+
+
+def extract_event_time(
+    text: str,
+    date_header: str | None = None,
+    tz_name: str | None = None,
+) -> Optional[datetime]:
+    """Return the most likely event start mentioned in ``text``, or None.
+
+    Parameters
+    ----------
+    text: Email subject and/or body.
+    date_header: The email's Date header; relative expressions ("tomorrow
+        at 3pm") are resolved against it. Defaults to now.
+    tz_name: IANA timezone of the user (defaults to TIMEZONE). Times without
+        an explicit zone are taken to be in it.
+
+    Candidates are tried in order of specificity; a candidate that lies
+    before the email was sent (e.g. a quoted date) is only used if nothing
+    later is found.
+    """
+    if not text:
+        return None
+    zone = user_zone(tz_name)
+    base = reference_time(date_header, tz_name)
+    fallback = None
+    for _, span, _, _ in find_candidates(text):
+        parsed = _parse_span(span, base)
+        if parsed is None:
+            continue
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=zone)
+        else:
+            parsed = parsed.astimezone(zone)
+        if parsed.replace(tzinfo=None) >= base.replace(hour=0, minute=0):
+            return parsed
+        if fallback is None:
+            fallback = parsed
+    return fallback
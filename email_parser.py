@@ -1,10 +1,17 @@
 import logging
 import json
-from typing import Any,Dict,Optional
+from datetime import datetime
+from typing import Any,Dict,List,Optional,Tuple
 
 import google.generativeai as genai
-from config import GEMINI_API_KEY,GEMINI_MODEL
-from google.generativeai.types import GenerationConfig
+import gemini_client
+from analysis_cache import cache as analysis_cache
+from config import (
+    ANALYSIS_CACHE_ENABLED,GEMINI_API_KEY,GEMINI_BATCH_MAX_EMAILS,
+    GEMINI_BATCH_TOKEN_BUDGET,GEMINI_MODEL,PRECLASSIFIER_ENABLED,
+)
+from preclassifier import preclassifier
+from token_budget import budget, compact_body, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -44,34 +51,432 @@ Analyze the following email content and extract key information in a structured
 """
 
 
+GEMINI_BATCH_PROMPT = """
+Analyze each of the following emails independently and extract key information in a structured JSON format.
+
+{emails}
+
+**Instructions (apply to every email separately):**
+1.  **Identify the primary intent.** If the email discusses a scheduled event, appointment, webinar, or any activity at a specific time, classify the intent as **"Event Scheduling"**. Other intents could be "Information Sharing", "Task Assignment", "Spam", etc.
+2.  **Extract key entities,** such as names of people, organizations, specific dates (including "tomorrow"), and locations.
+3.  **Summarize the email** in one or two sentences.
+4.  **Suggest a concrete next action** (e.g., "Add to calendar," "Reply to sender").
+
+**Output Format (JSON only):** an array with exactly one object per email, where "index" is the number of the email it describes.
+[
+  {{
+    "index": 0,
+    "intent": "...",
+    "summary": "...",
+    "entities": {{
+      "people": ["..."],
+      "organizations": ["..."],
+      "dates": ["..."],
+      "locations": ["..."]
+    }},
+    "suggested_action": "..."
+  }}
+]
+"""
+
+# Rendering of one email inside GEMINI_BATCH_PROMPT
+_BATCH_EMAIL_TEMPLATE = """**Email {index}:**
+---
+{email_body}
+---
+"""
+
+
+# Output modes, selectable per call site:
+#   full    - GEMINI_PROMPT: summary, entity lists and suggested action
+#   compact - GEMINI_COMPACT_PROMPT: intent, ISO start/end, title, confidence,
+#             enforced with a response schema
+OUTPUT_FULL = "full"
+OUTPUT_COMPACT = "compact"
+OUTPUT_MODES = (OUTPUT_FULL, OUTPUT_COMPACT)
+
+INTENTS = ["Event Scheduling", "Information Sharing", "Task Assignment", "Spam", "Other"]
+
+GEMINI_COMPACT_PROMPT = """
+Classify the following email and extract the event it schedules, if any.
+
+**Email Content:**
+---
+{email_body}
+---
+
+**Instructions:**
+1.  **intent:** "Event Scheduling" if the email discusses a scheduled event, appointment, webinar, or any activity at a specific time; otherwise the best of "Information Sharing", "Task Assignment", "Spam" or "Other".
+2.  **start / end:** the event's start and end as ISO 8601 date-times (e.g. "2024-05-14T15:00:00+05:30"). Resolve relative dates ("tomorrow", "next Friday") against the Date line. Use null when there is no event time; use null for end when only a start is given.
+3.  **title:** a short calendar title for the event, or for the email if there is none.
+4.  **confidence:** your confidence in the intent, from 0 to 1.
+"""
+
+GEMINI_COMPACT_BATCH_PROMPT = """
+Classify each of the following emails independently and extract the event it schedules, if any.
+
+{emails}
+
+**Instructions (apply to every email separately):**
+1.  **index:** the number of the email the object describes.
+2.  **intent:** "Event Scheduling" if the email discusses a scheduled event, appointment, webinar, or any activity at a specific time; otherwise the best of "Information Sharing", "Task Assignment", "Spam" or "Other".
+3.  **start / end:** the event's start and end as ISO 8601 date-times (e.g. "2024-05-14T15:00:00+05:30"). Resolve relative dates ("tomorrow", "next Friday") against the email's Date line. Use null when there is no event time; use null for end when only a start is given.
+4.  **title:** a short calendar title for the event, or for the email if there is none.
+5.  **confidence:** your confidence in the intent, from 0 to 1.
+
+Return an array with exactly one object per email.
+"""
+
+_COMPACT_PROPERTIES = {
+    "intent": {"type": "string", "format": "enum", "enum": INTENTS},
+    "start": {"type": "string", "nullable": True},
+    "end": {"type": "string", "nullable": True},
+    "title": {"type": "string"},
+    "confidence": {"type": "number"},
+}
+
+COMPACT_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": _COMPACT_PROPERTIES,
+    "required": ["intent", "start", "end", "title", "confidence"],
+}
+
+COMPACT_BATCH_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"index": {"type": "integer"}, **_COMPACT_PROPERTIES},
+        "required": ["index", "intent", "start", "end", "title", "confidence"],
+    },
+}
+
+# mode -> (single prompt, batch prompt, single schema, batch schema)
+_OUTPUT_SPECS = {
+    OUTPUT_FULL: (GEMINI_PROMPT, GEMINI_BATCH_PROMPT, None, None),
+    OUTPUT_COMPACT: (
+        GEMINI_COMPACT_PROMPT, GEMINI_COMPACT_BATCH_PROMPT,
+        COMPACT_RESPONSE_SCHEMA, COMPACT_BATCH_RESPONSE_SCHEMA,
+    ),
+}
+
+
+def _output_spec(output : str) -> Tuple[str, str, Optional[Dict[str,Any]], Optional[Dict[str,Any]]]:
+    try:
+        return _OUTPUT_SPECS[output]
+    except KeyError:
+        raise ValueError(f"Unknown output mode {output!r}; expected one of {OUTPUT_MODES}") from None
+
+
+def _iso_or_none(value : Any) -> Optional[str]:
+    """Return ``value`` if it is a parseable ISO 8601 date-time string, else None."""
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return value
+
+
+def _normalize_compact(result : Dict[str,Any]) -> Dict[str,Any]:
+    """Coerce a compact result to the schema (invalid times become None)."""
+    try:
+        confidence = min(1.0, max(0.0, float(result.get("confidence", 0.0))))
+    except (TypeError, ValueError):
+        confidence = 0.0
+    start = _iso_or_none(result.get("start"))
+    return {
+        "intent": result["intent"],
+        "start": start,
+        "end": _iso_or_none(result.get("end")) if start else None,
+        "title": str(result.get("title") or ""),
+        "confidence": confidence,
+    }
+
+
+def _finish(result : Any, output : str) -> Any:
+    if output == OUTPUT_COMPACT and _valid_result(result):
+        return _normalize_compact(result)
+    return result
+
+
 def parse_email_with_gemini(
         email_body : str,
-        prompt:str = GEMINI_PROMPT,
+        prompt:str | None = None,
         model_name : str = GEMINI_MODEL,
+        use_cache : bool = ANALYSIS_CACHE_ENABLED,
+        user_id : str | None = None,
+        output : str = OUTPUT_FULL,
 ) -> Optional[Dict[str,Any]] | None:
-    
+    """Analyse one email body with Gemini and return the parsed JSON result.
 
-    if not GEMINI_API_KEY:
-        logger.error("Cannot parse email: GEMINI_API_KEY is not configured")
-        return None
+    ``output`` selects the result shape (OUTPUT_FULL or OUTPUT_COMPACT);
+    ``prompt`` defaults to that mode's prompt. Compact results are
+    schema-constrained to intent, ISO start/end, title and confidence.
+
+    Results are looked up in and stored to the analysis cache, keyed by
+    model, prompt version and normalized body, unless ``use_cache`` is False.
+    Oversized bodies are compacted before prompting, and the call is skipped
+    (None) when ``user_id`` or the service is over its daily token budget.
+    """
+
+    single_prompt, _, schema, _ = _output_spec(output)
+    if prompt is None:
+        prompt = single_prompt
     if not email_body:
         logger.warning("Email body is empty,skipping analysis")
         return None
+    if use_cache:
+        cached = analysis_cache.get(model_name, prompt, email_body)
+        if cached is not None:
+            logger.info("Using cached Gemini analysis (model : %s)",model_name)
+            return cached
+    if not GEMINI_API_KEY:
+        logger.error("Cannot parse email: GEMINI_API_KEY is not configured")
+        return None
     logger.info("Analyzing email with Gemini model : %s",model_name)
     try:
-        model = genai.GenerativeModel(model_name)
-        full_prompt = prompt.format(email_body = email_body)
+        full_prompt = prompt.format(email_body = compact_body(email_body))
+        if not budget.admit(user_id, [estimate_tokens(full_prompt)])[0]:
+            return None
+        result = _finish(gemini_client.generate_json(model_name, full_prompt, user_id=user_id, schema=schema), output)
+        if use_cache and isinstance(result, dict):
+            analysis_cache.put(model_name, prompt, email_body, result)
+        return result
+    except Exception as e:
+        logger.error("Error during Gemini API call: %s",e,exc_info=True)
+        return None
+
+
+def _valid_result(item: Any) -> bool:
+    """A per-email result must at least carry a string intent."""
+    return isinstance(item, dict) and isinstance(item.get("intent"), str)
+
+
+def _pack_batches(
+        bodies : List[str],
+        token_budget : int,
+        max_emails : int,
+        batch_prompt : str = GEMINI_BATCH_PROMPT,
+) -> List[List[int]]:
+    """Group body indexes into batches that fit the token and size limits."""
+    overhead = estimate_tokens(batch_prompt)
+    batches: List[List[int]] = []
+    current: List[int] = []
+    used = overhead
+    for idx, body in enumerate(bodies):
+        cost = estimate_tokens(body) + 10
+        if current and (used + cost > token_budget or len(current) >= max_emails):
+            batches.append(current)
+            current, used = [], overhead
+        current.append(idx)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _batch_prompt(bodies : List[str], batch_prompt : str = GEMINI_BATCH_PROMPT) -> str:
+    emails = "\n".join(
+        _BATCH_EMAIL_TEMPLATE.format(index=i, email_body=body) for i, body in enumerate(bodies)
+    )
+    return batch_prompt.format(emails=emails)
+
+
+def _collect_batch(response : Any, size : int) -> List[Optional[Dict[str,Any]]]:
+    """Map a batched response onto email indexes; invalid or missing items are None."""
+    results: List[Optional[Dict[str,Any]]] = [None] * size
+    if isinstance(response, Exception):
+        logger.error("Error during batched Gemini API call: %s",response)
+        return results
+    if isinstance(response, dict):
+        response = response.get("results") or response.get("emails") or [response]
+    if not isinstance(response, list):
+        logger.warning("Batched Gemini response is not a JSON array")
+        return results
+
+    for item in response:
+        if not _valid_result(item):
+            continue
+        index = item.pop("index", None)
+        if isinstance(index, int) and 0 <= index < size and results[index] is None:
+            results[index] = item
+    return results
+
+
+def parse_emails_with_gemini(
+        email_bodies : List[str],
+        model_name : str = GEMINI_MODEL,
+        use_cache : bool = ANALYSIS_CACHE_ENABLED,
+        token_budget : int | None = None,
+        max_emails : int | None = None,
+        user_id : str | None = None,
+        output : str = OUTPUT_FULL,
+) -> List[Optional[Dict[str,Any]]]:
+    """Analyse many email bodies with as few Gemini requests as possible.
 
-        generation_config = GenerationConfig(
-            temperature=0.1,
-            response_mime_type="application/json",
+    Bodies are packed into batch prompt requests bounded by an
+    estimated ``token_budget`` (GEMINI_BATCH_TOKEN_BUDGET) and ``max_emails``
+    (GEMINI_BATCH_MAX_EMAILS). The model answers with a JSON array keyed by
+    email index. All requests run concurrently through gemini_client, under
+    the process-wide rate limits. Items that are missing or fail validation
+    are re-run individually with the single prompt. Cached bodies are not
+    sent at all, and results are cached under the single prompt so both
+    paths share entries. Bodies are compacted before packing, and prompts
+    that do not fit the daily token budget of ``user_id`` are skipped.
+    ``output`` selects the prompts and result shape, as for
+    parse_email_with_gemini.
+
+    Returns one result (or None) per input body, in input order.
+    """
+    single_prompt, batch_prompt, single_schema, batch_schema = _output_spec(output)
+    if token_budget is None:
+        token_budget = GEMINI_BATCH_TOKEN_BUDGET
+    if max_emails is None:
+        max_emails = GEMINI_BATCH_MAX_EMAILS
+
+    results: List[Optional[Dict[str,Any]]] = [None] * len(email_bodies)
+
+    # Identical bodies (bulk mail) are analysed once
+    pending: Dict[str, List[int]] = {}
+    for idx, body in enumerate(email_bodies):
+        if not body:
+            continue
+        if use_cache:
+            cached = analysis_cache.get(model_name, single_prompt, body)
+            if cached is not None:
+                results[idx] = cached
+                continue
+        pending.setdefault(body, []).append(idx)
+
+    if not pending:
+        return results
+    if not GEMINI_API_KEY:
+        logger.error("Cannot parse emails: GEMINI_API_KEY is not configured")
+        return results
+
+    bodies = list(pending)
+    compacted = [compact_body(body) for body in bodies]
+    batches = _pack_batches(compacted, token_budget, max_emails, batch_prompt)
+    logger.info(
+        "Analyzing %d email(s) in %d Gemini request(s) with model : %s",
+        len(bodies), len(batches), model_name,
+    )
+
+    # All batches run concurrently under the shared rate limits
+    prompts = [
+        single_prompt.format(email_body=compacted[batch[0]]) if len(batch) == 1 else
+        _batch_prompt([compacted[i] for i in batch], batch_prompt)
+        for batch in batches
+    ]
+    admitted = budget.admit(user_id, [estimate_tokens(p) for p in prompts])
+    batches = [batch for batch, ok in zip(batches, admitted) if ok]
+    prompts = [prompt for prompt, ok in zip(prompts, admitted) if ok]
+    responses = gemini_client.generate_json_many(
+        model_name, prompts, user_id=user_id,
+        call_types=["single" if len(batch) == 1 else "batch" for batch in batches],
+        schemas=[single_schema if len(batch) == 1 else batch_schema for batch in batches],
+    )
+
+    body_results: List[Optional[Dict[str,Any]]] = [None] * len(bodies)
+    retry: List[int] = []
+    for batch, response in zip(batches, responses):
+        if len(batch) == 1:
+            if _valid_result(response):
+                body_results[batch[0]] = _finish(response, output)
+            elif isinstance(response, Exception):
+                logger.error("Error during Gemini API call: %s",response)
+            continue
+        for i, item in zip(batch, _collect_batch(response, len(batch))):
+            if item is None:
+                retry.append(i)
+            body_results[i] = _finish(item, output)
+
+    if retry:
+        logger.info("Re-running %d failed batch item(s) individually", len(retry))
+        retry_prompts = [single_prompt.format(email_body=compacted[i]) for i in retry]
+        admitted = budget.admit(user_id, [estimate_tokens(p) for p in retry_prompts])
+        retry = [i for i, ok in zip(retry, admitted) if ok]
+        retry_responses = gemini_client.generate_json_many(
+            model_name, [p for p, ok in zip(retry_prompts, admitted) if ok], user_id=user_id,
+            schemas=[single_schema] * len(retry),
         )
-        response = model.generate_content(
-            full_prompt,
-            generation_config=generation_config,
+        for i, response in zip(retry, retry_responses):
+            if _valid_result(response):
+                body_results[i] = _finish(response, output)
+            elif isinstance(response, Exception):
+                logger.error("Error during Gemini API call: %s",response)
+
+    for body, result in zip(bodies, body_results):
+        if result is None:
+            continue
+        if use_cache:
+            analysis_cache.put(model_name, single_prompt, body, result)
+        for idx in pending[body]:
+            results[idx] = result
+
+    return results
+
+
+def _analysis_input(email : Dict[str,Any], output : str) -> str:
+    """Text sent to Gemini for one email dict."""
+    body = email.get("body", "")
+    if output != OUTPUT_COMPACT or not body:
+        return body
+    return f"Subject: {email.get('subject', '')}\nDate: {email.get('date', '')}\n\n{body}"
+
+
+def analyze_emails(
+        emails : List[Dict[str,Any]],
+        model_name : str = GEMINI_MODEL,
+        use_preclassifier : bool = PRECLASSIFIER_ENABLED,
+        user_id : str | None = None,
+        output : str = OUTPUT_FULL,
+) -> List[Optional[Dict[str,Any]]]:
+    """Classify fetched email dicts, escalating only ambiguous ones to Gemini.
+
+    Each email first goes through the local pre-classifier. Emails it cannot
+    decide confidently are analysed with parse_emails_with_gemini, and
+    Gemini's labels are fed back to train the pre-classifier. Token usage
+    is recorded against ``user_id``.
+
+    In OUTPUT_COMPACT mode Gemini sees the subject and Date header above the
+    body (so relative dates resolve correctly) and every result has the
+    compact shape: intent, start, end, title, confidence.
+
+    Returns one result (or None) per email, in input order. Locally decided
+    results carry extra "confidence" and "source" keys.
+    """
+    _output_spec(output)
+    results: List[Optional[Dict[str,Any]]] = [None] * len(emails)
+    escalate: List[int] = []
+    for idx, email in enumerate(emails):
+        local = preclassifier.classify(email) if use_preclassifier else None
+        if local is not None and output == OUTPUT_COMPACT:
+            local = {
+                "intent": local["intent"], "start": None, "end": None,
+                "title": email.get("subject", ""), "confidence": local["confidence"],
+                "source": local["source"],
+            }
+        if local is not None:
+            results[idx] = local
+        else:
+            escalate.append(idx)
+
+    if use_preclassifier and len(escalate) < len(emails):
+        logger.info(
+            "Pre-classifier decided %d of %d email(s) locally",
+            len(emails) - len(escalate), len(emails),
         )
+    if not escalate:
+        return results
 
-        return json.loads(response.text)
-    except Exception as e:
-        logger.error("Error during Gemini API call: %s",e,exc_info=True)
-        return None
+    parsed_list = parse_emails_with_gemini(
+        [_analysis_input(emails[idx], output) for idx in escalate], model_name=model_name,
+        user_id=user_id, output=output,
+    )
+    for idx, parsed in zip(escalate, parsed_list):
+        results[idx] = parsed
+        if use_preclassifier and parsed and parsed.get("intent"):
+            preclassifier.learn(emails[idx], parsed["intent"])
+    return results
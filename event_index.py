@@ -0,0 +1,103 @@
+"""Local index of Calendar events created from emails, for idempotent inserts.
+
+Every event created by the pipeline is recorded in the ``created_events``
+table under one or more source keys:
+
+  * ``msg:<gmail message id>`` - the email the event came from;
+  * ``fp:<sha256>`` - a fingerprint of the event's title and start time, so
+    the same invitation arriving in two emails is created once.
+
+Inserts also carry a deterministic Calendar event ID derived from
+(user, calendar, primary source key), so a retried or concurrent insert of the
+same event is rejected by Calendar with 409 instead of creating a duplicate.
+"""
+
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import CreatedEvent, Session
+
+logger = logging.getLogger(__name__)
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+_CHUNK_SIZE = 500
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def message_key(message_id: str) -> str:
+    return f"msg:{message_id}"
+
+
+def fingerprint_key(event: Dict[str, Any]) -> str:
+    """Content fingerprint of an event resource: normalized title + start."""
+    title = " ".join((event.get("summary") or "").lower().split())
+    start = event.get("start", {})
+    when = start.get("dateTime") or start.get("date") or ""
+    digest = hashlib.sha256(f"{title}|{when}".encode("utf-8")).hexdigest()
+    return f"fp:{digest}"
+
+
+def source_keys(event: Dict[str, Any], message_id: str | None = None) -> List[str]:
+    """Source keys for an event, most specific first."""
+    keys = [fingerprint_key(event)]
+    if message_id:
+        keys.insert(0, message_key(message_id))
+    return keys
+
+
+def event_id_for(user_id: str, calendar_id: str, source_key: str) -> str:
+    """Deterministic Calendar event ID (lowercase hex is valid base32hex)."""
+    return hashlib.sha256(f"{user_id}|{calendar_id}|{source_key}".encode("utf-8")).hexdigest()
+
+
+def lookup(user_id: str, keys: Iterable[str]) -> Dict[str, str]:
+    """Return ``{source_key: event_id}`` for the keys already indexed for ``user_id``."""
+    keys = list(dict.fromkeys(keys))
+    found: Dict[str, str] = {}
+    if not keys:
+        return found
+    db = Session()
+    try:
+        for start in range(0, len(keys), _CHUNK_SIZE):
+            rows = db.execute(
+                select(CreatedEvent.source_key, CreatedEvent.event_id).where(
+                    CreatedEvent.user_id == user_id,
+                    CreatedEvent.source_key.in_(keys[start:start + _CHUNK_SIZE]),
+                )
+            )
+            found.update({key: event_id for key, event_id in rows})
+    except Exception as exc:
+        logger.warning("Event index lookup failed: %s", exc)
+    finally:
+        db.close()
+    return found
+
+
+def record(user_id: str, calendar_id: str, entries: Iterable[Tuple[str, str]]) -> None:
+    """Index ``(source_key, event_id)`` pairs; existing keys are left untouched."""
+    rows = [
+        {"user_id": user_id, "source_key": key, "calendar_id": calendar_id,
+         "event_id": event_id, "created_at": _utcnow()}
+        for key, event_id in entries
+    ]
+    if not rows:
+        return
+    db = Session()
+    try:
+        for start in range(0, len(rows), _CHUNK_SIZE):
+            stmt = insert(CreatedEvent).values(rows[start:start + _CHUNK_SIZE])
+            db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "source_key"]))
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not record created events: %s", exc)
+    finally:
+        db.close()
@@ -0,0 +1,287 @@
+"""Shared Gemini client: cached models, process-wide rate limits, async fan-out.
+
+All Gemini calls in the process go through this module:
+
+  * GenerativeModel instances are created once per model name and reused.
+  * Two process-wide token buckets enforce GEMINI_RPM (requests per minute)
+    and GEMINI_TPM (estimated tokens per minute) across threads, the
+    scheduler and FastAPI workers.
+  * 429 / transient errors are retried with exponential backoff plus jitter,
+    honouring the server's retry delay when one is given.
+  * Input/output tokens and latency of every call are recorded through
+    token_budget.budget.
+  * generate_json_many() runs many prompts concurrently on one long-lived
+    event loop (in a daemon thread), bounded by GEMINI_CONCURRENCY, so
+    throughput scales with quota rather than with per-call latency.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Dict, List, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from google.generativeai.types import GenerationConfig
+
+from config import GEMINI_CONCURRENCY, GEMINI_MAX_RETRIES, GEMINI_RPM, GEMINI_TPM
+from token_budget import budget, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying: quota (429) and transient server-side failures
+_RETRYABLE = (
+    api_exceptions.ResourceExhausted,
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.InternalServerError,
+    api_exceptions.DeadlineExceeded,
+)
+
+# Tokens reserved per request for the model's answer
+_OUTPUT_TOKEN_ALLOWANCE = 256
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at ``per_minute``/60 per second.
+
+    A ``per_minute`` of 0 disables the limit.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, amount: float) -> float:
+        """Take ``amount`` tokens, returning how long to wait before using them."""
+        if self.capacity <= 0:
+            return 0.0
+        # A single request bigger than the bucket must not wait forever
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """Block the calling thread until ``amount`` tokens are available."""
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, amount: float = 1.0) -> None:
+        """Await until ``amount`` tokens are available."""
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+# Process-wide quota buckets
+request_bucket = TokenBucket(GEMINI_RPM)
+token_bucket = TokenBucket(GEMINI_TPM)
+
+_models: Dict[str, Any] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(model_name: str) -> Any:
+    """Return the shared GenerativeModel for ``model_name``."""
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = genai.GenerativeModel(model_name)
+            _models[model_name] = model
+        return model
+
+
+def json_generation_config(schema: Optional[Dict[str, Any]] = None) -> GenerationConfig:
+    """Low-temperature JSON-mode generation config, optionally schema-constrained."""
+    if schema is None:
+        return GenerationConfig(
+            temperature=0.1,
+            response_mime_type="application/json",
+        )
+    return GenerationConfig(
+        temperature=0.1,
+        response_mime_type="application/json",
+        response_schema=schema,
+    )
+
+
+def _server_retry_delay(exc: Exception) -> Optional[float]:
+    """Seconds from a google.rpc.RetryInfo detail attached to the error, if any."""
+    for detail in getattr(exc, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None and hasattr(delay, "seconds"):
+            return delay.seconds + getattr(delay, "nanos", 0) / 1e9
+    return None
+
+
+def _backoff_delay(attempt: int, exc: Exception) -> float:
+    """Exponential backoff with full jitter, or the server's retry delay for 429s."""
+    retry_delay = _server_retry_delay(exc)
+    if retry_delay:
+        return retry_delay + random.uniform(0, 1)
+    return random.uniform(0, min(60.0, 2.0 * (2 ** attempt)))
+
+
+def _cost(prompt: str) -> int:
+    return estimate_tokens(prompt) + _OUTPUT_TOKEN_ALLOWANCE
+
+
+def _record_usage(
+    user_id: Optional[str],
+    model_name: str,
+    call_type: str,
+    prompt: str,
+    response: Any,
+    started: float,
+) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt)
+    output_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(response.text)
+    latency_ms = int((time.perf_counter() - started) * 1000)
+    budget.record(user_id, model_name, call_type, input_tokens, output_tokens, latency_ms)
+
+
+def generate_json(
+    model_name: str,
+    prompt: str,
+    user_id: Optional[str] = None,
+    call_type: str = "single",
+    schema: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """Synchronously send a JSON-mode prompt, respecting the shared rate limits.
+
+    ``schema`` (an OpenAPI-style dict) constrains the response shape.
+    """
+    model = get_model(model_name)
+    config = json_generation_config(schema)
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        request_bucket.acquire()
+        token_bucket.acquire(_cost(prompt))
+        try:
+            started = time.perf_counter()
+            response = model.generate_content(prompt, generation_config=config)
+            _record_usage(user_id, model_name, call_type, prompt, response, started)
+            return json.loads(response.text)
+        except _RETRYABLE as exc:
+            if attempt >= GEMINI_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt, exc)
+            logger.warning("Gemini call throttled/failed (%s); retrying in %.1fs", exc.__class__.__name__, delay)
+            time.sleep(delay)
+
+
+async def generate_json_async(
+    model_name: str,
+    prompt: str,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    user_id: Optional[str] = None,
+    call_type: str = "single",
+    schema: Optional[Dict[str, Any]] = None,
+) -> Any:
+    """Async version of generate_json, optionally bounded by ``semaphore``."""
+    model = get_model(model_name)
+    config = json_generation_config(schema)
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        await request_bucket.acquire_async()
+        await token_bucket.acquire_async(_cost(prompt))
+        try:
+            if semaphore is None:
+                started = time.perf_counter()
+                response = await model.generate_content_async(prompt, generation_config=config)
+            else:
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await model.generate_content_async(prompt, generation_config=config)
+            _record_usage(user_id, model_name, call_type, prompt, response, started)
+            return json.loads(response.text)
+        except _RETRYABLE as exc:
+            if attempt >= GEMINI_MAX_RETRIES:
+                raise
+            delay = _backoff_delay(attempt, exc)
+            logger.warning("Gemini call throttled/failed (%s); retrying in %.1fs", exc.__class__.__name__, delay)
+            await asyncio.sleep(delay)
+
+
+async def _gather(
+    model_name: str,
+    prompts: List[str],
+    concurrency: int,
+    user_id: Optional[str],
+    call_types: List[str],
+    schemas: List[Optional[Dict[str, Any]]],
+) -> List[Any]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    return await asyncio.gather(
+        *(
+            generate_json_async(model_name, p, semaphore, user_id, t, schema)
+            for p, t, schema in zip(prompts, call_types, schemas)
+        ),
+        return_exceptions=True,
+    )
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide event loop for fan-out, running in a daemon thread.
+
+    The async Gemini client binds to the loop it is first used on, so every
+    fan-out must run on this same loop rather than a fresh asyncio.run().
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="gemini-loop", daemon=True).start()
+        return _loop
+
+
+def _run(coro: Awaitable[Any]) -> Any:
+    """Run a coroutine on the shared event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
+
+
+def generate_json_many(
+    model_name: str,
+    prompts: List[str],
+    concurrency: int | None = None,
+    user_id: Optional[str] = None,
+    call_types: Optional[List[str]] = None,
+    schemas: Optional[List[Optional[Dict[str, Any]]]] = None,
+) -> List[Any]:
+    """Run many JSON-mode prompts concurrently.
+
+    ``call_types`` labels each prompt in the token usage table ("single" by
+    default) and ``schemas`` gives an optional response schema per prompt.
+    Returns one entry per prompt, in order: the decoded JSON, or the
+    exception raised for that prompt.
+    """
+    if not prompts:
+        return []
+    if concurrency is None:
+        concurrency = GEMINI_CONCURRENCY
+    if call_types is None:
+        call_types = ["single"] * len(prompts)
+    if schemas is None:
+        schemas = [None] * len(prompts)
+    if len(prompts) == 1:
+        try:
+            return [generate_json(model_name, prompts[0], user_id, call_types[0], schemas[0])]
+        except Exception as exc:
+            return [exc]
+    return _run(_gather(model_name, prompts, concurrency, user_id, call_types, schemas))
@@ -1,103 +1,71 @@
-import base64
-import io
-import json
 import logging
 import os
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
+from googleapiclient.errors import HttpError
 from tenacity import retry, stop_after_attempt, wait_exponential
 
-from config import GMAIL_MAX_RESULTS, GMAIL_QUERY
-
-try:
-    import pypdf
-    _PYPDF_AVAILABLE = True
-except ImportError:  # pragma: no cover
-    _PYPDF_AVAILABLE = False
+import message_store
+from api_fields import (
+    GMAIL_HISTORY_LIST, GMAIL_MESSAGE_FULL, GMAIL_MESSAGE_LIST, GMAIL_MESSAGE_METADATA,
+    GMAIL_PROFILE, fields,
+)
+from attachments import ATTACHMENT_MODES, MODE_LAZY, MODE_NONE, AttachmentBudget, AttachmentHandle
+from config import (
+    GMAIL_ATTACHMENT_MODE, GMAIL_BATCH_SIZE, GMAIL_INCREMENTAL_SYNC,
+    GMAIL_MAX_RESULTS, GMAIL_QUERY,
+)
+from mime_body import extract_body
+from models import GmailSyncState, Session
+from triage import METADATA_HEADERS, TriageRules
 
 logger = logging.getLogger(__name__)
 
+# Gmail rejects batches with more than 100 sub-requests
+_MAX_BATCH_SIZE = 100
+
 # Max attachment size to download (10 MB)
 _MAX_ATTACHMENT_BYTES = 10 * 1024 * 1024
 
-# File used to persist message IDs that have already been processed
-_SEEN_IDS_FILE = os.path.join(os.path.dirname(__file__), ".seen_email_ids.json")
-
-
-def _load_seen_ids() -> set:
-    """Load already-processed Gmail message IDs from disk."""
-    if os.path.exists(_SEEN_IDS_FILE):
-        try:
-            with open(_SEEN_IDS_FILE, "r", encoding="utf-8") as fh:
-                return set(json.load(fh))
-        except Exception:
-            pass
-    return set()
+# Incremental syncs narrow the query with an ``after:`` bound taken from the
+# last checkpoint, minus this slack for late-delivered or imported messages.
+_HISTORY_AFTER_SLACK_SEC = 24 * 60 * 60
 
-
-def _save_seen_ids(seen: set) -> None:
-    """Persist the set of processed Gmail message IDs to disk."""
-    try:
-        with open(_SEEN_IDS_FILE, "w", encoding="utf-8") as fh:
-            json.dump(list(seen), fh)
-    except Exception as exc:
-        logger.warning("Could not save seen email IDs: %s", exc)
-
-
-logger = logging.getLogger(__name__)
+# Legacy file that held processed message IDs for every user; imported into
+# the message store for the single-user identity on first use.
+_LEGACY_SEEN_IDS_FILE = os.path.join(os.path.dirname(__file__), ".seen_email_ids.json")
 
 
 def _decode_body_from_payload(payload: Dict[str, Any]) -> str:
-    """Extract and decode the plain-text body from a Gmail payload.
+    """Extract the cleaned plain-text body from a Gmail payload.
 
-    Preference order: text/plain → text/html → first part.
+    Delegates to mime_body.extract_body: nested multiparts are walked,
+    text/plain is preferred over HTML-converted text, quoted replies and
+    signatures are dropped and the result is capped at EMAIL_BODY_MAX_CHARS.
     """
-
-    body = ""
-    parts = payload.get("parts")
-    if not parts:
-        data = payload.get("body", {}).get("data")
-        if data:
-            body = base64.urlsafe_b64decode(data).decode("utf-8", errors="replace")
-        return body
-
-    # Prefer text/plain, fall back to text/html, then first part
-    text_part: Optional[Dict[str, Any]] = None
-    for preferred_mime in ("text/plain", "text/html"):
-        for part in parts:
-            if part.get("mimeType", "") == preferred_mime:
-                text_part = part
-                break
-        if text_part is not None:
-            break
-
-    if text_part is None:
-        text_part = parts[0]
-
-    data = text_part.get("body", {}).get("data")
-    if data:
-        body = base64.urlsafe_b64decode(data).decode("utf-8", errors="replace")
-
-    return body
+    return extract_body(payload)
 
 
 def _walk_attachment_parts(
     service: Any,
     message_id: str,
     parts: List[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
-    """Recursively walk message parts and download attachments.
+    budget: AttachmentBudget | None = None,
+    user_id: str | None = None,
+) -> List[AttachmentHandle]:
+    """Recursively walk message parts and collect attachment handles.
 
-    Returns a list of dicts with keys:
-        filename, mime_type, content (raw bytes), extracted_text (str or None).
+    No attachment data is downloaded here; each AttachmentHandle fetches its
+    bytes on first access to ``content`` or ``extracted_text``.
     Skips attachments larger than _MAX_ATTACHMENT_BYTES.
     """
-    attachments: List[Dict[str, Any]] = []
+    attachments: List[AttachmentHandle] = []
 
     for part in parts:
         subparts = part.get("parts")
         if subparts:
-            attachments.extend(_walk_attachment_parts(service, message_id, subparts))
+            attachments.extend(_walk_attachment_parts(service, message_id, subparts, budget, user_id))
             continue
 
         filename = part.get("filename")
@@ -117,52 +85,27 @@ def _walk_attachment_parts(
             )
             continue
 
-        try:
-            att = (
-                service.users()
-                .messages()
-                .attachments()
-                .get(userId="me", messageId=message_id, id=attachment_id)
-                .execute()
-            )
-            data = att.get("data")
-            if not data:
-                continue
-
-            content: bytes = base64.urlsafe_b64decode(data)
-
-            # Extract text from PDFs for Gemini
-            extracted_text: Optional[str] = None
-            if _PYPDF_AVAILABLE and mime_type == "application/pdf":
-                try:
-                    reader = pypdf.PdfReader(io.BytesIO(content))
-                    extracted_text = "\n".join(
-                        page.extract_text() or "" for page in reader.pages
-                    )
-                except Exception as pdf_exc:
-                    logger.warning("Could not extract text from PDF '%s': %s", filename, pdf_exc)
-
-            attachments.append(
-                {
-                    "filename": filename,
-                    "mime_type": mime_type,
-                    "content": content,
-                    "extracted_text": extracted_text,
-                }
-            )
-        except Exception as exc:
-            logger.error(
-                "Failed to download attachment '%s' for message %s: %s",
-                filename, message_id, exc,
+        attachments.append(
+            AttachmentHandle(
+                service, message_id, attachment_id,
+                filename=filename, mime_type=mime_type, size=size, budget=budget,
+                user_id=user_id, part_id=part.get("partId"),
             )
+        )
 
     return attachments
 
 
-def _extract_attachments(service: Any, message_id: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+def _extract_attachments(
+    service: Any,
+    message_id: str,
+    payload: Dict[str, Any],
+    budget: AttachmentBudget | None = None,
+    user_id: str | None = None,
+) -> List[AttachmentHandle]:
     """Public wrapper around _walk_attachment_parts."""
     parts = payload.get("parts") or []
-    return _walk_attachment_parts(service, message_id, parts)
+    return _walk_attachment_parts(service, message_id, parts, budget, user_id)
 
 
 @retry(
@@ -170,18 +113,279 @@ def _extract_attachments(service: Any, message_id: str, payload: Dict[str, Any])
     wait=wait_exponential(multiplier=1, min=2, max=10),
     reraise=True,
 )
-def _get_message(service: Any, msg_id: str) -> Dict[str, Any]:
-    """Fetch a single Gmail message with retry logic for transient errors."""
-    return (
-        service.users()
-        .messages()
-        .get(userId="me", id=msg_id, format="full")
-        .execute()
-    )
+def _get_message(service: Any, msg_id: str, format: str = "full") -> Dict[str, Any]:
+    """Fetch a single Gmail message with retry logic for transient errors.
 
+    ``format="metadata"`` returns only the triage headers and size estimate.
+    """
+    return _message_request(service, msg_id, format).execute()
+
+
+def _message_request(service: Any, msg_id: str, format: str = "full") -> Any:
+    """Build (without executing) a messages().get request."""
+    if format == "metadata":
+        return (
+            service.users()
+            .messages()
+            .get(
+                userId="me", id=msg_id, format="metadata", metadataHeaders=METADATA_HEADERS,
+                **fields(GMAIL_MESSAGE_METADATA),
+            )
+        )
+    if format == "full":
+        return service.users().messages().get(userId="me", id=msg_id, format=format, **fields(GMAIL_MESSAGE_FULL))
+    return service.users().messages().get(userId="me", id=msg_id, format=format)
 
-def fetch_emails(service, query: str | None = None, max_results: int | None = None) -> List[Dict[str, Any]]:
-    """Fetch recent emails matching the configured query from Gmail.
+
+def _load_history_checkpoint(user_id: str, query: str) -> Optional[Tuple[str, datetime]]:
+    """Return the stored (history_id, synced_at) for a user, if it matches ``query``."""
+    db = Session()
+    try:
+        state = db.get(GmailSyncState, user_id)
+        if state is None or state.query != query:
+            return None
+        return state.history_id, state.synced_at
+    except Exception as exc:
+        logger.warning("Could not load Gmail sync checkpoint for %s: %s", user_id, exc)
+        return None
+    finally:
+        db.close()
+
+
+def _save_history_checkpoint(user_id: str, query: str, history_id: str) -> None:
+    """Persist the Gmail historyId checkpoint for a user."""
+    db = Session()
+    try:
+        state = db.get(GmailSyncState, user_id)
+        if state is None:
+            state = GmailSyncState(user_id=user_id)
+        state.query = query
+        state.history_id = history_id
+        state.synced_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        db.add(state)
+        db.commit()
+    except Exception as exc:
+        logger.warning("Could not save Gmail sync checkpoint for %s: %s", user_id, exc)
+    finally:
+        db.close()
+
+
+def _current_history_id(service: Any) -> Optional[str]:
+    """Return the mailbox's current historyId, or None if it cannot be read."""
+    try:
+        profile = service.users().getProfile(userId="me", **fields(GMAIL_PROFILE)).execute()
+        return profile.get("historyId")
+    except Exception as exc:
+        logger.warning("Could not read Gmail profile historyId: %s", exc)
+        return None
+
+
+def _history_added_ids(service: Any, start_history_id: str) -> Optional[Tuple[Set[str], str]]:
+    """List IDs of messages added to the mailbox since ``start_history_id``.
+
+    Returns (added_ids, latest_history_id), or None when the checkpoint is
+    too old for the history API (HTTP 404) and a full scan is required.
+    """
+    added: Set[str] = set()
+    latest_history_id = start_history_id
+    page_token = None
+
+    try:
+        while True:
+            results = (
+                service.users()
+                .history()
+                .list(
+                    userId="me",
+                    startHistoryId=start_history_id,
+                    historyTypes="messageAdded",
+                    pageToken=page_token,
+                    **fields(GMAIL_HISTORY_LIST),
+                )
+                .execute()
+            )
+            for record in results.get("history", []):
+                for added_msg in record.get("messagesAdded", []):
+                    msg_id = added_msg.get("message", {}).get("id")
+                    if msg_id:
+                        added.add(msg_id)
+            latest_history_id = results.get("historyId", latest_history_id)
+
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+    except HttpError as exc:
+        if exc.resp.status == 404:
+            return None
+        raise
+
+    return added, latest_history_id
+
+
+def _get_messages_batch(
+    service: Any,
+    msg_ids: List[str],
+    batch_size: int,
+    format: str = "full",
+) -> Dict[str, Dict[str, Any]]:
+    """Fetch several Gmail messages using multipart batch HTTP requests.
+
+    IDs are grouped into batches of at most ``batch_size`` sub-requests.
+    Sub-requests that fail (rate limits, transient 5xx, a failed batch) are
+    retried one by one through _get_message. Messages that still cannot be
+    fetched are logged and left out of the returned mapping.
+
+    Returns a dict mapping message ID to the message resource in ``format``.
+    """
+    batch_size = max(1, min(batch_size, _MAX_BATCH_SIZE))
+    messages: Dict[str, Dict[str, Any]] = {}
+    failed: List[str] = []
+
+    def _on_response(request_id: str, response: Dict[str, Any], exception: Exception | None) -> None:
+        if exception is not None:
+            logger.debug("Batch sub-request for message %s failed: %s", request_id, exception)
+            failed.append(request_id)
+        else:
+            messages[request_id] = response
+
+    for start in range(0, len(msg_ids), batch_size):
+        chunk = msg_ids[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=_on_response)
+        for msg_id in chunk:
+            batch.add(_message_request(service, msg_id, format), request_id=msg_id)
+        try:
+            batch.execute()
+        except Exception as exc:
+            logger.warning("Batch request for %d message(s) failed: %s", len(chunk), exc)
+            failed.extend(
+                msg_id for msg_id in chunk
+                if msg_id not in messages and msg_id not in failed
+            )
+
+    if failed:
+        logger.info("Retrying %d failed batch item(s) individually", len(failed))
+    for msg_id in failed:
+        try:
+            messages[msg_id] = _get_message(service, msg_id, format)
+        except Exception as exc:
+            logger.error("Failed to fetch message %s after retries: %s", msg_id, exc)
+
+    return messages
+
+
+def _get_messages(
+    service: Any,
+    msg_ids: List[str],
+    batch_size: int,
+    format: str = "full",
+) -> Dict[str, Dict[str, Any]]:
+    """Fetch messages in batches, or one at a time when batching is off."""
+    if batch_size > 1 and len(msg_ids) > 1:
+        return _get_messages_batch(service, msg_ids, batch_size, format)
+
+    messages: Dict[str, Dict[str, Any]] = {}
+    for msg_id in msg_ids:
+        try:
+            messages[msg_id] = _get_message(service, msg_id, format)
+        except Exception as exc:
+            logger.error("Failed to fetch message %s after retries: %s", msg_id, exc)
+    return messages
+
+
+def _header_map(headers: List[Dict[str, str]]) -> Dict[str, str]:
+    """Map the lower-cased Subject, From, To and Date headers to their values."""
+    header_map: Dict[str, str] = {}
+    for header in headers:
+        name = header.get("name", "").lower()
+        if name in ("subject", "from", "to", "date"):
+            header_map[name] = header.get("value", "")
+    return header_map
+
+
+def _triage(
+    service: Any,
+    user_id: str,
+    msg_ids: List[str],
+    batch_size: int,
+    rules: TriageRules,
+) -> List[str]:
+    """Metadata-only first pass: return the IDs that pass ``rules``.
+
+    Rejected messages are recorded as processed so they are not triaged again.
+    Messages whose metadata cannot be fetched are kept and left to the full
+    fetch.
+    """
+    metadata = _get_messages(service, msg_ids, batch_size, format="metadata")
+
+    survivors: List[str] = []
+    rejected: List[str] = []
+    for msg_id in msg_ids:
+        meta = metadata.get(msg_id)
+        if meta is None:
+            survivors.append(msg_id)
+            continue
+        headers = _header_map(meta.get("payload", {}).get("headers", []))
+        reason = rules.reject_reason(headers, meta.get("sizeEstimate", 0))
+        if reason:
+            logger.debug("Triage skipped message %s ('%s'): %s", msg_id, headers.get("subject", ""), reason)
+            rejected.append(msg_id)
+        else:
+            survivors.append(msg_id)
+
+    if rejected:
+        logger.info("Triage skipped %d of %d message(s) for %s", len(rejected), len(msg_ids), user_id)
+        message_store.mark_processed(user_id, rejected)
+    return survivors
+
+
+def _build_email(
+    service: Any,
+    msg_id: str,
+    message: Dict[str, Any],
+    attachment_mode: str = MODE_LAZY,
+    budget: AttachmentBudget | None = None,
+    user_id: str | None = None,
+) -> Dict[str, Any]:
+    """Turn a full Gmail message resource into the dict returned by fetch_emails."""
+    payload = message.get("payload", {})
+
+    # Extract key headers: Subject, From, To, Date
+    header_map = _header_map(payload.get("headers", []))
+
+    # Extract and decode the body
+    body = _decode_body_from_payload(payload)
+
+    # Collect attachments such as PDFs, images, etc. (downloaded lazily)
+    attachments: List[AttachmentHandle] = []
+    if attachment_mode != MODE_NONE:
+        attachments = _extract_attachments(service, msg_id, payload, budget, user_id)
+
+    return {
+        "id": msg_id,
+        "subject": header_map.get("subject", ""),
+        "from_": header_map.get("from", ""),
+        "to": header_map.get("to", ""),
+        "date": header_map.get("date", ""),
+        "body": body,
+        "attachments": attachments,
+    }
+
+
+def fetch_emails_iter(
+    service,
+    query: str | None = None,
+    max_results: int | None = None,
+    batch_size: int | None = None,
+    user_id: str | None = None,
+    incremental: bool | None = None,
+    attachments: str | None = None,
+    triage: TriageRules | None = None,
+    commit: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """Yield recent emails matching the configured query from Gmail.
+
+    Each email dict is yielded as soon as its message is decoded, so callers
+    can start analysing it while later messages are still being fetched.
 
     Parameters
     ----------
@@ -189,91 +393,193 @@ def fetch_emails(service, query: str | None = None, max_results: int | None = No
     query: Optional Gmail-style search query string. Defaults to GMAIL_QUERY.
     max_results: Optional maximum number of messages to fetch. Defaults to
         GMAIL_MAX_RESULTS from configuration.
-
-    Returns a list of dicts with keys:
+    batch_size: Optional number of messages fetched per batch HTTP request.
+        Defaults to GMAIL_BATCH_SIZE; 0 or 1 fetches messages one at a time.
+    user_id: Optional account identity. Processed-message dedup and the
+        incremental sync checkpoint are scoped to it. Defaults to the
+        single-user identity message_store.DEFAULT_USER_ID.
+    incremental: Whether to fetch only messages added since the user's last
+        checkpoint. Defaults to GMAIL_INCREMENTAL_SYNC. Falls back to a full
+        query scan when there is no checkpoint or it has expired.
+    attachments: "lazy" to return AttachmentHandle objects that download on
+        first access, or "none" to skip attachments. Defaults to
+        GMAIL_ATTACHMENT_MODE.
+    triage: Optional TriageRules for a metadata-only first pass. Defaults to
+        TriageRules.from_config(). When no rule is configured, messages are
+        fetched in full directly.
+    commit: Whether the generator records yielded messages as processed.
+        Pass False when emails are handled in chunks and call
+        message_store.mark_processed() once a chunk is done.
+
+    Yields dicts with keys:
         subject, from_, to, date, body, attachments.
-    Already-seen message IDs are skipped and persisted to disk.
+    Lazy attachments of one call share an AttachmentBudget capped at
+    ATTACHMENT_MEMORY_LIMIT_MB.
+    Already-processed message IDs are skipped. With ``commit`` a message is
+    recorded as processed in the message store once the caller asks for the
+    next email, so a crash mid-run only re-delivers the email that was being
+    handled. The incremental checkpoint advances only when the generator is
+    exhausted, no message failed to download and every yielded message has
+    been recorded as processed.
     """
 
     if query is None:
         query = GMAIL_QUERY
     if max_results is None:
         max_results = GMAIL_MAX_RESULTS
+    if batch_size is None:
+        batch_size = GMAIL_BATCH_SIZE
+    if incremental is None:
+        incremental = GMAIL_INCREMENTAL_SYNC
+    if attachments is None:
+        attachments = GMAIL_ATTACHMENT_MODE
+    if attachments not in ATTACHMENT_MODES:
+        raise ValueError(f"attachments must be one of {ATTACHMENT_MODES}, got {attachments!r}")
+    if triage is None:
+        triage = TriageRules.from_config()
+    if user_id is None:
+        user_id = message_store.DEFAULT_USER_ID
+        message_store.import_legacy_json(_LEGACY_SEEN_IDS_FILE, user_id)
 
     logger.info("Fetching emails with query='%s' (max %s)", query, max_results)
 
-    seen_ids = _load_seen_ids()
-    email_data: List[Dict[str, Any]] = []
+    # With a valid checkpoint only messages added since then are candidates;
+    # the list query is narrowed with an after: bound so it stays small.
+    list_query = query
+    added_ids: Optional[Set[str]] = None
+    new_history_id: Optional[str] = None
+    if incremental:
+        checkpoint = _load_history_checkpoint(user_id, query)
+        if checkpoint is not None:
+            history_id, synced_at = checkpoint
+            try:
+                delta = _history_added_ids(service, history_id)
+            except Exception as exc:
+                logger.warning("Gmail history sync failed for %s: %s", user_id, exc)
+                delta = None
+            if delta is None:
+                logger.info("Gmail history checkpoint for %s expired; running full scan", user_id)
+            else:
+                added_ids, new_history_id = delta
+                if not added_ids:
+                    _save_history_checkpoint(user_id, query, new_history_id)
+                    logger.info("No new messages since last sync for %s", user_id)
+                    return
+                after = int(synced_at.replace(tzinfo=timezone.utc).timestamp()) - _HISTORY_AFTER_SLACK_SEC
+                list_query = f"({query}) after:{after}"
+        if new_history_id is None:
+            # Taken before listing so messages arriving mid-scan are not skipped
+            new_history_id = _current_history_id(service)
+
+    budget = AttachmentBudget()
+    yielded = 0
+    yielded_ids: List[str] = []
+    failed = 0
     page_token = None
+    completed = False
 
     try:
         while True:
-            remaining = max_results - len(email_data)
+            remaining = max_results - yielded
             if remaining <= 0:
                 break
 
             list_req = (
                 service.users()
                 .messages()
-                .list(userId="me", q=query, pageToken=page_token, maxResults=min(remaining, 100))
+                .list(
+                    userId="me", q=list_query, pageToken=page_token, maxResults=min(remaining, 100),
+                    **fields(GMAIL_MESSAGE_LIST),
+                )
             )
             results = list_req.execute()
             messages = results.get("messages", [])
 
-            for msg in messages:
-                if len(email_data) >= max_results:
-                    break
+            candidate_ids = [msg["id"] for msg in messages if msg.get("id")]
 
-                msg_id = msg.get("id")
-                if not msg_id:
-                    continue
+            # Skip matches that were not added since the checkpoint
+            if added_ids is not None:
+                candidate_ids = [msg_id for msg_id in candidate_ids if msg_id in added_ids]
 
-                # Skip already-processed emails
-                if msg_id in seen_ids:
-                    logger.debug("Skipping already-seen message %s", msg_id)
-                    continue
+            # Skip already-processed emails, up to the remaining quota
+            unseen_ids = message_store.filter_unseen(user_id, candidate_ids)
+            if len(unseen_ids) < len(candidate_ids):
+                logger.debug(
+                    "Skipping %d already-seen message(s) for %s",
+                    len(candidate_ids) - len(unseen_ids), user_id,
+                )
 
-                try:
-                    txt = _get_message(service, msg_id)
-                except Exception as exc:
-                    logger.error("Failed to fetch message %s after retries: %s", msg_id, exc)
-                    continue
+            # Cheap metadata pass first, so filtered mail is never downloaded
+            if triage.active and unseen_ids:
+                unseen_ids = _triage(service, user_id, unseen_ids, batch_size, triage)
+            page_ids = unseen_ids[:remaining]
 
-                payload = txt.get("payload", {})
-                headers = payload.get("headers", [])
-
-                # Extract key headers: Subject, From, To, Date
-                header_map: Dict[str, str] = {}
-                for header in headers:
-                    name = header.get("name", "").lower()
-                    if name in ("subject", "from", "to", "date"):
-                        header_map[name] = header.get("value", "")
-
-                # Extract and decode the body
-                body = _decode_body_from_payload(payload)
-
-                # Extract attachments such as PDFs, images, etc.
-                attachments = _extract_attachments(service, msg_id, payload)
-
-                email_data.append(
-                    {
-                        "subject": header_map.get("subject", ""),
-                        "from_": header_map.get("from", ""),
-                        "to": header_map.get("to", ""),
-                        "date": header_map.get("date", ""),
-                        "body": body,
-                        "attachments": attachments,
-                    }
-                )
-                seen_ids.add(msg_id)
+            fetched = _get_messages(service, page_ids, batch_size)
+
+            # Keep the listing order regardless of batch completion order
+            for msg_id in page_ids:
+                txt = fetched.get(msg_id)
+                if txt is None:
+                    failed += 1
+                    continue
+                yield _build_email(service, msg_id, txt, attachments, budget, user_id)
+                yielded += 1
+                yielded_ids.append(msg_id)
+                if commit:
+                    # The caller has finished with this email; checkpoint it
+                    message_store.mark_processed(user_id, [msg_id])
 
             page_token = results.get("nextPageToken")
             if not page_token:
                 break
 
+        completed = True
     except Exception as exc:
         logger.error("Error while fetching emails: %s", exc)
 
-    _save_seen_ids(seen_ids)
-    logger.info("Fetched %d new email(s) matching query", len(email_data))
-    return email_data
\ No newline at end of file
+    message_store.evict(user_id)
+
+    # An incremental run cut short by max_results, or one where some messages
+    # could not be fetched, keeps the old checkpoint so the remaining added
+    # messages are picked up on the next run.
+    truncated = added_ids is not None and yielded >= max_results
+    if incremental and failed:
+        logger.warning("Keeping Gmail checkpoint for %s: %d message(s) could not be fetched", user_id, failed)
+    elif incremental and completed and new_history_id and not truncated:
+        # Without commit the caller may not have recorded the last emails
+        # yet; keep the old checkpoint so they are offered again if it never does
+        pending = [] if commit else message_store.filter_unseen(user_id, yielded_ids)
+        if pending:
+            logger.debug("Keeping Gmail checkpoint for %s: %d email(s) not yet processed", user_id, len(pending))
+        else:
+            _save_history_checkpoint(user_id, query, new_history_id)
+
+    logger.info("Fetched %d new email(s) matching query", yielded)
+
+
+def fetch_emails(
+    service,
+    query: str | None = None,
+    max_results: int | None = None,
+    batch_size: int | None = None,
+    user_id: str | None = None,
+    incremental: bool | None = None,
+    attachments: str | None = None,
+    triage: TriageRules | None = None,
+) -> List[Dict[str, Any]]:
+    """Fetch recent emails matching the configured query from Gmail.
+
+    List-returning wrapper around fetch_emails_iter; see it for parameters.
+    """
+    return list(
+        fetch_emails_iter(
+            service,
+            query=query,
+            max_results=max_results,
+            batch_size=batch_size,
+            user_id=user_id,
+            incremental=incremental,
+            attachments=attachments,
+            triage=triage,
+        )
+    )
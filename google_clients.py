@@ -0,0 +1,117 @@
+"""Cached Gmail/Calendar service clients.
+
+googleapiclient.discovery.build() parses a discovery document and builds
+the whole resource tree on every call. Here:
+
+  * the discovery documents bundled with google-api-python-client are
+    loaded and parsed once per process (build_service);
+  * per-user Credentials and the Gmail/Calendar services built from them
+    are kept in a bounded LRU (ServiceCache) for GOOGLE_CLIENT_CACHE_TTL_SEC.
+    Credentials are shared by reference, so a refresh by any request
+    updates them in place for every later one.
+
+Cached services are shared between threads (FastAPI workers, scheduler
+jobs); all of them send requests through the thread-safe, pooled transport
+in http_transport.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Tuple
+
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+
+from config import GOOGLE_CLIENT_CACHE_ENTRIES, GOOGLE_CLIENT_CACHE_TTL_SEC
+from http_transport import authorized_http
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _discovery_doc(service_name: str, version: str) -> Dict[str, Any] | None:
+    doc = discovery_cache.get_static_doc(service_name, version)
+    if doc is None:
+        logger.warning("No bundled discovery document for %s %s", service_name, version)
+        return None
+    return json.loads(doc)
+
+
+def build_service(service_name: str, version: str, credentials: Any) -> Any:
+    """Build an API client from the bundled discovery document, parsed once per process.
+
+    The client sends its requests over the shared pooled transport.
+    """
+    http = authorized_http(credentials)
+    doc = _discovery_doc(service_name, version)
+    if doc is None:
+        return build(service_name, version, http=http)
+    return build_from_document(doc, http=http)
+
+
+def cache_key(token_json: dict) -> str:
+    """Stable key for a stored token: its refresh token, or the whole token if there is none."""
+    material = token_json.get("refresh_token") or json.dumps(token_json, sort_keys=True)
+    return hashlib.sha256(f"{token_json.get('client_id')}|{material}".encode("utf-8")).hexdigest()
+
+
+class ServiceCache:
+    """Thread-safe LRU of (credentials, gmail, calendar) with a per-entry TTL."""
+
+    def __init__(
+        self,
+        max_entries: int = GOOGLE_CLIENT_CACHE_ENTRIES,
+        ttl_sec: int = GOOGLE_CLIENT_CACHE_TTL_SEC,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Any, Any, Any]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def get(self, key: str, make_credentials: Callable[[], Any]) -> Tuple[Any, Any, Any]:
+        """Return (credentials, gmail, calendar) for ``key``, building them on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl_sec:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry[1], entry[2], entry[3]
+            self.counters["misses"] += 1
+
+        # Build outside the lock; concurrent misses for one user just build twice
+        creds = make_credentials()
+        gmail = build_service("gmail", "v1", creds)
+        calendar = build_service("calendar", "v3", creds)
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = (now, creds, gmail, calendar)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.counters["evicted"] += 1
+        return creds, gmail, calendar
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+# Process-wide cache used by auth and auth_web
+clients = ServiceCache()
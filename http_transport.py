@@ -0,0 +1,126 @@
+"""Process-wide pooled HTTP transport for Google API and OAuth calls.
+
+googleapiclient and google_auth_httplib2 expect an httplib2.Http, which
+keeps one connection per host per instance and is not thread-safe, so
+every client used to open its own TLS connections. PooledHttp offers the
+same request() interface on top of a single requests.Session:
+
+  * keep-alive connections (GOOGLE_HTTP_POOL_SIZE per host) and TLS
+    sessions are reused across users, threads and calls;
+  * connect/read timeouts come from GOOGLE_HTTP_CONNECT_TIMEOUT_SEC and
+    GOOGLE_HTTP_READ_TIMEOUT_SEC;
+  * responses are gzip-compressed (Google APIs also need "gzip" in the
+    User-Agent) and decoded transparently;
+  * the session stores no cookies, so nothing leaks between users.
+
+Transport errors are raised as the builtin TimeoutError/ConnectionError
+that googleapiclient retries on. Use authorized_http() for API clients and
+auth_request() for google.auth credential refreshes.
+"""
+
+import http.cookiejar
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import google_auth_httplib2
+import httplib2
+import requests
+from google.auth.transport.requests import Request as AuthRequest
+from requests.adapters import HTTPAdapter
+
+from config import GOOGLE_HTTP_CONNECT_TIMEOUT_SEC, GOOGLE_HTTP_POOL_SIZE, GOOGLE_HTTP_READ_TIMEOUT_SEC
+
+logger = logging.getLogger(__name__)
+
+# httplib2 only follows redirects for these methods
+_REDIRECT_METHODS = ("GET", "HEAD")
+
+
+def _new_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+class PooledHttp:
+    """Thread-safe, httplib2.Http-compatible client over a pooled requests.Session."""
+
+    def __init__(
+        self,
+        pool_size: int = GOOGLE_HTTP_POOL_SIZE,
+        connect_timeout: float = GOOGLE_HTTP_CONNECT_TIMEOUT_SEC,
+        read_timeout: float = GOOGLE_HTTP_READ_TIMEOUT_SEC,
+    ) -> None:
+        self.session = _new_session(pool_size)
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        # Attributes google_auth_httplib2.AuthorizedHttp proxies to httplib2.Http
+        self.connections: Dict[str, Any] = {}
+        self.follow_redirects = True
+        self.redirect_codes = frozenset((300, 301, 302, 303, 307, 308))
+
+    def request(
+        self,
+        uri: str,
+        method: str = "GET",
+        body: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        redirections: int = 5,
+        connection_type: Any = None,
+    ) -> Tuple[httplib2.Response, bytes]:
+        """Send a request and return (httplib2.Response, content) like httplib2.Http."""
+        headers = dict(headers or {})
+        agent_key = next((k for k in headers if k.lower() == "user-agent"), "user-agent")
+        agent = headers.get(agent_key, "")
+        if "gzip" not in agent:
+            headers[agent_key] = f"{agent} (gzip)".strip()
+        try:
+            resp = self.session.request(
+                method, uri, data=body, headers=headers, timeout=self.timeout,
+                allow_redirects=self.follow_redirects and method in _REDIRECT_METHODS,
+            )
+        except requests.Timeout as exc:
+            raise TimeoutError(str(exc)) from exc
+        except requests.ConnectionError as exc:
+            raise ConnectionError(str(exc)) from exc
+
+        content = resp.content
+        info = {key.lower(): value for key, value in resp.headers.items()}
+        if "content-encoding" in info:
+            # Body is already decoded; report it the way httplib2 does
+            info["-content-encoding"] = info.pop("content-encoding")
+            info["content-length"] = str(len(content))
+        info["status"] = str(resp.status_code)
+        response = httplib2.Response(info)
+        response.reason = resp.reason
+        return response, content
+
+    def close(self) -> None:
+        """No-op: the pool is shared by every client in the process."""
+
+
+_shared: Optional[PooledHttp] = None
+_shared_lock = threading.Lock()
+
+
+def shared_http() -> PooledHttp:
+    """The process-wide PooledHttp."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = PooledHttp()
+        return _shared
+
+
+def authorized_http(credentials: Any) -> google_auth_httplib2.AuthorizedHttp:
+    """AuthorizedHttp for ``credentials`` on the shared pool."""
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=shared_http())
+
+
+def auth_request() -> AuthRequest:
+    """google.auth transport Request (for Credentials.refresh) on the shared pool."""
+    return AuthRequest(session=shared_http().session)
@@ -1,9 +1,11 @@
+import argparse
 import logging
 import sys
+from datetime import date
 
 from auth import authenticate
 from calendar_manager import create_event
-from daily_plan import get_today_schedule
+from daily_plan import get_today_schedule, iter_agenda, render_agenda
 from gmail_reader import fetch_emails
 from notifier import send_whatsapp
 from email_parser import parse_email_with_gemini
@@ -32,7 +34,7 @@ def run_assistant() -> None:
 
     # --- Fetch and Process Emails ---
     logger.info("Fetching and processing emails...")
-    emails = fetch_emails(gmail)
+    emails = fetch_emails(gmail, attachments="none")
 
     if not emails:
         logger.info("No new emails to process.")
@@ -55,7 +57,10 @@ def run_assistant() -> None:
                 if intent == "Event Scheduling":
                     logger.info("Event Scheduling intent detected. Attempting to create calendar event.")
                     try:
-                        create_event(calendar, subject, body)
+                        create_event(
+                            calendar, subject, body,
+                            message_id=email.get("id"), date_header=email.get("date"),
+                        )
                     except Exception as exc:
                         logger.error("Failed to create event for email '%s': %s", subject, exc)
             else:
@@ -70,9 +75,37 @@ def run_assistant() -> None:
     logger.info("All tasks complete")
 
 
-if __name__ == "__main__":
+def print_agenda(days: int, start: date | None = None, query: str | None = None) -> None:
+    """Print the agenda for ``days`` local days starting at ``start`` (default today)."""
     try:
+        _, calendar = authenticate()
+    except Exception as exc:
+        logger.error("Authentication failed: %s", exc)
+        return
+    try:
+        print(render_agenda(iter_agenda(calendar, start, days, query=query)))
+    except RuntimeError as exc:
+        logger.error("Could not load the agenda: %s", exc)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Email-to-calendar assistant")
+    parser.add_argument("--agenda", type=int, metavar="DAYS",
+                        help="print the agenda for the next DAYS days instead of running the assistant")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="first day of the agenda (default: today)")
+    parser.add_argument("--query", help="only list events whose title contains this text")
+    args = parser.parse_args()
+
+    if args.agenda is not None:
+        print_agenda(args.agenda, args.start, args.query)
+    else:
         run_assistant()
+
+
+if __name__ == "__main__":
+    try:
+        main()
     except KeyboardInterrupt:
         logger.info("Interrupted by user; exiting.")
         sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,168 @@
+"""Per-user store of Gmail message IDs that have already been processed.
+
+Rows live in the ``processed_messages`` table keyed by (user_id, message_id),
+so membership checks are primary-key lookups and every account is deduplicated
+independently.
+"""
+
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+
+from config import SEEN_IDS_MAX_AGE_DAYS, SEEN_IDS_MAX_PER_USER
+from models import ProcessedMessage, Session
+
+logger = logging.getLogger(__name__)
+
+# Identity used by the single-user CLI (main.py / app.py)
+DEFAULT_USER_ID = "default"
+
+# Keep IN (...) lists well below SQLite's bound-parameter limit
+_CHUNK_SIZE = 500
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _chunks(items: List[str]) -> Iterable[List[str]]:
+    for start in range(0, len(items), _CHUNK_SIZE):
+        yield items[start:start + _CHUNK_SIZE]
+
+
+def filter_unseen(user_id: str, message_ids: Iterable[str]) -> List[str]:
+    """Return the IDs from ``message_ids`` not yet processed for ``user_id``.
+
+    Input order is preserved.
+    """
+    ids = list(dict.fromkeys(message_ids))
+    if not ids:
+        return []
+
+    seen = set()
+    db = Session()
+    try:
+        for chunk in _chunks(ids):
+            rows = db.execute(
+                select(ProcessedMessage.message_id).where(
+                    ProcessedMessage.user_id == user_id,
+                    ProcessedMessage.message_id.in_(chunk),
+                )
+            )
+            seen.update(row[0] for row in rows)
+    finally:
+        db.close()
+
+    return [msg_id for msg_id in ids if msg_id not in seen]
+
+
+def mark_processed(user_id: str, message_ids: Iterable[str]) -> None:
+    """Record message IDs as processed for ``user_id`` in a single transaction."""
+    ids = list(dict.fromkeys(message_ids))
+    if not ids:
+        return
+
+    now = _utcnow()
+    db = Session()
+    try:
+        for chunk in _chunks(ids):
+            stmt = insert(ProcessedMessage).values(
+                [{"user_id": user_id, "message_id": msg_id, "processed_at": now} for msg_id in chunk]
+            )
+            db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "message_id"]))
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not record processed messages for %s: %s", user_id, exc)
+    finally:
+        db.close()
+
+
+def evict(
+    user_id: str,
+    max_age_days: int | None = None,
+    max_entries: int | None = None,
+) -> int:
+    """Drop old entries for ``user_id`` and cap how many are kept.
+
+    Entries older than ``max_age_days`` are removed, then only the newest
+    ``max_entries`` are kept. Defaults come from SEEN_IDS_MAX_AGE_DAYS and
+    SEEN_IDS_MAX_PER_USER; a value of 0 disables that limit.
+
+    Returns the number of rows deleted.
+    """
+    if max_age_days is None:
+        max_age_days = SEEN_IDS_MAX_AGE_DAYS
+    if max_entries is None:
+        max_entries = SEEN_IDS_MAX_PER_USER
+
+    deleted = 0
+    db = Session()
+    try:
+        if max_age_days > 0:
+            cutoff = _utcnow() - timedelta(days=max_age_days)
+            result = db.execute(
+                delete(ProcessedMessage).where(
+                    ProcessedMessage.user_id == user_id,
+                    ProcessedMessage.processed_at < cutoff,
+                )
+            )
+            deleted += result.rowcount or 0
+
+        if max_entries > 0:
+            keep = (
+                select(ProcessedMessage.message_id)
+                .where(ProcessedMessage.user_id == user_id)
+                .order_by(ProcessedMessage.processed_at.desc())
+                .limit(max_entries)
+            )
+            result = db.execute(
+                delete(ProcessedMessage).where(
+                    ProcessedMessage.user_id == user_id,
+                    ProcessedMessage.message_id.not_in(keep),
+                )
+            )
+            deleted += result.rowcount or 0
+
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not evict processed messages for %s: %s", user_id, exc)
+    finally:
+        db.close()
+
+    if deleted:
+        logger.debug("Evicted %d processed message ID(s) for %s", deleted, user_id)
+    return deleted
+
+
+def import_legacy_json(path: str, user_id: str = DEFAULT_USER_ID) -> int:
+    """One-time import of a legacy ``.seen_email_ids.json`` file.
+
+    The IDs are recorded for ``user_id`` and the file is renamed with a
+    ``.migrated`` suffix so it is not imported again. Returns the number of
+    IDs read from the file.
+    """
+    if not os.path.exists(path):
+        return 0
+
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            ids = [str(msg_id) for msg_id in json.load(fh)]
+    except Exception as exc:
+        logger.warning("Could not read legacy seen-ID file %s: %s", path, exc)
+        return 0
+
+    mark_processed(user_id, ids)
+    try:
+        os.replace(path, path + ".migrated")
+    except OSError as exc:
+        logger.warning("Could not rename legacy seen-ID file %s: %s", path, exc)
+
+    logger.info("Imported %d legacy seen email ID(s) for %s", len(ids), user_id)
+    return len(ids)
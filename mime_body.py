@@ -0,0 +1,193 @@
+"""Extract a compact plain-text body from a Gmail message payload.
+
+The body goes into the Gemini prompt and into date parsing, so it should hold
+the useful content, not the raw message. extract_body:
+
+  * walks nested multiparts and picks the first inline text/plain part,
+    falling back to text/html;
+  * converts HTML to text with a streaming HTMLParser that drops
+    script/style/head content and stops once it has enough text;
+  * cuts quoted replies ("On ... wrote:", "-----Original Message-----",
+    "> " lines) and signatures ("-- ", "Sent from my ...");
+  * truncates the result to a character budget (EMAIL_BODY_MAX_CHARS).
+"""
+
+import base64
+import re
+from html.parser import HTMLParser
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import EMAIL_BODY_MAX_CHARS
+
+# HTML is fed to the parser in chunks of this many characters
+_HTML_CHUNK = 8192
+
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript", "template"}
+_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt",
+    "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "ol",
+    "p", "pre", "section", "table", "td", "th", "tr", "ul",
+}
+
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+
+# A line that starts quoted history; everything from it on is dropped
+_REPLY_MARKER_RE = re.compile(
+    r"^(?:"
+    r"On\s.{1,200}?\swrote:\s*$"
+    r"|-{2,}\s*Original Message\s*-{2,}"
+    r"|_{10,}\s*$"
+    r")",
+    re.IGNORECASE | re.MULTILINE,
+)
+# A line that starts the sender's signature
+_SIGNATURE_RE = re.compile(
+    r"^(?:--\s*$|Sent from my \w+|Get Outlook for \w+)",
+    re.IGNORECASE | re.MULTILINE,
+)
+_QUOTED_LINE_RE = re.compile(r"^[ \t]*>.*(?:\n|$)", re.MULTILINE)
+_TRAILING_SPACE_RE = re.compile(r"[ \t\r\f\v]+\n")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_INLINE_SPACE_RE = re.compile(r"[ \t\f\v]{2,}")
+
+
+class _HTMLToText(HTMLParser):
+    """Collects the visible text of an HTML document, one chunk at a time."""
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.length = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self._append("\n")
+
+    def handle_data(self, data: str) -> None:
+        if not self._skip_depth:
+            self._append(data)
+
+    def _append(self, text: str) -> None:
+        self.parts.append(text)
+        self.length += len(text)
+
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+def html_to_text(html: str, limit: int = 0) -> str:
+    """Convert HTML to plain text, stopping after about ``limit`` characters (0 = all)."""
+    parser = _HTMLToText()
+    for start in range(0, len(html), _HTML_CHUNK):
+        parser.feed(html[start:start + _HTML_CHUNK])
+        if limit and parser.length >= limit:
+            break
+    else:
+        parser.close()
+    return parser.text()
+
+
+def _part_charset(part: Dict[str, Any]) -> str:
+    for header in part.get("headers", []) or []:
+        if header.get("name", "").lower() == "content-type":
+            match = _CHARSET_RE.search(header.get("value", ""))
+            if match:
+                return match.group(1)
+    return "utf-8"
+
+
+def _decode_part(part: Dict[str, Any]) -> str:
+    data = part.get("body", {}).get("data")
+    if not data:
+        return ""
+    raw = base64.urlsafe_b64decode(data)
+    try:
+        return raw.decode(_part_charset(part), errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _find_text_parts(payload: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Depth-first search for the first inline text/plain and text/html parts."""
+    plain: Optional[Dict[str, Any]] = None
+    html: Optional[Dict[str, Any]] = None
+    stack = [payload]
+    while stack and plain is None:
+        part = stack.pop()
+        subparts = part.get("parts")
+        if subparts:
+            stack.extend(reversed(subparts))
+            continue
+        if part.get("filename") or not part.get("body", {}).get("data"):
+            continue
+        mime_type = part.get("mimeType", "")
+        if mime_type == "text/plain":
+            plain = part
+        elif mime_type == "text/html" and html is None:
+            html = part
+    return plain, html
+
+
+def strip_quotes_and_signature(text: str) -> str:
+    """Drop quoted reply history, "> " lines and a trailing signature."""
+    match = _REPLY_MARKER_RE.search(text)
+    if match and text[:match.start()].strip():
+        text = text[:match.start()]
+
+    text = _QUOTED_LINE_RE.sub("", text)
+
+    match = _SIGNATURE_RE.search(text)
+    if match and text[:match.start()].strip():
+        text = text[:match.start()]
+    return text
+
+
+def _normalise_whitespace(text: str) -> str:
+    text = text.replace("\r\n", "\n").replace("\xa0", " ")
+    text = _INLINE_SPACE_RE.sub(" ", text)
+    text = _TRAILING_SPACE_RE.sub("\n", text)
+    text = _BLANK_LINES_RE.sub("\n\n", text)
+    return text.strip()
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Cut ``text`` to at most ``max_chars``, preferring a word boundary."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", max_chars // 2, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip()
+
+
+def extract_body(payload: Dict[str, Any], max_chars: int | None = None) -> str:
+    """Return the cleaned plain-text body of a Gmail message payload.
+
+    Parameters
+    ----------
+    payload: The ``payload`` of a Gmail message fetched with format="full".
+    max_chars: Character budget for the result. Defaults to
+        EMAIL_BODY_MAX_CHARS; 0 disables truncation.
+    """
+    if max_chars is None:
+        max_chars = EMAIL_BODY_MAX_CHARS
+
+    plain, html = _find_text_parts(payload)
+    if plain is not None:
+        text = _decode_part(plain)
+    elif html is not None:
+        # Quote/signature stripping only removes text, so stop converting
+        # comfortably past the budget.
+        text = html_to_text(_decode_part(html), limit=max_chars * 2 if max_chars else 0)
+    else:
+        return ""
+
+    text = strip_quotes_and_signature(text)
+    return truncate(_normalise_whitespace(text), max_chars)
@@ -1,7 +1,7 @@
 """SQLAlchemy models for multi-user Personal Assistant service."""
 
 import json
-from sqlalchemy import Column, String, JSON, create_engine
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, JSON, Text, create_engine, inspect, text
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 Base = declarative_base()
@@ -23,6 +23,173 @@ class User(Base):
         return f"<User id={self.id!r} email={self.email!r} notify_time={self.notify_time!r}>"
 
 
+class UserAuthState(Base):
+    """Per-user OAuth health: last token write-back and whether re-consent is needed."""
+
+    __tablename__ = "user_auth_state"
+
+    user_id      = Column(String, primary_key=True)
+    needs_reauth = Column(Boolean, nullable=False, default=False)  # refresh token revoked/expired
+    last_error   = Column(Text, nullable=True)
+    flagged_at   = Column(DateTime, nullable=True)
+    refreshed_at = Column(DateTime, nullable=True)   # last refreshed token saved to users
+
+    def __repr__(self) -> str:
+        return f"<UserAuthState user_id={self.user_id!r} needs_reauth={self.needs_reauth!r}>"
+
+
+class GmailSyncState(Base):
+    """Per-user Gmail historyId checkpoint used for incremental email sync."""
+
+    __tablename__ = "gmail_sync_state"
+
+    user_id    = Column(String, primary_key=True)   # User.id, or "default" for single-user mode
+    query      = Column(String, nullable=False)     # Gmail query the checkpoint was taken for
+    history_id = Column(String, nullable=False)     # mailbox historyId at the last sync
+    synced_at  = Column(DateTime, nullable=False)   # UTC time of the last sync
+
+    def __repr__(self) -> str:
+        return f"<GmailSyncState user_id={self.user_id!r} history_id={self.history_id!r}>"
+
+
+class ProcessedMessage(Base):
+    """A Gmail message that has already been processed for a given user."""
+
+    __tablename__ = "processed_messages"
+    __table_args__ = (
+        Index("ix_processed_messages_user_time", "user_id", "processed_at"),
+    )
+
+    user_id      = Column(String, primary_key=True)   # User.id, or "default" for single-user mode
+    message_id   = Column(String, primary_key=True)   # Gmail message ID
+    processed_at = Column(DateTime, nullable=False)   # UTC time it was marked processed
+
+    def __repr__(self) -> str:
+        return f"<ProcessedMessage user_id={self.user_id!r} message_id={self.message_id!r}>"
+
+
+class AttachmentBlob(Base):
+    """Attachment bytes stored once on disk, keyed by decoded size + SHA-256."""
+
+    __tablename__ = "attachment_blobs"
+
+    key            = Column(String, primary_key=True)   # "<size>-<sha256 hex>"
+    size           = Column(Integer, nullable=False)
+    mime_type      = Column(String, nullable=True)
+    path           = Column(String, nullable=False)     # blob file on local disk
+    extracted      = Column(Boolean, default=False)     # extraction has been attempted
+    extracted_text = Column(Text, nullable=True)        # e.g. PDF text for Gemini
+    created_at     = Column(DateTime, nullable=False)
+    last_access    = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<AttachmentBlob key={self.key!r} size={self.size!r}>"
+
+
+class AttachmentRef(Base):
+    """Points one attachment part of a user's message at its stored blob."""
+
+    __tablename__ = "attachment_refs"
+
+    user_id    = Column(String, primary_key=True)
+    message_id = Column(String, primary_key=True)
+    part_id    = Column(String, primary_key=True)   # Gmail partId (attachmentId is not stable)
+    blob_key   = Column(String, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<AttachmentRef message_id={self.message_id!r} part_id={self.part_id!r}>"
+
+
+class AnalysisCacheEntry(Base):
+    """Cached Gemini analysis keyed by (model, prompt version, normalized body hash)."""
+
+    __tablename__ = "analysis_cache"
+
+    key            = Column(String, primary_key=True)   # sha256 of model|prompt_version|body_hash
+    model          = Column(String, nullable=False)
+    prompt_version = Column(String, nullable=False)
+    result_json    = Column(JSON, nullable=False)       # parsed Gemini response
+    created_at     = Column(DateTime, nullable=False, index=True)
+    last_access    = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<AnalysisCacheEntry key={self.key!r} model={self.model!r}>"
+
+
+class CreatedEvent(Base):
+    """Maps an event source (Gmail message or content fingerprint) to the Calendar event created for it."""
+
+    __tablename__ = "created_events"
+
+    user_id     = Column(String, primary_key=True)   # User.id, or "default" for single-user mode
+    source_key  = Column(String, primary_key=True)   # "msg:<gmail id>" or "fp:<sha256>"
+    calendar_id = Column(String, nullable=False)
+    event_id    = Column(String, nullable=False)     # deterministic Calendar event ID
+    created_at  = Column(DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<CreatedEvent user_id={self.user_id!r} source_key={self.source_key!r} event_id={self.event_id!r}>"
+
+
+class CalendarEventMirror(Base):
+    """Local copy of one Google Calendar event, kept fresh by syncToken sync."""
+
+    __tablename__ = "calendar_events"
+    __table_args__ = (
+        Index("ix_calendar_events_user_start", "user_id", "calendar_id", "start_at"),
+    )
+
+    user_id     = Column(String, primary_key=True)   # User.id, or "default" for single-user mode
+    calendar_id = Column(String, primary_key=True)
+    event_id    = Column(String, primary_key=True)
+    summary     = Column(String, nullable=True)
+    start_at    = Column(DateTime, nullable=False)   # UTC; local midnight for all-day events
+    end_at      = Column(DateTime, nullable=False)
+    all_day     = Column(Boolean, default=False)
+    raw         = Column(JSON, nullable=False)       # full event resource
+    updated_at  = Column(DateTime, nullable=False)   # UTC time of the last sync touching it
+
+    def __repr__(self) -> str:
+        return f"<CalendarEventMirror event_id={self.event_id!r} start_at={self.start_at!r}>"
+
+
+class CalendarSyncState(Base):
+    """Per-user, per-calendar syncToken checkpoint for the local mirror."""
+
+    __tablename__ = "calendar_sync_state"
+
+    user_id     = Column(String, primary_key=True)
+    calendar_id = Column(String, primary_key=True)
+    sync_token  = Column(String, nullable=True)
+    synced_at   = Column(DateTime, nullable=True)    # None forces a sync on the next read
+    version     = Column(Integer, nullable=False, default=0)  # bumped when mirrored events change
+    window_end  = Column(DateTime, nullable=True)    # UTC timeMax of the last full sync
+
+    def __repr__(self) -> str:
+        return f"<CalendarSyncState user_id={self.user_id!r} synced_at={self.synced_at!r}>"
+
+
+class TokenUsage(Base):
+    """Input/output tokens and latency of one Gemini call."""
+
+    __tablename__ = "token_usage"
+    __table_args__ = (
+        Index("ix_token_usage_user_time", "user_id", "created_at"),
+    )
+
+    id            = Column(Integer, primary_key=True, autoincrement=True)
+    user_id       = Column(String, nullable=False)    # User.id, or "default" for single-user mode
+    model         = Column(String, nullable=False)
+    call_type     = Column(String, nullable=False)    # "single" or "batch"
+    input_tokens  = Column(Integer, nullable=False)
+    output_tokens = Column(Integer, nullable=False)
+    latency_ms    = Column(Integer, nullable=False)
+    created_at    = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<TokenUsage user_id={self.user_id!r} model={self.model!r} input={self.input_tokens!r}>"
+
+
 # SQLite database stored next to this file
 engine = create_engine(
     "sqlite:///users.db",
@@ -30,4 +197,14 @@ engine = create_engine(
 )
 Base.metadata.create_all(engine)
 
+# create_all() does not alter existing tables; add columns introduced later
+_ADDED_COLUMNS = [
+    ("calendar_sync_state", "version", "INTEGER NOT NULL DEFAULT 0"),
+    ("calendar_sync_state", "window_end", "DATETIME"),
+]
+for _table, _column, _ddl in _ADDED_COLUMNS:
+    if _column not in {col["name"] for col in inspect(engine).get_columns(_table)}:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {_table} ADD COLUMN {_column} {_ddl}"))
+
 Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
@@ -0,0 +1,187 @@
+"""PDF text extraction in a worker process pool with an on-disk cache.
+
+pypdf parsing is CPU-bound and can take arbitrarily long on large or
+malformed files, so it runs in a small ProcessPoolExecutor instead of the
+fetching thread. Each call is bounded by PDF_TIMEOUT_SEC, PDF_MAX_PAGES and
+PDF_MAX_CHARS. Successful results are cached on disk under the SHA-256 of the
+PDF bytes, so the same attachment forwarded to many users is parsed once.
+"""
+
+import hashlib
+import io
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from config import PDF_CACHE_DIR, PDF_MAX_CHARS, PDF_MAX_PAGES, PDF_TIMEOUT_SEC, PDF_WORKERS
+
+try:
+    import pypdf
+    _PYPDF_AVAILABLE = True
+except ImportError:  # pragma: no cover
+    _PYPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# Extractions submitted and not finished yet; sizes the timeout to the queue
+_pending = 0
+
+
+def _extract_worker(content: bytes, max_pages: int, max_chars: int) -> str:
+    """Runs in a worker process: extract text from at most ``max_pages`` pages."""
+    reader = pypdf.PdfReader(io.BytesIO(content))
+    chunks = []
+    total = 0
+    for page in reader.pages[:max_pages]:
+        text = page.extract_text() or ""
+        chunks.append(text)
+        total += len(text) + 1
+        if total >= max_chars:
+            break
+    return "\n".join(chunks)[:max_chars]
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn avoids forking a process that already runs scheduler/web threads
+            _pool = ProcessPoolExecutor(
+                max_workers=max(1, PDF_WORKERS),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool(expected: Optional[ProcessPoolExecutor] = None) -> None:
+    """Tear down the pool, killing workers stuck on a pathological PDF.
+
+    With ``expected``, only if that is still the current pool, so a thread
+    that saw an old pool break does not tear down its replacement.
+    """
+    global _pool
+    with _pool_lock:
+        if expected is not None and _pool is not expected:
+            return
+        pool, _pool = _pool, None
+    if pool is None:
+        return
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def shutdown() -> None:
+    """Stop the worker pool (e.g. on application exit)."""
+    _reset_pool()
+
+
+def _cache_path(digest: str, max_pages: int, max_chars: int) -> str:
+    return os.path.join(PDF_CACHE_DIR, digest[:2], f"{digest}-{max_pages}-{max_chars}.txt")
+
+
+def _read_cache(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return fh.read()
+    except OSError:
+        return None
+
+
+def _write_cache(path: str, text: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                fh.write(text)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as exc:
+        logger.warning("Could not write PDF text cache %s: %s", path, exc)
+
+
+def extract_pdf_text(
+    content: bytes,
+    filename: str = "",
+    timeout: float | None = None,
+    max_pages: int | None = None,
+    max_chars: int | None = None,
+    use_cache: bool = True,
+) -> Optional[str]:
+    """Extract text from a PDF, or None if it cannot be read in time.
+
+    Parameters
+    ----------
+    content: Raw PDF bytes.
+    filename: Used only for log messages.
+    timeout: Seconds the extraction may take. Defaults to PDF_TIMEOUT_SEC.
+        When other extractions are queued ahead of it, the wait grows by
+        one timeout per PDF_WORKERS of them.
+    max_pages: Maximum number of pages to read. Defaults to PDF_MAX_PAGES.
+    max_chars: Maximum length of the returned text. Defaults to PDF_MAX_CHARS.
+    use_cache: Read and write the on-disk text cache. Callers that cache the
+        result themselves (attachment_store) pass False.
+    """
+    if not _PYPDF_AVAILABLE:
+        return None
+    if timeout is None:
+        timeout = PDF_TIMEOUT_SEC
+    if max_pages is None:
+        max_pages = PDF_MAX_PAGES
+    if max_chars is None:
+        max_chars = PDF_MAX_CHARS
+
+    path = None
+    if use_cache:
+        digest = hashlib.sha256(content).hexdigest()
+        path = _cache_path(digest, max_pages, max_chars)
+        cached = _read_cache(path)
+        if cached is not None:
+            logger.debug("PDF text cache hit for '%s' (%s)", filename, digest[:12])
+            return cached
+
+    global _pending
+    for attempt in range(2):
+        pool = _get_pool()
+        with _pool_lock:
+            _pending += 1
+            depth = _pending
+        try:
+            future = pool.submit(_extract_worker, content, max_pages, max_chars)
+            text = future.result(timeout=timeout * math.ceil(depth / max(1, PDF_WORKERS)))
+        except FutureTimeoutError:
+            logger.warning("PDF extraction for '%s' timed out after %ss", filename, timeout)
+            _reset_pool(pool)
+            return None
+        except BrokenProcessPool as exc:
+            if attempt == 0 and _pool is not pool:
+                # Another thread reset the pool under this job; run it on the new one
+                continue
+            logger.warning("PDF worker pool crashed on '%s': %s", filename, exc)
+            _reset_pool(pool)
+            return None
+        except Exception as exc:
+            logger.warning("Could not extract text from PDF '%s': %s", filename, exc)
+            return None
+        finally:
+            with _pool_lock:
+                _pending -= 1
+        break
+
+    if path is not None:
+        _write_cache(path, text)
+    return text
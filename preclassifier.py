@@ -0,0 +1,297 @@
+"""CPU-cheap email pre-classification in front of Gemini.
+
+Most traffic is confidently classifiable without an LLM: newsletters,
+automated receipts and calendar-system invites. A PreClassifier runs a list
+of pluggable stages over an email dict (subject, from_, body, attachments).
+The first stage whose confidence reaches PRECLASSIFIER_THRESHOLD decides the
+intent; everything else is escalated to Gemini.
+
+Two stages ship by default:
+
+  * RuleStage - hand-written rules for invites, receipts and newsletters.
+  * NaiveBayesStage - a multinomial naive Bayes model trained online from
+    Gemini's own labels and persisted as JSON at PRECLASSIFIER_MODEL_PATH.
+    It only votes after PRECLASSIFIER_MIN_SAMPLES labelled emails, never for
+    Event Scheduling, and only when most tokens are known and the log-odds
+    margin is clear; a random PRECLASSIFIER_NB_EXPLORE_RATE share of those
+    emails is still escalated so the model keeps learning.
+
+Extra stages can be added with ``preclassifier.add_stage(stage)``. A stage is
+any object with a ``name`` attribute and a
+``classify(email) -> Optional[Tuple[intent, confidence, reason]]`` method.
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    PRECLASSIFIER_ENABLED,
+    PRECLASSIFIER_MIN_SAMPLES,
+    PRECLASSIFIER_MODEL_PATH,
+    PRECLASSIFIER_NB_EXPLORE_RATE,
+    PRECLASSIFIER_NB_MIN_KNOWN,
+    PRECLASSIFIER_NB_MIN_MARGIN,
+    PRECLASSIFIER_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+EVENT_INTENT = "Event Scheduling"
+INFO_INTENT = "Information Sharing"
+
+# (intent, confidence, reason)
+Decision = Tuple[str, float, str]
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9']{1,24}")
+
+_INVITE_SUBJECT_RE = re.compile(r"^(?:updated\s+)?invitation:|^invitation from|^accepted:|^new event:", re.I)
+_CALENDAR_SENDER_RE = re.compile(r"calendar-notification@google\.com|noreply@zoom\.us|calendly\.com", re.I)
+_RECEIPT_SUBJECT_RE = re.compile(
+    r"\b(?:receipt|invoice|order\s+(?:#|confirmation|confirmed)|your order|payment (?:received|confirmation)"
+    r"|has shipped|out for delivery|delivered)\b",
+    re.I,
+)
+_AUTOMATED_SENDER_RE = re.compile(r"\b(?:no-?reply|donotreply|newsletter|news|digest|mailer|notifications?)@", re.I)
+_UNSUBSCRIBE_RE = re.compile(r"\bunsubscribe\b|\bmanage (?:your )?(?:email )?preferences\b", re.I)
+_MEETING_WORDS_RE = re.compile(
+    r"\b(?:meeting|meet|webinar|appointment|interview|call|invite|invitation|rsvp|register|schedule[ds]?)\b",
+    re.I,
+)
+
+
+class RuleStage:
+    """Hand-written rules for the common, unambiguous automated emails."""
+
+    name = "rules"
+
+    def classify(self, email: Dict[str, Any]) -> Optional[Decision]:
+        subject = email.get("subject", "") or ""
+        sender = email.get("from_", "") or ""
+        body = email.get("body", "") or ""
+
+        # Calendar-system invites
+        for att in email.get("attachments", []) or []:
+            mime_type = att.get("mime_type", "") or ""
+            filename = (att.get("filename", "") or "").lower()
+            if mime_type == "text/calendar" or filename.endswith(".ics"):
+                return EVENT_INTENT, 0.97, "calendar attachment"
+        if "BEGIN:VCALENDAR" in body:
+            return EVENT_INTENT, 0.97, "inline iCalendar data"
+        if _INVITE_SUBJECT_RE.search(subject) and _CALENDAR_SENDER_RE.search(sender):
+            return EVENT_INTENT, 0.95, "calendar system invite"
+
+        # Receipts and shipping notifications
+        if _RECEIPT_SUBJECT_RE.search(subject) and not _MEETING_WORDS_RE.search(subject):
+            confidence = 0.95 if _AUTOMATED_SENDER_RE.search(sender) else 0.9
+            return INFO_INTENT, confidence, "receipt or order notification"
+
+        # Bulk newsletters with nothing that looks like an invitation
+        if _UNSUBSCRIBE_RE.search(body) and not _MEETING_WORDS_RE.search(subject + " " + body[:2000]):
+            confidence = 0.93 if _AUTOMATED_SENDER_RE.search(sender) else 0.85
+            return INFO_INTENT, confidence, "newsletter"
+
+        return None
+
+
+def _tokens(email: Dict[str, Any]) -> List[str]:
+    text = " ".join((
+        email.get("subject", "") or "",
+        email.get("from_", "") or "",
+        (email.get("body", "") or "")[:4000],
+    ))
+    return _TOKEN_RE.findall(text.lower())
+
+
+class NaiveBayesStage:
+    """Multinomial naive Bayes over subject/sender/body tokens.
+
+    Trained online from Gemini labels through learn(), and saved to ``path``
+    every ``save_every`` updates. Raw naive Bayes posteriors are
+    overconfident, so classify() only decides non-event intents, and only
+    when at least ``min_known`` of the tokens are in the vocabulary and the
+    average per-token log-odds margin over the runner-up is ``min_margin``.
+    """
+
+    name = "naive_bayes"
+
+    def __init__(self, path: str = PRECLASSIFIER_MODEL_PATH, min_samples: int = PRECLASSIFIER_MIN_SAMPLES,
+                 save_every: int = 25, min_known: float = PRECLASSIFIER_NB_MIN_KNOWN,
+                 min_margin: float = PRECLASSIFIER_NB_MIN_MARGIN,
+                 explore_rate: float = PRECLASSIFIER_NB_EXPLORE_RATE) -> None:
+        self.path = path
+        self.min_samples = min_samples
+        self.save_every = save_every
+        self.min_known = min_known
+        self.min_margin = min_margin
+        self.explore_rate = explore_rate
+        self._lock = threading.Lock()
+        self._class_docs: Counter = Counter()
+        self._class_tokens: Counter = Counter()
+        self._token_counts: Dict[str, Counter] = {}
+        self._vocab: set = set()
+        self._unsaved = 0
+        self.load()
+
+    @property
+    def samples(self) -> int:
+        return sum(self._class_docs.values())
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except Exception as exc:
+            logger.warning("Could not load pre-classifier model %s: %s", self.path, exc)
+            return
+        with self._lock:
+            self._class_docs = Counter(data.get("class_docs", {}))
+            self._token_counts = {c: Counter(t) for c, t in data.get("token_counts", {}).items()}
+            self._class_tokens = Counter({c: sum(t.values()) for c, t in self._token_counts.items()})
+            self._vocab = {tok for t in self._token_counts.values() for tok in t}
+
+    def save(self) -> None:
+        with self._lock:
+            data = {
+                "class_docs": dict(self._class_docs),
+                "token_counts": {c: dict(t) for c, t in self._token_counts.items()},
+            }
+            self._unsaved = 0
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                    json.dump(data, fh)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as exc:
+            logger.warning("Could not save pre-classifier model %s: %s", self.path, exc)
+
+    def learn(self, email: Dict[str, Any], intent: str) -> None:
+        """Add one labelled email to the model."""
+        tokens = _tokens(email)
+        if not tokens or not intent:
+            return
+        with self._lock:
+            self._class_docs[intent] += 1
+            counts = self._token_counts.setdefault(intent, Counter())
+            counts.update(tokens)
+            self._class_tokens[intent] += len(tokens)
+            self._vocab.update(tokens)
+            self._unsaved += 1
+            due = self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def classify(self, email: Dict[str, Any]) -> Optional[Decision]:
+        tokens = _tokens(email)
+        with self._lock:
+            total_docs = sum(self._class_docs.values())
+            if total_docs < self.min_samples or len(self._class_docs) < 2 or not tokens:
+                return None
+            known = sum(1 for tok in tokens if tok in self._vocab) / len(tokens)
+            if known < self.min_known:
+                return None
+            vocab_size = len(self._vocab) + 1
+            log_probs: Dict[str, float] = {}
+            for intent, docs in self._class_docs.items():
+                counts = self._token_counts.get(intent, Counter())
+                denom = self._class_tokens[intent] + vocab_size
+                score = math.log(docs / total_docs)
+                for tok in tokens:
+                    score += math.log((counts.get(tok, 0) + 1) / denom)
+                log_probs[intent] = score
+
+        ranked = sorted(log_probs, key=log_probs.get, reverse=True)
+        best = ranked[0]
+        top = log_probs[best]
+        margin = (top - log_probs[ranked[1]]) / len(tokens)
+        if best == EVENT_INTENT or margin < self.min_margin:
+            return None
+        if random.random() < self.explore_rate:
+            return None
+        norm = sum(math.exp(lp - top) for lp in log_probs.values())
+        return best, 1.0 / norm, f"naive bayes, margin {margin:.2f}"
+
+
+class PreClassifier:
+    """Runs stages in order and decides locally above ``threshold``."""
+
+    def __init__(self, stages: List[Any], threshold: float = PRECLASSIFIER_THRESHOLD) -> None:
+        self.stages = list(stages)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+    def add_stage(self, stage: Any, index: int | None = None) -> None:
+        """Register an extra stage (appended, or inserted at ``index``)."""
+        if index is None:
+            self.stages.append(stage)
+        else:
+            self.stages.insert(index, stage)
+
+    def classify(self, email: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return a Gemini-shaped result if a stage is confident, else None (escalate)."""
+        decision: Optional[Decision] = None
+        decided_by = None
+        for stage in self.stages:
+            try:
+                decision = stage.classify(email)
+            except Exception as exc:
+                logger.warning("Pre-classifier stage %s failed: %s", getattr(stage, "name", stage), exc)
+                decision = None
+            if decision is not None and decision[1] >= self.threshold:
+                decided_by = stage.name
+                break
+
+        with self._lock:
+            self.counters["total"] += 1
+            if decided_by is None:
+                self.counters["escalated"] += 1
+            else:
+                self.counters[f"decided_{decided_by}"] += 1
+        if decided_by is None:
+            return None
+
+        intent, confidence, reason = decision
+        return {
+            "intent": intent,
+            "summary": f"Classified locally as {intent} ({reason}).",
+            "entities": {"people": [], "organizations": [], "dates": [], "locations": []},
+            "suggested_action": "Add to calendar" if intent == EVENT_INTENT else "No action needed",
+            "confidence": round(confidence, 3),
+            "source": f"local:{decided_by}",
+        }
+
+    def learn(self, email: Dict[str, Any], intent: str) -> None:
+        """Feed an LLM label to every stage that can learn."""
+        for stage in self.stages:
+            learn = getattr(stage, "learn", None)
+            if learn is not None:
+                learn(email, intent)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus the escalation rate."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+        total = stats.get("total", 0)
+        stats["escalation_rate"] = round(stats.get("escalated", 0) / total, 3) if total else 0.0
+        stats["enabled"] = PRECLASSIFIER_ENABLED
+        return stats
+
+
+# Process-wide pre-classifier used by email_parser.analyze_emails
+preclassifier = PreClassifier([RuleStage(), NaiveBayesStage()])
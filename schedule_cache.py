@@ -0,0 +1,79 @@
+"""In-process cache of rendered daily schedules.
+
+Entries are keyed by (user, calendar, timezone, local date, calendar mirror
+version). The mirror version changes whenever a sync brings in changed
+events or events are created (calendar_mirror.invalidate), so stale entries
+are never looked up again and simply age out of the LRU. An entry also
+expires when the first listed event ends, since it drops off the
+"rest of today" schedule at that point.
+
+Each entry carries an ETag derived from the rendered text, used for
+conditional GETs on /api/schedule.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from config import SCHEDULE_CACHE_ENTRIES
+
+# (user_id, calendar_id, timezone, local date, mirror version)
+ScheduleKey = Tuple[str, str, str, str, Optional[int]]
+
+
+def etag_for(message: str) -> str:
+    """Strong ETag for a rendered schedule."""
+    return '"' + hashlib.sha256(message.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+class ScheduleCache:
+    """Thread-safe LRU of (message, etag) with a per-entry expiry time."""
+
+    def __init__(self, max_entries: int = SCHEDULE_CACHE_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[ScheduleKey, Tuple[str, str, datetime]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "stores": 0}
+
+    def get(self, key: ScheduleKey, now: datetime) -> Optional[Tuple[str, str]]:
+        """Return (message, etag) for ``key`` unless missing or expired at ``now``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry[2]:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0], entry[1]
+
+    def put(self, key: ScheduleKey, message: str, expires_at: datetime) -> Tuple[str, str]:
+        """Store a rendered schedule valid until ``expires_at``; returns (message, etag)."""
+        etag = etag_for(message)
+        if self.max_entries <= 0:
+            return message, etag
+        with self._lock:
+            self._entries[key] = (message, etag, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.counters["stores"] += 1
+        return message, etag
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
+# Process-wide cache used by daily_plan
+cache = ScheduleCache()
@@ -5,19 +5,28 @@ Jobs:
                          parses with Gemini, creates calendar events.
   - schedule_notifications : Runs every 10 min. Re-reads DB and ensures each
                              user has a daily cron job at their chosen time.
+  - refresh_tokens_job : Runs every TOKEN_REFRESH_INTERVAL_MIN. Refreshes
+                         OAuth tokens that are about to expire and saves them.
+
+Users whose refresh token was rejected (token_manager.needs_reauth) are
+skipped until they sign in again.
 """
 
 import logging
+from itertools import islice
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
-from auth_web import get_user_services
-from calendar_manager import create_event
+import message_store
+import token_manager
+from auth_web import get_user_credentials, get_user_services
+from calendar_manager import EventBatch
+from config import GEMINI_BATCH_MAX_EMAILS, TOKEN_REFRESH_INTERVAL_MIN
 from daily_plan import get_today_schedule
-from email_parser import parse_email_with_gemini
-from gmail_reader import fetch_emails
+from email_parser import OUTPUT_COMPACT, analyze_emails
+from gmail_reader import fetch_emails_iter
 from models import Session, User
 from notifier import send_whatsapp
 
@@ -33,32 +42,67 @@ def process_emails_for_user(user: User) -> None:
     """Fetch emails, parse with Gemini, and create calendar events for one user."""
     logger.info("Processing emails for %s", user.email)
     try:
-        gmail, calendar = get_user_services(user.token_json)
-        emails = fetch_emails(gmail)
-
-        if not emails:
-            logger.info("No new emails for %s", user.email)
-            return
-
-        for email in emails:
-            subject = email.get("subject", "")
-            body    = email.get("body", "")
-
-            parsed = parse_email_with_gemini(body)
-            if not parsed:
-                continue
-
-            intent = parsed.get("intent", "")
-            logger.info("[%s] Email '%s' → intent: %s", user.email, subject, intent)
+        gmail, calendar = get_user_services(user.token_json, user.id)
+
+        # Stream emails and analyse them a batch at a time, so Gemini work
+        # starts while later messages are still being fetched. Emails are
+        # recorded as processed only once analysed and, for events, created;
+        # the rest (over budget, failed) are offered again on the next run.
+        emails = fetch_emails_iter(gmail, user_id=user.id, attachments="none", commit=False)
+        processed = 0
+        created = 0
+        while True:
+            chunk = list(islice(emails, GEMINI_BATCH_MAX_EMAILS))
+            if not chunk:
+                break
+            processed += len(chunk)
+            parsed_list = analyze_emails(chunk, user_id=user.id, output=OUTPUT_COMPACT)
+
+            batch = EventBatch(calendar, user_id=user.id)
+            for idx, (email, parsed) in enumerate(zip(chunk, parsed_list)):
+                if not parsed:
+                    continue
+                subject = email.get("subject", "")
+                body    = email.get("body", "")
+
+                intent = parsed.get("intent", "")
+                logger.info("[%s] Email '%s' → intent: %s", user.email, subject, intent)
+
+                if intent == "Event Scheduling":
+                    batch.add_from_email(
+                        idx, subject, body, message_id=email.get("id"),
+                        start=parsed.get("start"), end=parsed.get("end"),
+                        title=parsed.get("title"),
+                        date_header=email.get("date"), tz_name=user.timezone,
+                    )
 
-            if intent == "Event Scheduling":
-                try:
-                    create_event(calendar, subject, body)
-                except Exception as exc:
+            # One Calendar batch request per chunk
+            failed = set()
+            for idx, result in batch.submit().items():
+                if result["error"]:
+                    failed.add(idx)
                     logger.error(
                         "Failed to create event for '%s' (%s): %s",
-                        subject, user.email, exc,
+                        chunk[idx].get("subject", ""), user.email, result["error"],
                     )
+                elif not result["duplicate"]:
+                    created += 1
+
+            done = [
+                email["id"] for idx, (email, parsed) in enumerate(zip(chunk, parsed_list))
+                if parsed and idx not in failed
+            ]
+            message_store.mark_processed(user.id, done)
+            if len(done) < len(chunk):
+                logger.info(
+                    "Leaving %d email(s) for %s unprocessed for a later run",
+                    len(chunk) - len(done), user.email,
+                )
+
+        if not processed:
+            logger.info("No new emails for %s", user.email)
+        elif created:
+            logger.info("Created %d event(s) for %s", created, user.email)
 
     except Exception as exc:
         logger.error("Error processing emails for %s: %s", user.email, exc)
@@ -70,10 +114,13 @@ def notify_user(user: User) -> None:
     if not user.notify_email:
         logger.warning("No notification email set for %s — skipping notification.", user.email)
         return
+    if token_manager.needs_reauth(user.id):
+        logger.warning("Skipping notification for %s: Google access must be re-granted.", user.email)
+        return
 
     try:
-        _, calendar = get_user_services(user.token_json)
-        schedule = get_today_schedule(calendar)
+        _, calendar = get_user_services(user.token_json, user.id)
+        schedule = get_today_schedule(calendar, user.id, user.timezone)
         send_whatsapp(schedule, to=user.notify_email)
     except Exception as exc:
         logger.error("Error notifying %s: %s", user.email, exc)
@@ -89,14 +136,39 @@ def hourly_email_job() -> None:
     db = Session()
     try:
         users = db.query(User).all()
-        logger.info("Processing emails for %d user(s)", len(users))
+        flagged = token_manager.reauth_user_ids()
+        logger.info("Processing emails for %d user(s)", len(users) - len(flagged & {u.id for u in users}))
         for user in users:
+            if user.id in flagged:
+                logger.info("Skipping %s: Google access must be re-granted.", user.email)
+                continue
             process_emails_for_user(user)
     finally:
         db.close()
     logger.info("=== Hourly email job complete ===")
 
 
+def refresh_tokens_job() -> None:
+    """Refresh access tokens nearing expiry for all users and save them back."""
+    db = Session()
+    try:
+        users = db.query(User).all()
+    finally:
+        db.close()
+    flagged = token_manager.reauth_user_ids()
+
+    items = []
+    for user in users:
+        if user.id in flagged:
+            continue
+        try:
+            items.append((user.id, get_user_credentials(user.token_json, user.id)))
+        except Exception as exc:
+            logger.error("Could not load credentials for %s: %s", user.email, exc)
+    counts = token_manager.refresh_expiring(items)
+    logger.info("Token refresh job: %s", counts)
+
+
 def schedule_notifications() -> None:
     """Re-reads the DB and upserts a daily cron job per user at their chosen time.
 
@@ -147,6 +219,14 @@ def start_scheduler() -> None:
         replace_existing=True,
     )
 
+    # Refresh OAuth tokens before they expire, off the jobs' critical path
+    scheduler.add_job(
+        refresh_tokens_job,
+        IntervalTrigger(minutes=TOKEN_REFRESH_INTERVAL_MIN),
+        id="refresh_tokens_job",
+        replace_existing=True,
+    )
+
     # Refresh per-user notification schedules every 10 minutes
     scheduler.add_job(
         schedule_notifications,
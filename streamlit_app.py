@@ -55,6 +55,24 @@ def _get(path, **params):
     except Exception as e:
         return None, str(e)
 
+def _get_schedule(uid):
+    """Fetch /api/schedule, revalidating the stored copy with its ETag."""
+    headers = {}
+    if st.session_state.get("schedule_etag"):
+        headers["If-None-Match"] = st.session_state["schedule_etag"]
+    try:
+        r = requests.get(f"{API}/api/schedule", params={"user_id": uid}, headers=headers, timeout=15)
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+        st.session_state["schedule"] = r.json().get("schedule", "")
+        st.session_state["schedule_etag"] = r.headers.get("ETag")
+        return None
+    except requests.exceptions.ConnectionError:
+        return "API server is offline. Run `python run.py` first."
+    except Exception as e:
+        return str(e)
+
 def _post(path, payload):
     try:
         r = requests.post(f"{API}{path}", json=payload, timeout=60)
@@ -185,17 +203,13 @@ with t_dash:
     # Today's schedule
     st.subheader("Today's Schedule")
     if st.button("Load / Refresh Schedule"):
-        data, err = _get("/api/schedule", user_id=uid)
+        err = _get_schedule(uid)
         if err:
             st.error(err)
-        else:
-            st.session_state["schedule"] = data.get("schedule", "")
 
     # Auto-load on first visit
     if "schedule" not in st.session_state:
-        data, err = _get("/api/schedule", user_id=uid)
-        if not err:
-            st.session_state["schedule"] = data.get("schedule", "")
+        _get_schedule(uid)
 
     sched = st.session_state.get("schedule", "")
     if sched:
@@ -283,11 +297,9 @@ with t_cal:
     with view_col:
         st.subheader("Today's Events")
         if st.button("Refresh", key="cal_refresh"):
-            data, err = _get("/api/schedule", user_id=uid)
+            err = _get_schedule(uid)
             if err:
                 st.error(err)
-            else:
-                st.session_state["schedule"] = data.get("schedule", "")
 
         sched = st.session_state.get("schedule", "")
         if sched:
@@ -323,9 +335,7 @@ with t_cal:
                     else:
                         st.success(res["message"])
                         # Refresh schedule
-                        data, _ = _get("/api/schedule", user_id=uid)
-                        if data:
-                            st.session_state["schedule"] = data.get("schedule", "")
+                        _get_schedule(uid)
                         st.rerun()
 
 
@@ -0,0 +1,212 @@
+"""Token accounting, daily budgets and prompt compaction for Gemini calls.
+
+Every Gemini call records its input/output tokens and latency in the
+``token_usage`` table. Before prompts are sent, email_parser asks the
+TokenBudget how many tokens the user (GEMINI_USER_DAILY_TOKEN_BUDGET) and
+the whole service (GEMINI_DAILY_TOKEN_BUDGET) may still spend today, and
+drops what does not fit.
+
+compact_body() shrinks oversized email bodies before they are formatted into
+a prompt: header-like lines, sentences with temporal expressions and the
+first/last PROMPT_COMPACT_EDGE_CHARS characters are kept, in original order.
+"""
+
+import logging
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from config import (
+    GEMINI_BODY_MAX_TOKENS,
+    GEMINI_DAILY_TOKEN_BUDGET,
+    GEMINI_USER_DAILY_TOKEN_BUDGET,
+    PROMPT_COMPACT_EDGE_CHARS,
+)
+from message_store import DEFAULT_USER_ID
+from models import Session, TokenUsage
+
+logger = logging.getLogger(__name__)
+
+_HEADER_LINE_RE = re.compile(
+    r"^\s*(?:subject|from|to|cc|date|when|where|time|location|venue|agenda)\s*:",
+    re.IGNORECASE,
+)
+_TEMPORAL_RE = re.compile(
+    r"\b(?:mon|tues?|wed(?:nes)?|thu(?:rs)?|fri|sat(?:ur)?|sun)(?:day)?\b"
+    r"|\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d{1,2}\b"
+    r"|\b\d{1,2}\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b"
+    r"|\b\d{1,2}[/.-]\d{1,2}(?:[/.-]\d{2,4})?\b"
+    r"|\b\d{4}-\d{2}-\d{2}\b"
+    r"|\b\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m\.|p\.m\.)"
+    r"|\b\d{1,2}:\d{2}\b"
+    r"|\b(?:today|tonight|tomorrow|noon|midnight|next\s+(?:week|month)|this\s+(?:week|morning|afternoon|evening))\b",
+    re.IGNORECASE,
+)
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+|\n|$)")
+
+_GAP = "\n[...]\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _day_start(now: datetime) -> datetime:
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def compact_body(body: str, max_tokens: int | None = None, edge_chars: int | None = None) -> str:
+    """Shrink ``body`` to about ``max_tokens`` estimated tokens.
+
+    Bodies already within the limit are returned unchanged. Otherwise the
+    first and last ``edge_chars`` characters, header-like lines and sentences
+    mentioning dates or times are kept; dropped stretches become "[...]".
+    """
+    if max_tokens is None:
+        max_tokens = GEMINI_BODY_MAX_TOKENS
+    if edge_chars is None:
+        edge_chars = PROMPT_COMPACT_EDGE_CHARS
+    if max_tokens <= 0 or estimate_tokens(body) <= max_tokens:
+        return body
+
+    max_chars = max_tokens * 4
+    edge_chars = min(edge_chars, max_chars // 4)
+    head_end = edge_chars
+    tail_start = max(head_end, len(body) - edge_chars)
+
+    # (start, end) spans to keep from the middle section
+    spans: List[Tuple[int, int]] = []
+    budget = max_chars - (head_end + len(body) - tail_start)
+    for match in _SENTENCE_RE.finditer(body, head_end, tail_start):
+        sentence = match.group(0)
+        if not sentence.strip():
+            continue
+        if _HEADER_LINE_RE.match(sentence) or _TEMPORAL_RE.search(sentence):
+            if len(sentence) > budget:
+                break
+            spans.append((match.start(), match.end()))
+            budget -= len(sentence) + len(_GAP)
+
+    pieces = [body[:head_end]]
+    last = head_end
+    for start, end in spans:
+        if start > last:
+            pieces.append(_GAP)
+        pieces.append(body[start:end])
+        last = end
+    if tail_start > last:
+        pieces.append(_GAP)
+    pieces.append(body[tail_start:])
+    return "".join(pieces)
+
+
+class TokenBudget:
+    """Daily per-user and global token budgets backed by the token_usage table."""
+
+    def __init__(
+        self,
+        daily_limit: int = GEMINI_DAILY_TOKEN_BUDGET,
+        user_daily_limit: int = GEMINI_USER_DAILY_TOKEN_BUDGET,
+    ) -> None:
+        self.daily_limit = daily_limit
+        self.user_daily_limit = user_daily_limit
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "rejected_prompts": 0}
+
+    def used_today(self, user_id: str | None = None) -> int:
+        """Tokens spent since UTC midnight by ``user_id``, or by everyone if None."""
+        stmt = select(func.coalesce(func.sum(TokenUsage.input_tokens + TokenUsage.output_tokens), 0)).where(
+            TokenUsage.created_at >= _day_start(_utcnow())
+        )
+        if user_id is not None:
+            stmt = stmt.where(TokenUsage.user_id == user_id)
+        db = Session()
+        try:
+            return int(db.execute(stmt).scalar_one())
+        except Exception as exc:
+            logger.warning("Could not read token usage: %s", exc)
+            return 0
+        finally:
+            db.close()
+
+    def remaining(self, user_id: str | None = None) -> Optional[int]:
+        """Tokens ``user_id`` may still spend today, or None when unlimited."""
+        user_id = user_id or DEFAULT_USER_ID
+        limits = []
+        if self.daily_limit > 0:
+            limits.append(self.daily_limit - self.used_today())
+        if self.user_daily_limit > 0:
+            limits.append(self.user_daily_limit - self.used_today(user_id))
+        if not limits:
+            return None
+        return max(0, min(limits))
+
+    def admit(self, user_id: str | None, costs: List[int]) -> List[bool]:
+        """Decide which of several prompts (by estimated cost) fit today's budget."""
+        remaining = self.remaining(user_id)
+        if remaining is None:
+            return [True] * len(costs)
+        admitted = []
+        for cost in costs:
+            ok = cost <= remaining
+            if ok:
+                remaining -= cost
+            admitted.append(ok)
+        rejected = admitted.count(False)
+        if rejected:
+            with self._lock:
+                self.counters["rejected_prompts"] += rejected
+            logger.warning(
+                "Daily Gemini token budget exhausted for %s: skipping %d prompt(s)",
+                user_id or DEFAULT_USER_ID, rejected,
+            )
+        return admitted
+
+    def record(
+        self,
+        user_id: str | None,
+        model_name: str,
+        call_type: str,
+        input_tokens: int,
+        output_tokens: int,
+        latency_ms: int,
+    ) -> None:
+        """Store the usage of one Gemini call."""
+        with self._lock:
+            self.counters["calls"] += 1
+            self.counters["input_tokens"] += input_tokens
+            self.counters["output_tokens"] += output_tokens
+        db = Session()
+        try:
+            db.add(TokenUsage(
+                user_id=user_id or DEFAULT_USER_ID, model=model_name, call_type=call_type,
+                input_tokens=input_tokens, output_tokens=output_tokens,
+                latency_ms=latency_ms, created_at=_utcnow(),
+            ))
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.warning("Could not record token usage: %s", exc)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """In-process counters plus today's global usage and limits."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self.counters)
+        stats["used_today"] = self.used_today()
+        stats["daily_limit"] = self.daily_limit
+        stats["user_daily_limit"] = self.user_daily_limit
+        return stats
+
+
+# Process-wide budget used by email_parser and gemini_client
+budget = TokenBudget()
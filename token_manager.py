@@ -0,0 +1,213 @@
+"""OAuth access-token refresh with write-back to the users table.
+
+Refreshing a user's credentials (refresh()) saves the new access token and
+expiry back to ``User.token_json``, so later processes start from a valid
+token instead of paying another refresh on the critical path. The
+scheduler's refresh job calls refresh_expiring() to refresh tokens that
+expire within TOKEN_REFRESH_MARGIN_SEC, concurrently, before any job needs
+them.
+
+A refresh failing with ``invalid_grant`` (revoked or expired refresh token)
+flags the user in ``user_auth_state``; jobs skip flagged users until they
+sign in again (clear_reauth()).
+
+API clients refresh credentials by themselves mid-call (an expired token,
+or a retry after 401). Per-user credentials are therefore ManagedCredentials,
+whose refresh() does the same write-back and flagging.
+"""
+
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Set, Tuple
+
+from google.auth.exceptions import RefreshError
+from google.oauth2.credentials import Credentials
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from config import TOKEN_REFRESH_CONCURRENCY, TOKEN_REFRESH_MARGIN_SEC
+from http_transport import auth_request
+from models import Session, User, UserAuthState
+
+logger = logging.getLogger(__name__)
+
+_locks: Dict[str, threading.RLock] = {}
+_locks_guard = threading.Lock()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _lock(user_id: str | None) -> threading.RLock:
+    with _locks_guard:
+        return _locks.setdefault(user_id or "", threading.RLock())
+
+
+def _set_state(user_id: str, **values: Any) -> None:
+    db = Session()
+    try:
+        stmt = insert(UserAuthState).values(user_id=user_id, **values)
+        db.execute(stmt.on_conflict_do_update(index_elements=["user_id"], set_=values))
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not update auth state for %s: %s", user_id, exc)
+    finally:
+        db.close()
+
+
+def is_invalid_grant(exc: Exception) -> bool:
+    """True if a refresh failed because the refresh token is no longer valid."""
+    return isinstance(exc, RefreshError) and "invalid_grant" in str(exc)
+
+
+def expires_within(creds: Any, margin_sec: int) -> bool:
+    """True if ``creds`` has no access token or it expires within ``margin_sec``."""
+    if not creds.token:
+        return True
+    if creds.expiry is None:
+        return False
+    return creds.expiry - _utcnow() < timedelta(seconds=margin_sec)
+
+
+def save_credentials(user_id: str, creds: Any) -> None:
+    """Write refreshed credentials back to ``User.token_json``."""
+    db = Session()
+    try:
+        user = db.get(User, user_id)
+        if user is None:
+            return
+        user.token_json = json.loads(creds.to_json())
+        db.commit()
+    except Exception as exc:
+        db.rollback()
+        logger.warning("Could not save refreshed token for %s: %s", user_id, exc)
+        return
+    finally:
+        db.close()
+    _set_state(user_id, refreshed_at=_utcnow())
+
+
+def flag_reauth(user_id: str, error: str) -> None:
+    """Mark ``user_id`` as needing to sign in again."""
+    logger.warning("OAuth grant for %s is no longer valid; user must sign in again: %s", user_id, error)
+    _set_state(user_id, needs_reauth=True, last_error=error[:500], flagged_at=_utcnow())
+
+
+def clear_reauth(user_id: str) -> None:
+    """Clear the re-consent flag, e.g. after the user signs in again."""
+    _set_state(user_id, needs_reauth=False, last_error=None, flagged_at=None)
+
+
+def reauth_user_ids() -> Set[str]:
+    """IDs of users whose refresh token was rejected."""
+    db = Session()
+    try:
+        return set(db.execute(select(UserAuthState.user_id).where(UserAuthState.needs_reauth.is_(True))).scalars())
+    finally:
+        db.close()
+
+
+def needs_reauth(user_id: str) -> bool:
+    db = Session()
+    try:
+        state = db.get(UserAuthState, user_id)
+        return bool(state is not None and state.needs_reauth)
+    finally:
+        db.close()
+
+
+class ManagedCredentials(Credentials):
+    """OAuth user credentials whose every refresh is saved for ``user_id``.
+
+    Whoever triggers the refresh (refresh() below, or an API client on an
+    expired token or a 401), the new token is written back to
+    ``User.token_json`` and an ``invalid_grant`` flags the user.
+    """
+
+    user_id: str | None = None
+
+    @classmethod
+    def for_user(cls, info: Dict[str, Any], scopes: Any, user_id: str | None) -> "ManagedCredentials":
+        creds = cls.from_authorized_user_info(info, scopes)
+        creds.user_id = user_id
+        return creds
+
+    def refresh(self, request: Any) -> None:
+        with _lock(self.user_id):
+            try:
+                super().refresh(request)
+            except RefreshError as exc:
+                if self.user_id and is_invalid_grant(exc):
+                    flag_reauth(self.user_id, str(exc))
+                raise
+        if self.user_id:
+            save_credentials(self.user_id, self)
+        logger.info("Refreshed OAuth token for %s", self.user_id or "stored credentials")
+
+
+def refresh(creds: Any, user_id: str | None = None, margin_sec: int = 0) -> bool:
+    """Refresh ``creds`` in place if expiring within ``margin_sec`` and save them for ``user_id``.
+
+    Returns True if a refresh happened. Refreshes for one user are
+    serialized, so concurrent callers sharing the credentials refresh once.
+    Raises RefreshError on failure, after flagging the user on invalid_grant.
+    """
+    with _lock(user_id):
+        if not expires_within(creds, margin_sec):
+            return False
+        if isinstance(creds, ManagedCredentials) and creds.user_id == user_id:
+            creds.refresh(auth_request())
+            return True
+        try:
+            creds.refresh(auth_request())
+        except RefreshError as exc:
+            if user_id and is_invalid_grant(exc):
+                flag_reauth(user_id, str(exc))
+            raise
+    if user_id:
+        save_credentials(user_id, creds)
+    logger.info("Refreshed OAuth token for %s", user_id or "stored credentials")
+    return True
+
+
+def refresh_expiring(
+    items: Iterable[Tuple[str, Any]],
+    margin_sec: int | None = None,
+    concurrency: int | None = None,
+) -> Dict[str, int]:
+    """Refresh every (user_id, credentials) pair expiring within ``margin_sec``.
+
+    Refreshes run concurrently (``concurrency`` threads, default
+    TOKEN_REFRESH_CONCURRENCY). Returns counts of checked, refreshed,
+    failed and flagged users.
+    """
+    if margin_sec is None:
+        margin_sec = TOKEN_REFRESH_MARGIN_SEC
+    if concurrency is None:
+        concurrency = TOKEN_REFRESH_CONCURRENCY
+    items = list(items)
+    due = [(user_id, creds) for user_id, creds in items if creds.refresh_token and expires_within(creds, margin_sec)]
+    counts = {"checked": len(items), "refreshed": 0, "failed": 0, "flagged": 0}
+    if not due:
+        return counts
+
+    def run(item: Tuple[str, Any]) -> str:
+        user_id, creds = item
+        try:
+            return "refreshed" if refresh(creds, user_id, margin_sec) else "skipped"
+        except Exception as exc:
+            if is_invalid_grant(exc):
+                return "flagged"
+            logger.error("Token refresh failed for %s: %s", user_id, exc)
+            return "failed"
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(due)))) as pool:
+        for outcome in pool.map(run, due):
+            if outcome in counts:
+                counts[outcome] += 1
+    return counts
@@ -0,0 +1,100 @@
+"""Cheap header-based filters applied before downloading full Gmail messages.
+
+fetch_emails_iter first fetches candidates with ``format="metadata"`` (only the
+Subject/From/To/Date headers and the size estimate). It then asks TriageRules
+which ones are worth downloading in full and sending to Gemini.
+"""
+
+import logging
+import re
+from email.utils import parseaddr
+from typing import Dict, Iterable, List, Optional
+
+from config import (
+    TRIAGE_MAX_MESSAGE_BYTES,
+    TRIAGE_SENDER_ALLOW,
+    TRIAGE_SENDER_DENY,
+    TRIAGE_SUBJECT_DENY,
+)
+
+logger = logging.getLogger(__name__)
+
+# Headers requested in the metadata phase
+METADATA_HEADERS = ["Subject", "From", "To", "Date"]
+
+
+def _split_list(value: str) -> List[str]:
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+
+def _sender_matches(address: str, patterns: Iterable[str]) -> bool:
+    """True if ``address`` equals a pattern, or its domain matches ``@domain``/``domain``."""
+    domain = address.rpartition("@")[2]
+    for pattern in patterns:
+        if "@" in pattern and not pattern.startswith("@"):
+            if address == pattern:
+                return True
+        else:
+            pattern_domain = pattern.lstrip("@")
+            if domain == pattern_domain or domain.endswith("." + pattern_domain):
+                return True
+    return False
+
+
+class TriageRules:
+    """Sender allow/deny lists, subject deny patterns and a size limit.
+
+    Sender entries are full addresses (``alice@example.com``) or domains
+    (``example.com`` / ``@example.com``, subdomains included). A non-empty
+    allow list lets only matching senders through. The deny list and subject
+    patterns reject matches. ``max_size_bytes`` of 0 disables the size check.
+    """
+
+    def __init__(
+        self,
+        sender_allow: Iterable[str] = (),
+        sender_deny: Iterable[str] = (),
+        subject_deny: Iterable[str] = (),
+        max_size_bytes: int = 0,
+    ) -> None:
+        self.sender_allow = [s.lower() for s in sender_allow]
+        self.sender_deny = [s.lower() for s in sender_deny]
+        self.subject_deny = [re.compile(p, re.IGNORECASE) for p in subject_deny]
+        self.max_size_bytes = max_size_bytes
+
+    @classmethod
+    def from_config(cls) -> "TriageRules":
+        """Build rules from the TRIAGE_* settings in config."""
+        return cls(
+            sender_allow=_split_list(TRIAGE_SENDER_ALLOW),
+            sender_deny=_split_list(TRIAGE_SENDER_DENY),
+            subject_deny=[TRIAGE_SUBJECT_DENY] if TRIAGE_SUBJECT_DENY else [],
+            max_size_bytes=TRIAGE_MAX_MESSAGE_BYTES,
+        )
+
+    @property
+    def active(self) -> bool:
+        """Whether any rule is configured; if not, the metadata phase is skipped."""
+        return bool(self.sender_allow or self.sender_deny or self.subject_deny or self.max_size_bytes)
+
+    def reject_reason(self, headers: Dict[str, str], size_estimate: int = 0) -> Optional[str]:
+        """Return why a message should be skipped, or None to keep it.
+
+        ``headers`` maps lower-cased header names (subject, from, ...) to values.
+        """
+        sender = parseaddr(headers.get("from", ""))[1].lower()
+
+        if self.sender_allow and not _sender_matches(sender, self.sender_allow):
+            return "sender not in allow list"
+        if self.sender_deny and _sender_matches(sender, self.sender_deny):
+            return "sender in deny list"
+
+        subject = headers.get("subject", "")
+        for pattern in self.subject_deny:
+            if pattern.search(subject):
+                return f"subject matches {pattern.pattern!r}"
+
+        if self.max_size_bytes and size_estimate > self.max_size_bytes:
+            return f"size {size_estimate} exceeds {self.max_size_bytes} bytes"
+
+        return None
@@ -2,24 +2,32 @@
 
 import json
 import logging
+from datetime import date
+from itertools import islice
 from typing import Optional
 
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import RedirectResponse, JSONResponse
-from googleapiclient.discovery import build
+from fastapi.responses import RedirectResponse, JSONResponse, Response
 from pydantic import BaseModel
 
+import token_manager
+from analysis_cache import cache as analysis_cache
+from api_fields import OAUTH2_USERINFO, fields
 from auth_web import create_auth_flow, get_user_services
-from calendar_manager import create_event
+from calendar_manager import EventBatch, create_event
 from config import (
     CALENDAR_ID, DEFAULT_EVENT_DURATION_MIN,
     GMAIL_MAX_RESULTS, GMAIL_QUERY, TIMEZONE,
 )
-from daily_plan import get_today_schedule
-from email_parser import parse_email_with_gemini
+from daily_plan import get_today_schedule, iter_agenda, render_agenda, render_today_schedule
+from email_parser import analyze_emails
 from gmail_reader import fetch_emails
+from google_clients import build_service, clients as google_clients
 from models import Session, User
 from notifier import send_whatsapp
+from preclassifier import preclassifier
+from schedule_cache import cache as schedule_cache
+from token_budget import budget as token_budget
 
 logger = logging.getLogger(__name__)
 
@@ -57,8 +65,8 @@ def oauth_callback(request: Request):
     creds = flow.credentials
 
     # Fetch the user's Google profile info
-    profile_svc = build("oauth2", "v2", credentials=creds)
-    info = profile_svc.userinfo().get().execute()
+    profile_svc = build_service("oauth2", "v2", creds)
+    info = profile_svc.userinfo().get(**fields(OAUTH2_USERINFO)).execute()
     user_id    = info["id"]
     user_email = info["email"]
 
@@ -76,6 +84,7 @@ def oauth_callback(request: Request):
         db.commit()
     finally:
         db.close()
+    token_manager.clear_reauth(user_id)
 
     return JSONResponse({
         "message": f"✅ Signed up successfully as {user_email}!",
@@ -137,6 +146,17 @@ def api_config():
     }
 
 
+@app.get("/api/stats", summary="Cache and pipeline counters")
+def api_stats():
+    return {
+        "analysis_cache": analysis_cache.stats(),
+        "preclassifier":  preclassifier.stats(),
+        "token_budget":   token_budget.stats(),
+        "schedule_cache": schedule_cache.stats(),
+        "google_clients": google_clients.stats(),
+    }
+
+
 # ---------------------------------------------------------------------------
 # Status route
 # ---------------------------------------------------------------------------
@@ -196,39 +216,51 @@ def run_assistant(req: RunAssistantRequest):
         db.close()
 
     try:
-        gmail, calendar = get_user_services(user.token_json)
+        gmail, calendar = get_user_services(user.token_json, user.id)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Auth failed: {exc}")
 
-    emails = fetch_emails(gmail, query=req.gmail_query, max_results=req.max_results)
-    events_created = 0
+    emails = fetch_emails(
+        gmail, query=req.gmail_query, max_results=req.max_results,
+        user_id=user.id, attachments="none",
+    )
     details = []
 
-    for email in emails:
+    parsed_list = analyze_emails(emails, user_id=user.id)
+
+    batch = EventBatch(calendar, user_id=user.id)
+    for idx, (email, parsed) in enumerate(zip(emails, parsed_list)):
         subject = email.get("subject", "")
         body    = email.get("body", "")
-        parsed  = parse_email_with_gemini(body)
         intent  = parsed.get("intent", "")  if parsed else ""
         summary = parsed.get("summary", "") if parsed else ""
-        created = False
 
         if intent == "Event Scheduling":
-            try:
-                create_event(calendar, subject, body)
-                events_created += 1
-                created = True
-            except Exception:
-                pass
+            batch.add_from_email(
+                idx, subject, body, message_id=email.get("id"),
+                date_header=email.get("date"), tz_name=user.timezone,
+            )
 
         details.append({
             "subject":       subject,
             "intent":        intent,
             "summary":       summary,
-            "event_created": created,
+            "event_created": False,
+            "event_id":      None,
         })
 
+    results = batch.submit()
+    for idx, result in results.items():
+        details[idx]["event_created"] = result["error"] is None and not result["duplicate"]
+        details[idx]["event_id"]      = result["id"]
+        if result["duplicate"]:
+            details[idx]["event_duplicate"] = True
+        if result["error"]:
+            details[idx]["event_error"] = result["error"]
+    events_created = sum(1 for d in details if d["event_created"])
+
     if req.send_email and user.notify_email:
-        schedule = get_today_schedule(calendar)
+        schedule = get_today_schedule(calendar, user.id, user.timezone)
         send_whatsapp(schedule, to=user.notify_email)
 
     return {
@@ -254,15 +286,15 @@ def api_fetch_emails(req: FetchEmailsRequest):
         db.close()
 
     try:
-        gmail, _ = get_user_services(user.token_json)
+        gmail, _ = get_user_services(user.token_json, user.id)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Auth failed: {exc}")
 
-    emails = fetch_emails(gmail, query=req.query, max_results=req.max_results)
+    emails = fetch_emails(gmail, query=req.query, max_results=req.max_results, user_id=user.id)
+    parsed_list = analyze_emails(emails, user_id=user.id)
     result = []
-    for email in emails:
+    for email, parsed in zip(emails, parsed_list):
         body   = email.get("body", "")
-        parsed = parse_email_with_gemini(body)
         result.append({
             "subject":          email.get("subject", ""),
             "from_":            email.get("from_", ""),
@@ -280,8 +312,48 @@ def api_fetch_emails(req: FetchEmailsRequest):
 # Today's schedule
 # ---------------------------------------------------------------------------
 
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
 @app.get("/api/schedule")
-def api_schedule(user_id: str = Query(...)):
+def api_schedule(request: Request, user_id: str = Query(...)):
+    db = Session()
+    try:
+        user = db.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found.")
+    finally:
+        db.close()
+
+    try:
+        _, calendar = get_user_services(user.token_json, user.id)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Auth failed: {exc}")
+
+    schedule, etag = render_today_schedule(calendar, user.id, user.timezone)
+    if etag is None:
+        return {"schedule": schedule}
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({"schedule": schedule}, headers=headers)
+
+
+@app.get("/api/agenda", summary="Events for a range of local days")
+def api_agenda(
+    user_id: str = Query(...),
+    start: Optional[date] = Query(None, description="First local day (YYYY-MM-DD); defaults to today"),
+    days: int = Query(7, ge=1, le=62),
+    q: Optional[str] = Query(None, description="Only events whose title contains this text"),
+    include_all_day: bool = Query(True),
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: int = Query(0, ge=0, description="next_cursor from the previous page"),
+):
     db = Session()
     try:
         user = db.get(User, user_id)
@@ -291,11 +363,24 @@ def api_schedule(user_id: str = Query(...)):
         db.close()
 
     try:
-        _, calendar = get_user_services(user.token_json)
+        _, calendar = get_user_services(user.token_json, user.id)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Auth failed: {exc}")
 
-    return {"schedule": get_today_schedule(calendar)}
+    records = iter_agenda(
+        calendar, start, days, user.id, user.timezone, query=q, include_all_day=include_all_day,
+    )
+    try:
+        page = list(islice(records, cursor, cursor + limit + 1))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=502, detail=str(exc))
+    more = len(page) > limit
+    page = page[:limit]
+    return {
+        "events":      page,
+        "text":        render_agenda(page),
+        "next_cursor": cursor + limit if more else None,
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -313,12 +398,13 @@ def api_create_event(req: CreateEventRequest):
         db.close()
 
     try:
-        _, calendar = get_user_services(user.token_json)
+        _, calendar = get_user_services(user.token_json, user.id)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Auth failed: {exc}")
 
-    try:
-        create_event(calendar, req.subject, req.description)
-        return {"message": f"Event '{req.subject}' created successfully."}
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Failed to create event: {exc}")
+    result = create_event(calendar, req.subject, req.description, user_id=user.id, tz_name=user.timezone)
+    if result is None:
+        raise HTTPException(status_code=422, detail="Could not create event: no date found.")
+    if result["error"]:
+        raise HTTPException(status_code=502, detail=f"Calendar insert failed: {result['error']}")
+    return {"message": f"Event '{req.subject}' created successfully.", "event_id": result["id"]}